@@ -1,8 +1,246 @@
+import argparse
+import base64
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 import requests
+from requests.structures import CaseInsensitiveDict
 
 SERVER_URL = "http://localhost:5000"
 JSON = "application/json"
 MASON = "application/vnd.mason+json"
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "workoutplanner-client")
+
+#  Schema properties that can be autocompleted and the kind of names they take
+AUTOCOMPLETE_FIELDS = {
+    "move_name": "moves",
+    "move_creator": "users",
+}
+
+class CachingSession(requests.Session):
+    """
+    Requests session with a private HTTP cache kept on disk, so it survives
+    restarts of the client. GET responses are stored with their validators
+    (ETag, Last-Modified) and revalidated with If-None-Match/If-Modified-Since,
+    an unchanged resource then costs a 304 without a body. Cache-Control
+    no-store, no-cache and max-age are respected. A successful write drops
+    the cached copy of the target and of the Location it returns.
+
+    Can be used anywhere a requests session is expected:
+
+        with CachingSession() as s:
+            body = get_body(s, "/api/users/")
+
+    Responses served from the cache have the attribute from_cache set to True.
+    """
+
+    def __init__(self, cache_dir=CACHE_DIR):
+        super().__init__()
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def request(self, method, url, params=None, headers=None, **kwargs):
+        url = requests.Request(method, url, params=params).prepare().url
+        if method.upper() != "GET":
+            resp = super().request(method, url, headers=headers, **kwargs)
+            if resp.ok:
+                self.invalidate(url)
+                if "Location" in resp.headers:
+                    self.invalidate(requests.compat.urljoin(url, resp.headers["Location"]))
+            return resp
+
+        headers = dict(headers or {})
+        key = self._key(url, headers.get("Accept", self.headers.get("Accept", "")))
+        entry = self._load(key)
+        if entry is not None:
+            if entry["expires"] > time.time():
+                return self._cached_response(entry)
+            if entry["etag"]:
+                headers["If-None-Match"] = entry["etag"]
+            if entry["last_modified"]:
+                headers["If-Modified-Since"] = entry["last_modified"]
+
+        resp = super().request(method, url, headers=headers, **kwargs)
+        if resp.status_code == 304 and entry is not None:
+            #  The 304 carries the current validators and caching directives
+            entry["headers"].update(resp.headers)
+            self._store(key, entry["url"], entry["headers"], base64.b64decode(entry["content"]))
+            return self._cached_response(entry)
+        if resp.status_code == 200:
+            self._store(key, url, resp.headers, resp.content)
+        return resp
+
+    def invalidate(self, url):
+        """
+        Drops the cached copies of a URL
+        """
+        for accept in ("", MASON, JSON, self.headers.get("Accept", "")):
+            try:
+                os.remove(self._path(self._key(url, accept)))
+            except FileNotFoundError:
+                pass
+
+    def clear(self):
+        """
+        Empties the cache
+        """
+        for name in os.listdir(self.cache_dir):
+            if name.endswith(".json"):
+                os.remove(os.path.join(self.cache_dir, name))
+
+    def _key(self, url, accept):
+        return hashlib.sha256(f"{accept} {url}".encode()).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key + ".json")
+
+    def _load(self, key):
+        try:
+            with open(self._path(key)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _store(self, key, url, headers, content):
+        directives = parse_cache_control(headers.get("Cache-Control", ""))
+        if "no-store" in directives:
+            if os.path.exists(self._path(key)):
+                os.remove(self._path(key))
+            return
+        max_age = 0
+        if "no-cache" not in directives:
+            try:
+                max_age = int(directives.get("max-age", 0))
+            except ValueError:
+                max_age = 0
+        etag = headers.get("ETag")
+        last_modified = headers.get("Last-Modified")
+        if not etag and not last_modified and max_age <= 0:
+            #  Nothing to revalidate with and never fresh, storing it would not help
+            return
+        entry = {
+            "url": url,
+            "etag": etag,
+            "last_modified": last_modified,
+            "expires": time.time() + max_age,
+            "headers": dict(headers),
+            "content": base64.b64encode(content).decode("ascii"),
+        }
+        #  Written to a temporary file first so a crash never leaves half an entry,
+        #  the name is unique per thread as prefetching stores from several threads
+        tmp = f"{self._path(key)}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(entry, f)
+        os.replace(tmp, self._path(key))
+
+    def _cached_response(self, entry):
+        resp = requests.Response()
+        resp.status_code = 200
+        resp.reason = "OK"
+        resp.url = entry["url"]
+        resp.headers = CaseInsensitiveDict(entry["headers"])
+        resp._content = base64.b64decode(entry["content"])
+        resp.encoding = requests.utils.get_encoding_from_headers(resp.headers)
+        resp.from_cache = True
+        return resp
+
+
+class Prefetcher(object):
+    """
+    Fetches the items of a collection in the background, so following one
+    of them does not wait for the network. Bodies are fetched with a bounded
+    thread pool through the given session and kept in a small LRU of
+    futures, a lookup of an item that is still being fetched waits for it.
+
+        with Prefetcher(s) as prefetcher:
+            prefetcher.prefetch(["/api/users/testuser/"])
+            body = prefetcher.get("/api/users/testuser/")
+    """
+
+    def __init__(self, session, workers=4, size=64):
+        self.session = session
+        self.size = size
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+        self._futures = OrderedDict()
+        self._lock = threading.Lock()
+
+    def prefetch(self, hrefs):
+        """
+        Start fetching the hrefs that are not cached yet, at most size of them
+        """
+        with self._lock:
+            for href in hrefs[:self.size]:
+                if href in self._futures:
+                    self._futures.move_to_end(href)
+                    continue
+                self._futures[href] = self._executor.submit(self._fetch, href)
+                if len(self._futures) > self.size:
+                    _, evicted = self._futures.popitem(last=False)
+                    evicted.cancel()
+
+    def get(self, href):
+        """
+        Body of a prefetched href, None if it was not prefetched or the request failed
+        """
+        with self._lock:
+            future = self._futures.get(href)
+            if future is not None:
+                self._futures.move_to_end(href)
+        if future is None or future.cancelled():
+            return None
+        return future.result()
+
+    def clear(self):
+        """
+        Forget prefetched bodies, e.g. after a write made them stale
+        """
+        with self._lock:
+            for future in self._futures.values():
+                future.cancel()
+            self._futures.clear()
+
+    def close(self):
+        self.clear()
+        self._executor.shutdown(wait=False)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _fetch(self, href):
+        #  Failures are left for the foreground request to report
+        try:
+            resp = self.session.get(SERVER_URL + href)
+        except requests.RequestException:
+            return None
+        if not resp.ok:
+            return None
+        return resp.json()
+
+
+def parse_cache_control(value):
+    """
+    Parse a Cache-Control header
+
+        Parameters:
+            value (str): Header value
+        
+        Returns:
+            directives (dict): Directive names in lower case and their values, None if a directive has no value
+    """
+
+    directives = {}
+    for part in value.split(","):
+        name, _, argument = part.strip().partition("=")
+        if name:
+            directives[name.lower()] = argument.strip('"') if argument else None
+    return directives
 
 def check_response(resp):
     """
@@ -66,7 +304,7 @@ def post_item(s, control):
     }
 
     schema = control["schema"]
-    properties = fill_schema(schema) 
+    properties = fill_schema(schema, s) 
     resp = s.post(SERVER_URL + href, json=properties, headers=headers)
 
     if not check_response(resp):
@@ -95,8 +333,10 @@ def put_item(s, control):
         'Accept':'application/json'
     }
 
+    if "description" in control:
+        print(control["description"])
     schema = control["schema"]
-    properties = fill_schema(schema)
+    properties = fill_schema(schema, s)
     resp = s.put(SERVER_URL + href, json=properties, headers=headers)
 
     if not check_response(resp):
@@ -127,12 +367,31 @@ def delete_item(s, control, next_href):
 
 
 
-def fill_schema(json):
+def get_suggestions(s, kind, prefix):
+    """
+    Get names starting with the prefix from the autocomplete resource
+
+        Parameters:
+            s (requests session): Current session
+            kind (str): users, moves or workouts
+            prefix (str): Beginning of the name
+        
+        Returns:
+            suggestions ([str]): Labels of the matching names
+    """
+
+    resp = s.get(SERVER_URL + f"/api/autocomplete/{kind}/", params={"prefix": prefix})
+    if not check_response(resp):
+        return []
+    return get_items(resp.json()["items"])
+
+def fill_schema(json, s=None):
     """
     Fill fields in inputed JSON schema
 
         Parameters:
             json (dict): recieved JSON schema
+            s (requests session): Current session, enables autocompleting names
         
         Returns:
             filled_schema (dict): Schema filled with user inputed data
@@ -151,21 +410,27 @@ def fill_schema(json):
         #if json["properties"][p]["type"] == "object":
         #    properties[p] = fill_schema(json["properties"][p])
         #    continue
-        input_property = get_input(f"{'*' if req else ''} {p} ({type.__name__}): ", type, req)
+        suggest = None
+        if s is not None and p in AUTOCOMPLETE_FIELDS:
+            kind = AUTOCOMPLETE_FIELDS[p]
+            suggest = lambda prefix: get_suggestions(s, kind, prefix)
+        input_property = get_input(f"{'*' if req else ''} {p} ({type.__name__}{', end with ? for suggestions' if suggest else ''}): ", type, req, suggest)
         if input_property:
             filled_schema.update({p: input_property})
             properties[p] = input_property
 
     return filled_schema
 
-def get_input(prompt, valueType, required):
+def get_input(prompt, valueType, required, suggest=None):
     """
-    Prompt user for response
+    Prompt user for response. If suggest is given, an input ending with a
+    question mark lists the suggestions for the text before it.
 
         Parameters:
             prompt (str): Text shown to user
             valueType (Type): Wanted input type
             required (Bool): Is the input mandatory
+            suggest (function): Returns suggestions for a prefix
         
         Returns:
             user_input (valueType): Input from user
@@ -174,6 +439,10 @@ def get_input(prompt, valueType, required):
     while True:
         try:
             user_input = input(prompt)
+            if suggest is not None and user_input.endswith("?"):
+                for suggestion in suggest(user_input[:-1]):
+                    print("", suggestion)
+                continue
             if not required and user_input == "":
                 return None
             elif required and user_input == "":
@@ -261,12 +530,18 @@ def get_items(items):
 
     return item_labels
 
-def main():
+def main(argv=None):
     """
     Logic for simple hypermedia client
     """
 
-    s = requests.Session()
+    parser = argparse.ArgumentParser(description="Hypermedia client for the workout planner API")
+    parser.add_argument("--prefetch", action="store_true", help="fetch the items of collections in the background")
+    parser.add_argument("--workers", type=int, default=4, help="amount of concurrent prefetch requests")
+    args = parser.parse_args(argv)
+
+    s = CachingSession()
+    prefetcher = Prefetcher(s, args.workers) if args.prefetch else None
 
     #with requests.Session() as s:
     s.headers.update({"Accept": "application/vnd.mason+json"})
@@ -281,7 +556,9 @@ def main():
     
     command = 0
     while True:
-        body = get_body(s, current_href)
+        body = prefetcher.get(current_href) if prefetcher else None
+        if body is None:
+            body = get_body(s, current_href)
         print()
         print("----------------------------------")
         print(f"Current URI: {current_href}")
@@ -312,6 +589,11 @@ def main():
             items_count = len(item_names)
             for i in range(items_count):
                 print("",i + controls_count + 1, item_names[i])
+            if prefetcher:
+                prefetcher.prefetch([
+                    item["@controls"]["self"]["href"] for item in body["items"]
+                    if "self" in item.get("@controls", {})
+                ])
 
         while True:
             try:
@@ -326,11 +608,15 @@ def main():
 
 
         if command == -1:
+            if prefetcher:
+                prefetcher.close()
             s.close()
             return 0    
         if command < controls_count:
             if "method" in body["@controls"][control_keys[command]]:
                 method = body["@controls"][control_keys[command]]["method"]
+                if prefetcher and method != "GET":
+                    prefetcher.clear()
 
                 if method == "POST":
                     current_href = post_item(s, body["@controls"][control_keys[command]])
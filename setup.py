@@ -14,5 +14,9 @@ setup(
         "jsonschema",
         "flasgger",
         "pyyaml"
-    ]
+    ],
+    extras_require={
+        "sdk": ["aiohttp"],
+        "analytics": ["numpy"]
+    }
 )
\ No newline at end of file
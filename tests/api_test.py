@@ -473,3 +473,1152 @@ class TestMoveListItemCollection(object):
         valid["type"] = "jedi mind trick training regime"
         resp = client.post(self.RESOURCE_URL, json=valid)
         assert resp.status_code == 400
+
+class TestMoveSearch(object):
+
+    RESOURCE_URL = "/api/moves/"
+    USER_URL = "/api/users/testuser1/moves/"
+
+    def test_search(self, client):
+        resp = client.get(self.RESOURCE_URL + "?q=testmove3")
+        assert resp.status_code == 200
+        response_body = json.loads(resp.data)
+        assert len(response_body["items"]) == 1
+        assert response_body["items"][0]["name"] == "testmove3"
+        _check_control_get_method("self", client, response_body["items"][0])
+
+        # prefixes of words in the description match as well
+        resp = client.get(self.RESOURCE_URL + "?q=descr")
+        response_body = json.loads(resp.data)
+        assert len(response_body["items"]) == 4
+
+        # the index follows edits of the moves
+        client.put("/api/users/testuser1/moves/testmove1/", json=_get_move_json("burpee", "jump up and down"))
+        resp = client.get(self.RESOURCE_URL + "?q=burpee")
+        response_body = json.loads(resp.data)
+        assert [item["name"] for item in response_body["items"]] == ["burpee"]
+        resp = client.get(self.RESOURCE_URL + "?q=testmove1")
+        assert len(json.loads(resp.data)["items"]) == 0
+
+        # search restricted to a single user
+        resp = client.get(self.USER_URL + "?q=description")
+        response_body = json.loads(resp.data)
+        assert len(response_body["items"]) == 0
+        resp = client.get(self.USER_URL + "?q=jump")
+        response_body = json.loads(resp.data)
+        assert len(response_body["items"]) == 1
+
+        # query without any words
+        resp = client.get(self.RESOURCE_URL + "?q=*")
+        assert resp.status_code == 400
+
+    def test_pagination(self, client):
+        resp = client.get(self.RESOURCE_URL + "?q=test&limit=3")
+        response_body = json.loads(resp.data)
+        assert len(response_body["items"]) == 3
+        assert "prev" not in response_body["@controls"]
+        resp = client.get(response_body["@controls"]["next"]["href"])
+        response_body = json.loads(resp.data)
+        assert len(response_body["items"]) == 1
+        assert "next" not in response_body["@controls"]
+        _check_control_get_method("prev", client, response_body)
+
+        resp = client.get(self.RESOURCE_URL + "?q=test&limit=0")
+        assert resp.status_code == 400
+
+class TestAutocomplete(object):
+
+    RESOURCE_URL = "/api/autocomplete/"
+
+    def test_get(self, client):
+        resp = client.get(self.RESOURCE_URL + "moves/?prefix=TESTM&limit=2")
+        assert resp.status_code == 200
+        response_body = json.loads(resp.data)
+        assert [item["name"] for item in response_body["items"]] == ["testmove1", "testmove2"]
+        for item in response_body["items"]:
+            _check_control_get_method("self", client, item)
+
+        # the indexes follow the writes
+        client.post("/api/users/", json=_get_user_json("another"))
+        client.post("/api/users/another/workouts/", json=_get_workout_json("testplan"))
+        client.put("/api/users/testuser1/", json=_get_user_json("renamed"))
+        resp = client.get(self.RESOURCE_URL + "users/?prefix=")
+        response_body = json.loads(resp.data)
+        assert [item["name"] for item in response_body["items"]] == ["another", "renamed", "testuser2", "testuser3", "testuser4"]
+        resp = client.get(self.RESOURCE_URL + "workouts/?prefix=testw")
+        response_body = json.loads(resp.data)
+        assert len(response_body["items"]) == 4
+        assert response_body["items"][0]["user"] == "renamed"
+        for item in response_body["items"]:
+            _check_control_get_method("self", client, item)
+
+        resp = client.get(self.RESOURCE_URL + "moves/?prefix=x")
+        assert json.loads(resp.data)["items"] == []
+        resp = client.get(self.RESOURCE_URL + "jedis/?prefix=x")
+        assert resp.status_code == 404
+        resp = client.get(self.RESOURCE_URL + "moves/?limit=none")
+        assert resp.status_code == 400
+
+    def test_unchanged_names(self, app, client, monkeypatch):
+        autocomplete = app.extensions["autocomplete"]
+        applied = []
+        apply = autocomplete.apply
+        monkeypatch.setattr(autocomplete, "apply", lambda changes: applied.extend(changes) or apply(changes))
+
+        # a move list write touches the plan but keeps its name
+        client.get(self.RESOURCE_URL + "workouts/?prefix=")
+        workout = "/api/users/testuser1/workouts/testworkout1/"
+        client.post(workout + "moves/", json=_get_movelistitem_json("testmove2", "testuser2", 5, 1))
+        assert [change for change in applied if change[0] == "workouts"] == []
+
+        client.put(workout, json=_get_workout_json("renamed"))
+        assert [change[2] for change in applied if change[0] == "workouts"] == ["renamed"]
+        resp = client.get(self.RESOURCE_URL + "workouts/?prefix=renamed")
+        assert len(json.loads(resp.data)["items"]) == 1
+
+class TestCollectionFilters(object):
+
+    def test_users(self, client):
+        resp = client.get("/api/users/?sort=-username&limit=2")
+        assert resp.status_code == 200
+        response_body = json.loads(resp.data)
+        assert [item["username"] for item in response_body["items"]] == ["testuser4", "testuser3"]
+        resp = client.get(response_body["@controls"]["next"]["href"])
+        response_body = json.loads(resp.data)
+        assert [item["username"] for item in response_body["items"]] == ["testuser2", "testuser1"]
+        assert "next" not in response_body["@controls"]
+
+        resp = client.get("/api/users/?name_prefix=testuser3")
+        assert len(json.loads(resp.data)["items"]) == 1
+
+    def test_prefix_of_largest_code_point(self, client):
+        largest = chr(0x10FFFF)
+        client.post("/api/users/", json=_get_user_json("a" + largest + "z"))
+        client.post("/api/users/", json=_get_user_json("b"))
+        for prefix, expected in (("a" + largest, ["a" + largest + "z"]), (largest, []), ("a" + largest * 2, [])):
+            resp = client.get("/api/users/", query_string={"name_prefix": prefix})
+            assert resp.status_code == 200
+            assert [item["username"] for item in json.loads(resp.data)["items"]] == expected
+
+    def test_moves(self, client):
+        resp = client.get("/api/moves/?creator=testuser2")
+        response_body = json.loads(resp.data)
+        assert [item["name"] for item in response_body["items"]] == ["testmove2"]
+        resp = client.get("/api/moves/?sort=-creator&name_prefix=testm")
+        response_body = json.loads(resp.data)
+        assert [item["name"] for item in response_body["items"]] == ["testmove4", "testmove3", "testmove2", "testmove1"]
+        resp = client.get("/api/users/testuser1/moves/?creator=testuser2")
+        assert json.loads(resp.data)["items"] == []
+
+    def test_workouts(self, client):
+        resp = client.get("/api/workouts/?sort=name&name_prefix=testworkout&offset=3")
+        response_body = json.loads(resp.data)
+        assert [item["name"] for item in response_body["items"]] == ["testworkout4"]
+        _check_control_get_method("prev", client, response_body)
+
+    def test_invalid(self, client):
+        resp = client.get("/api/users/?sort=password")
+        assert resp.status_code == 400
+        resp = client.get("/api/moves/?creator_id=1")
+        assert resp.status_code == 400
+        resp = client.get("/api/workouts/?offset=-1")
+        assert resp.status_code == 400
+
+class TestWorkoutClone(object):
+
+    RESOURCE_URL = "/api/users/testuser2/workouts/"
+    SOURCE_URL = "/api/users/testuser1/workouts/testworkout1/"
+
+    def test_post(self, client):
+        client.post(self.SOURCE_URL + "moves/", json=_get_movelistitem_json("testmove2", "testuser2", 5, 1))
+        response_body = json.loads(client.get(self.RESOURCE_URL).data)
+        _check_control_post_method("workoutplanner:clone-workout", client, response_body, {"name": "copy", "source": self.SOURCE_URL})
+
+        resp = client.get(self.RESOURCE_URL + "copy/moves/")
+        response_body = json.loads(resp.data)
+        assert [item["move"] for item in response_body["items"]] == ["testmove1", "testmove2"]
+        resp = client.get(self.RESOURCE_URL + "copy/moves/1/")
+        assert json.loads(resp.data)["repetitions"] == 5
+
+        # the short URI of the plan works as a source as well
+        resp = client.post(self.RESOURCE_URL, json={"name": "copy2", "source": "/api/workouts/testworkout1/"})
+        assert resp.status_code == 201
+        assert resp.headers["Location"].endswith(self.RESOURCE_URL + "copy2/")
+
+        # the name is taken
+        resp = client.post(self.RESOURCE_URL, json={"name": "copy", "source": self.SOURCE_URL})
+        assert resp.status_code == 409
+        # the source is not a workout
+        resp = client.post(self.RESOURCE_URL, json={"name": "copy3", "source": "/api/users/testuser1/"})
+        assert resp.status_code == 404
+        resp = client.post(self.RESOURCE_URL, json={"name": "copy3", "source": self.SOURCE_URL, "type": "jedi"})
+        assert resp.status_code == 400
+
+class TestMoveListOrder(object):
+
+    RESOURCE_URL = "/api/users/testuser1/workouts/testworkout1/moves/order/"
+    COLLECTION_URL = "/api/users/testuser1/workouts/testworkout1/moves/"
+
+    def _moves(self, client):
+        response_body = json.loads(client.get(self.COLLECTION_URL).data)
+        return [item["move"] for item in response_body["items"]]
+
+    def test_put(self, client):
+        for i in range(2, 5):
+            client.post(self.COLLECTION_URL, json=_get_movelistitem_json(f"testmove{i}", f"testuser{i}", 1, 10))
+        assert self._moves(client) == ["testmove1", "testmove2", "testmove3", "testmove4"]
+
+        response_body = json.loads(client.get(self.COLLECTION_URL).data)
+        ctrl = response_body["@controls"]["workoutplanner:reorder-movelist"]
+        assert ctrl["href"] == self.RESOURCE_URL
+        validate({"order": [3, 2, 1, 0]}, ctrl["schema"])
+
+        resp = client.put(self.RESOURCE_URL, json={"order": [3, 2, 1, 0]})
+        assert resp.status_code == 200
+        assert self._moves(client) == ["testmove4", "testmove3", "testmove2", "testmove1"]
+
+        resp = client.put(self.RESOURCE_URL, json={"moves": [{"from": 0, "to": 3}, {"from": 0, "to": 1}]})
+        assert resp.status_code == 200
+        assert self._moves(client) == ["testmove2", "testmove3", "testmove1", "testmove4"]
+        resp = client.get(self.COLLECTION_URL + "3/")
+        assert json.loads(resp.data)["move"] == "testmove4"
+
+        # not a permutation of the positions
+        resp = client.put(self.RESOURCE_URL, json={"order": [0, 0, 1, 2]})
+        assert resp.status_code == 400
+        resp = client.put(self.RESOURCE_URL, json={"moves": [{"from": 0, "to": 4}]})
+        assert resp.status_code == 400
+        resp = client.put(self.RESOURCE_URL, json={"order": [0, 1, 2, 3], "moves": []})
+        assert resp.status_code == 400
+        resp = client.put(self.RESOURCE_URL, data="order")
+        assert resp.status_code == 415
+        assert self._moves(client) == ["testmove2", "testmove3", "testmove1", "testmove4"]
+
+class TestWorkoutPatch(object):
+
+    RESOURCE_URL = "/api/users/testuser1/workouts/testworkout1/"
+
+    def _patch(self, client, operations, url=None):
+        return client.patch(
+            url or self.RESOURCE_URL,
+            data=json.dumps(operations),
+            content_type="application/json-patch+json"
+        )
+
+    def test_resolves_entries_once(self, client, monkeypatch):
+        import workoutplanner.resources.workout_plan as workout_plan
+        calls = []
+        resolve = workout_plan._resolve_entry
+        monkeypatch.setattr(workout_plan, "_resolve_entry", lambda entry, plan: calls.append(entry) or resolve(entry, plan))
+        resp = self._patch(client, [
+            {"op": "replace", "path": "/moves/0/repetitions", "value": 7},
+            {"op": "add", "path": "/moves/-", "value": {"move_name": "testmove2", "move_creator": "testuser2"}},
+        ])
+        assert resp.status_code == 200
+        assert len(calls) == 2
+
+    def test_patch(self, client):
+        resp = client.get(self.RESOURCE_URL)
+        assert resp.headers["Accept-Patch"] == "application/json-patch+json"
+        response_body = json.loads(resp.data)
+        assert response_body["@controls"]["workoutplanner:patch"]["method"] == "PATCH"
+
+        resp = self._patch(client, [
+            {"op": "test", "path": "/moves/0/move_name", "value": "testmove1"},
+            {"op": "replace", "path": "/name", "value": "patched"},
+            {"op": "add", "path": "/moves/-", "value": {"move_name": "testmove2", "move_creator": "testuser2", "repetitions": 3}},
+            {"op": "add", "path": "/moves/0", "value": {"move_name": "testmove3", "move_creator": "testuser3"}},
+            {"op": "copy", "from": "/moves/1", "path": "/moves/-"},
+            {"op": "replace", "path": "/moves/1/repetitions", "value": 99},
+            {"op": "move", "from": "/moves/2", "path": "/moves/0"},
+            {"op": "remove", "path": "/moves/1"},
+        ])
+        assert resp.status_code == 200
+        assert resp.headers["Location"].endswith("/api/users/testuser1/workouts/patched/")
+        resp = client.get("/api/users/testuser1/workouts/patched/moves/")
+        response_body = json.loads(resp.data)
+        assert [item["move"] for item in response_body["items"]] == ["testmove2", "testmove1", "testmove1"]
+        assert [item["position"] for item in response_body["items"]] == [0, 1, 2]
+        resp = client.get("/api/users/testuser1/workouts/patched/moves/1/")
+        assert json.loads(resp.data)["repetitions"] == 99
+        resp = client.get("/api/users/testuser1/workouts/patched/moves/2/")
+        assert json.loads(resp.data)["repetitions"] == 10
+
+    def test_invalid(self, client):
+        # the whole patch fails if a single operation fails
+        resp = self._patch(client, [
+            {"op": "replace", "path": "/name", "value": "patched"},
+            {"op": "remove", "path": "/moves/5"},
+        ])
+        assert resp.status_code == 422
+        resp = self._patch(client, [{"op": "test", "path": "/name", "value": "other"}])
+        assert resp.status_code == 409
+        resp = self._patch(client, [{"op": "add", "path": "/moves/0", "value": {"move_name": "testmove1", "move_creator": "testuser2"}}])
+        assert resp.status_code == 404
+        resp = self._patch(client, [{"op": "jump", "path": "/name"}])
+        assert resp.status_code == 400
+        for index in ("00", "01"):
+            resp = self._patch(client, [{"op": "replace", "path": f"/moves/{index}/repetitions", "value": 1}])
+            assert resp.status_code == 422
+        resp = client.patch(self.RESOURCE_URL, json=[])
+        assert resp.status_code == 415
+        resp = client.get(self.RESOURCE_URL + "moves/")
+        assert len(json.loads(resp.data)["items"]) == 1
+
+class TestUserDelete(object):
+
+    RESOURCE_URL = "/api/users/testuser1/"
+
+    def test_delete(self, client):
+        other_plan = "/api/users/testuser2/workouts/testworkout2/moves/"
+        client.post(other_plan, json=_get_movelistitem_json("testmove1", "testuser1", 1, 0))
+        client.get("/api/autocomplete/moves/?prefix=test")
+
+        response_body = json.loads(client.get(self.RESOURCE_URL).data)
+        _check_control_delete_method("workoutplanner:delete", client, response_body)
+
+        assert client.get(self.RESOURCE_URL).status_code == 404
+        assert client.get(self.RESOURCE_URL + "moves/testmove1/").status_code == 404
+        assert client.get(self.RESOURCE_URL + "workouts/testworkout1/").status_code == 404
+        assert len(json.loads(client.get("/api/users/").data)["items"]) == 3
+        assert len(json.loads(client.get("/api/workouts/").data)["items"]) == 3
+
+        # the move is removed from the plans of other users and the positions are compacted
+        response_body = json.loads(client.get(other_plan).data)
+        assert [(item["position"], item["move"]) for item in response_body["items"]] == [(0, "testmove2")]
+
+        # the search and autocomplete indexes follow the cascade
+        assert json.loads(client.get("/api/moves/?q=testmove1").data)["items"] == []
+        response_body = json.loads(client.get("/api/autocomplete/moves/?prefix=test").data)
+        assert [item["name"] for item in response_body["items"]] == ["testmove2", "testmove3", "testmove4"]
+
+        resp = client.delete(self.RESOURCE_URL)
+        assert resp.status_code == 404
+
+class TestRateLimit(object):
+
+    def test_limits(self):
+        db_fd, db_fname = tempfile.mkstemp()
+        app = create_app({
+            "SQLALCHEMY_DATABASE_URI": "sqlite:///" + db_fname,
+            "TESTING": True,
+            "RATELIMIT_READ_RATE": 0.01,
+            "RATELIMIT_READ_BURST": 3,
+            "RATELIMIT_WRITE_RATE": 0.01,
+            "RATELIMIT_WRITE_BURST": 1,
+        })
+        with app.app_context():
+            db.create_all()
+            _populate_db()
+        client = app.test_client()
+
+        for i in range(3):
+            assert client.get("/api/users/testuser1/moves/").status_code == 200
+        resp = client.get("/api/users/testuser1/")
+        assert resp.status_code == 429
+        assert int(resp.headers["Retry-After"]) > 0
+        assert json.loads(resp.data)["@error"]["@message"] == "Too many requests"
+
+        # other users in the path and writes have their own budgets
+        assert client.get("/api/users/testuser2/").status_code == 200
+        assert client.post("/api/users/testuser2/moves/", json=_get_move_json()).status_code == 201
+        assert client.post("/api/users/testuser2/moves/", json=_get_move_json("other")).status_code == 429
+        assert client.post("/api/users/testuser3/moves/", json=_get_move_json()).status_code == 201
+
+        os.close(db_fd)
+        os.unlink(db_fname)
+
+
+class TestConcurrencyControl(object):
+
+    RESOURCE_URL = "/api/users/testuser1/workouts/testworkout1/"
+
+    def test_if_match(self, client):
+        resp = client.get(self.RESOURCE_URL)
+        etag = resp.headers["ETag"]
+        assert etag
+
+        resp = client.put(self.RESOURCE_URL, json=_get_workout_json("renamed"), headers={"If-Match": etag})
+        assert resp.status_code == 200
+        url = resp.headers["Location"]
+        new_etag = client.get(url).headers["ETag"]
+        assert new_etag != etag
+
+        # a write with the old version is rejected and changes nothing
+        resp = client.put(url, json=_get_workout_json("other"), headers={"If-Match": etag})
+        assert resp.status_code == 412
+        resp = client.delete(url, headers={"If-Match": etag})
+        assert resp.status_code == 412
+        assert client.get(url).status_code == 200
+
+        # changing the move list changes the version of the workout
+        resp = client.post(url + "moves/", json=_get_movelistitem_json("testmove1", "testuser1"))
+        assert resp.status_code == 201
+        assert client.get(url).headers["ETag"] != new_etag
+
+        resp = client.get(url + "moves/0/")
+        item_etag = resp.headers["ETag"]
+        resp = client.delete(url + "moves/0/", headers={"If-Match": '"other"'})
+        assert resp.status_code == 412
+        resp = client.delete(url + "moves/0/", headers={"If-Match": item_etag})
+        assert resp.status_code == 200
+
+        resp = client.get("/api/users/testuser1/")
+        resp = client.delete("/api/users/testuser1/", headers={"If-Match": resp.headers["ETag"]})
+        assert resp.status_code == 200
+
+
+class TestConditionalGet(object):
+
+    def test_collection_not_modified(self, client):
+        resp = client.get("/api/users/")
+        assert resp.headers["Cache-Control"] == "no-cache"
+        etag = resp.headers["ETag"]
+
+        resp = client.get("/api/users/", headers={"If-None-Match": etag})
+        assert resp.status_code == 304
+        assert resp.data == b""
+
+        resp = client.post("/api/users/", json=_get_user_json("newuser"))
+        assert resp.status_code == 201
+        resp = client.get("/api/users/", headers={"If-None-Match": etag})
+        assert resp.status_code == 200
+        assert resp.headers["ETag"] != etag
+
+    def test_item_not_modified(self, client):
+        resp = client.get("/api/users/testuser1/moves/testmove1/")
+        resp = client.get("/api/users/testuser1/moves/testmove1/", headers={"If-None-Match": resp.headers["ETag"]})
+        assert resp.status_code == 304
+
+    def test_item_derived_fields(self, client):
+        move_url = "/api/users/testuser1/moves/testmove1/"
+        etag = client.get(move_url).headers["ETag"]
+        client.post("/api/users/testuser2/workouts/testworkout2/moves/", json=_get_movelistitem_json("testmove1", "testuser1"))
+        resp = client.get(move_url, headers={"If-None-Match": etag})
+        assert resp.status_code == 200
+        assert json.loads(resp.data)["workout_count"] == 2
+
+        # the username is in the body and the URIs, but renaming does not bump the workout's version
+        etag = client.get("/api/users/testuser1/workouts/testworkout1/").headers["ETag"]
+        assert client.put("/api/users/testuser1/", json=_get_user_json("renamed")).status_code == 200
+        resp = client.get("/api/users/renamed/workouts/testworkout1/", headers={"If-None-Match": etag})
+        assert resp.status_code == 200
+
+        # If-Match still only compares the version
+        resp = client.put("/api/users/renamed/workouts/testworkout1/", json=_get_workout_json("changed"), headers={"If-Match": etag})
+        assert resp.status_code == 200
+        resp = client.put("/api/users/renamed/workouts/changed/", json=_get_workout_json("again"), headers={"If-Match": etag})
+        assert resp.status_code == 412
+
+
+class TestDocGeneration(object):
+
+    def test_generate_docs(self):
+        from workoutplanner.yamler import generate_docs, DOC_FILES
+        doc_root = tempfile.mkdtemp()
+        assert generate_docs(doc_root) == [path for _, path in DOC_FILES]
+        assert generate_docs(doc_root) == []
+        with open(os.path.join(doc_root, "users/get_item.yml")) as f:
+            assert "username: Noob" in f.read()
+
+
+class TestTrafficReplay(object):
+
+    def test_record_and_replay(self):
+        from workoutplanner import traffic
+        db_fd, db_fname = tempfile.mkstemp()
+        trace_fd, trace_fname = tempfile.mkstemp()
+        app = create_app({
+            "SQLALCHEMY_DATABASE_URI": "sqlite:///" + db_fname,
+            "TESTING": True,
+            "TRAFFIC_RECORD_PATH": trace_fname,
+            "TRAFFIC_REDACT_FIELDS": ("description",),
+        })
+        with app.app_context():
+            db.create_all()
+        client = app.test_client()
+        assert client.post("/api/users/", json=_get_user_json("recorded")).status_code == 201
+        assert client.post("/api/users/recorded/moves/", json=_get_move_json("secret", "hidden")).status_code == 201
+        assert client.get("/api/users/recorded/moves/?limit=5").status_code == 200
+        assert client.get("/api/users/missing/").status_code == 404
+
+        records = traffic.read_trace(trace_fname)
+        assert [r["method"] for r in records] == ["POST", "POST", "GET", "GET"]
+        assert records[1]["body"] == {"name": "secret", "description": traffic.REDACTED}
+        assert records[2]["path"] == "/api/users/recorded/moves/?limit=5"
+        assert records[3]["rule"] == "/api/users/<user>/"
+
+        replay_fd, replay_fname = tempfile.mkstemp()
+        replay_app = create_app({"SQLALCHEMY_DATABASE_URI": "sqlite:///" + replay_fname, "TESTING": True})
+        with replay_app.app_context():
+            db.create_all()
+        results = traffic.replay(records, traffic.app_sender(replay_app), speed=0, workers=1)
+        report = traffic.summarize(results)
+        assert report["total"]["count"] == 4
+        assert report["total"]["status_mismatches"] == 0
+        assert report["GET /api/users/<user>/"]["count"] == 1
+        changes = traffic.compare(report, report)
+        assert changes["total"]["p99"] == 0
+
+        for fd, fname in ((db_fd, db_fname), (trace_fd, trace_fname), (replay_fd, replay_fname)):
+            os.close(fd)
+            os.unlink(fname)
+
+
+class TestCounters(object):
+
+    RESOURCE_URL = "/api/users/testuser1/workouts/testworkout1/"
+
+    def _counts(self, client):
+        plan = json.loads(client.get(self.RESOURCE_URL).data)
+        move = json.loads(client.get("/api/users/testuser1/moves/testmove1/").data)
+        return plan["move_count"], move["workout_count"]
+
+    def test_counts(self, app, client):
+        from workoutplanner.models import repair_counts
+        assert self._counts(client) == (1, 1)
+
+        # a move is counted once per workout
+        resp = client.post(self.RESOURCE_URL + "moves/", json=_get_movelistitem_json("testmove1", "testuser1"))
+        assert resp.status_code == 201
+        assert self._counts(client) == (2, 1)
+
+        resp = client.post("/api/users/testuser1/workouts/", json={"name": "copy", "source": self.RESOURCE_URL})
+        assert resp.status_code == 201
+        assert self._counts(client) == (2, 2)
+        resp = client.get("/api/users/testuser1/workouts/")
+        items = {item["name"]: item for item in json.loads(resp.data)["items"]}
+        assert items["copy"]["move_count"] == 2
+
+        assert client.delete(self.RESOURCE_URL + "moves/0/").status_code == 200
+        assert self._counts(client) == (1, 2)
+        assert client.delete(self.RESOURCE_URL).status_code == 200
+        resp = client.get("/api/users/testuser1/moves/testmove1/")
+        assert json.loads(resp.data)["workout_count"] == 1
+
+        with app.app_context():
+            Move.query.filter_by(name="testmove1").update({"workout_count": 42})
+            db.session.commit()
+            repair_counts()
+        resp = client.get("/api/users/testuser1/moves/testmove1/")
+        assert json.loads(resp.data)["workout_count"] == 1
+
+
+class TestStats(object):
+
+    USER_URL = "/api/users/testuser1/"
+    RESOURCE_URL = "/api/users/testuser1/workouts/testworkout1/"
+
+    def test_stats(self, app, client):
+        from workoutplanner.models import rebuild_stats
+        response_body = json.loads(client.get(self.RESOURCE_URL).data)
+        assert response_body["@controls"]["workoutplanner:stats"]["href"] == self.RESOURCE_URL + "stats/"
+
+        client.post(self.RESOURCE_URL + "moves/", json=_get_movelistitem_json("testmove1", "testuser1", 5))
+        client.post(self.RESOURCE_URL + "moves/", json=_get_movelistitem_json("testmove2", "testuser2", 3))
+        client.post("/api/users/testuser1/workouts/", json={"name": "copy", "source": self.RESOURCE_URL})
+        client.post("/api/users/testuser1/workouts/", json=_get_workout_json("empty"))
+
+        resp = client.get(self.RESOURCE_URL + "stats/")
+        assert resp.status_code == 200
+        body = json.loads(resp.data)
+        assert (body["length"], body["total_repetitions"], body["distinct_moves"]) == (3, 18, 2)
+        assert [(item["name"], item["uses"], item["repetitions"]) for item in body["items"]] == [
+            ("testmove1", 2, 15), ("testmove2", 1, 3)
+        ]
+        assert len(json.loads(client.get(self.RESOURCE_URL + "stats/?limit=1").data)["items"]) == 1
+        assert client.get(self.RESOURCE_URL + "stats/?limit=x").status_code == 400
+
+        def user_stats():
+            body = json.loads(client.get(self.USER_URL + "stats/").data)
+            return body["workouts"], body["total_repetitions"], body["distinct_moves"], body["length_distribution"]
+
+        expected = (3, 36, 2, [{"length": 0, "workouts": 1}, {"length": 3, "workouts": 2}])
+        assert user_stats() == expected
+        with app.app_context():
+            rebuild_stats()
+        assert user_stats() == expected
+
+        # deleting an item, a move and a workout update the statistics
+        client.delete(self.RESOURCE_URL + "moves/0/")
+        assert user_stats() == (3, 33, 2, [
+            {"length": 0, "workouts": 1}, {"length": 2, "workouts": 1}, {"length": 3, "workouts": 1}
+        ])
+        client.delete("/api/users/testuser2/")
+        assert user_stats() == (3, 30, 1, [{"length": 0, "workouts": 1}, {"length": 2, "workouts": 2}])
+        client.delete("/api/users/testuser1/workouts/copy/")
+        assert user_stats() == (2, 15, 1, [{"length": 0, "workouts": 1}, {"length": 2, "workouts": 1}])
+        assert client.get("/api/users/testuser2/stats/").status_code == 404
+
+
+class TestPopularMoves(object):
+
+    RESOURCE_URL = "/api/moves/popular/"
+
+    def test_get(self, client):
+        workout_url = "/api/users/testuser1/workouts/testworkout1/moves/"
+        client.post(workout_url, json=_get_movelistitem_json("testmove3", "testuser3"))
+        client.post(workout_url, json=_get_movelistitem_json("testmove3", "testuser3"))
+        client.post(workout_url, json=_get_movelistitem_json("testmove2", "testuser2"))
+
+        resp = client.get(self.RESOURCE_URL)
+        assert resp.status_code == 200
+        body = json.loads(resp.data)
+        assert [(item["name"], item["uses"]) for item in body["items"]][:2] == [("testmove3", 3), ("testmove2", 2)]
+        assert body["items"][0]["@controls"]["self"]["href"] == "/api/users/testuser3/moves/testmove3/"
+
+        body = json.loads(client.get(self.RESOURCE_URL + "?limit=1").data)
+        assert len(body["items"]) == 1
+        assert client.get(self.RESOURCE_URL + "?limit=0").status_code == 400
+
+        # removing items and moves updates the ranking
+        client.delete("/api/users/testuser3/")
+        body = json.loads(client.get(self.RESOURCE_URL).data)
+        assert body["items"][0]["name"] == "testmove2"
+        assert "testmove3" not in [item["name"] for item in body["items"]]
+
+    def test_reserved_name(self, client):
+        # a move named popular would be shadowed by the popular moves
+        resp = client.post("/api/users/testuser1/moves/", json=_get_move_json("popular"))
+        assert resp.status_code == 400
+        resp = client.put("/api/users/testuser1/moves/testmove1/", json=_get_move_json("popular"))
+        assert resp.status_code == 400
+        resp = client.post("/api/users/testuser1/moves/", json=_get_move_json("Popular"))
+        assert resp.status_code == 201
+
+
+class TestMoveWorkouts(object):
+
+    RESOURCE_URL = "/api/users/testuser1/moves/testmove1/workouts/"
+
+    def test_get(self, client):
+        client.post("/api/users/testuser1/workouts/testworkout1/moves/", json=_get_movelistitem_json("testmove1", "testuser1"))
+        client.post("/api/users/testuser2/workouts/testworkout2/moves/", json=_get_movelistitem_json("testmove1", "testuser1"))
+
+        body = json.loads(client.get("/api/users/testuser1/moves/testmove1/").data)
+        assert body["@controls"]["workoutplanner:workouts-using"]["href"] == self.RESOURCE_URL
+        assert body["@controls"]["edit"]["description"] == "Changing this move changes 2 workouts using it"
+
+        resp = client.get(self.RESOURCE_URL)
+        assert resp.status_code == 200
+        body = json.loads(resp.data)
+        assert [(item["name"], item["user"], item["occurrences"]) for item in body["items"]] == [
+            ("testworkout1", "testuser1", 2), ("testworkout2", "testuser2", 1)
+        ]
+        assert body["items"][1]["@controls"]["self"]["href"] == "/api/users/testuser2/workouts/testworkout2/"
+
+        body = json.loads(client.get(self.RESOURCE_URL + "?sort=occurrences&limit=1").data)
+        assert [item["name"] for item in body["items"]] == ["testworkout2"]
+        assert "next" in body["@controls"]
+        body = json.loads(client.get(self.RESOURCE_URL + "?creator=testuser1").data)
+        assert [item["name"] for item in body["items"]] == ["testworkout1"]
+
+        assert client.get(self.RESOURCE_URL + "?sort=uses").status_code == 400
+        assert client.get("/api/users/testuser1/moves/testmove2/workouts/").status_code == 404
+        body = json.loads(client.get("/api/users/testuser4/moves/testmove4/").data)
+        assert body["@controls"]["edit"]["description"] == "Changing this move changes 1 workout using it"
+        client.delete("/api/users/testuser4/workouts/testworkout4/")
+        assert json.loads(client.get("/api/users/testuser4/moves/testmove4/workouts/").data)["items"] == []
+        body = json.loads(client.get("/api/users/testuser4/moves/testmove4/").data)
+        assert "description" not in body["@controls"]["edit"]
+
+
+class TestWorkoutSearch(object):
+
+    RESOURCE_URL = "/api/workouts/search/"
+    MOVE1 = "/api/users/testuser1/moves/testmove1/"
+    MOVE2 = "/api/users/testuser2/moves/testmove2/"
+    MOVE3 = "/api/users/testuser3/moves/testmove3/"
+
+    def _search(self, client, query):
+        resp = client.get(self.RESOURCE_URL + "?" + query)
+        assert resp.status_code == 200
+        return json.loads(resp.data)
+
+    def test_get(self, client):
+        client.post("/api/users/testuser2/workouts/testworkout2/moves/", json=_get_movelistitem_json("testmove1", "testuser1"))
+        client.post("/api/users/testuser3/workouts/testworkout3/moves/", json=_get_movelistitem_json("testmove1", "testuser1"))
+        client.post("/api/users/testuser3/workouts/testworkout3/moves/", json=_get_movelistitem_json("testmove2", "testuser2"))
+
+        body = json.loads(client.get("/api/workouts/").data)
+        assert body["@controls"]["workoutplanner:search-workouts"]["href"] == self.RESOURCE_URL + "?include={move}"
+
+        body = self._search(client, f"include={self.MOVE1}")
+        assert [(item["name"], item["overlap"]) for item in body["items"]] == [
+            ("testworkout1", 1), ("testworkout2", 1), ("testworkout3", 1)
+        ]
+        assert body["total"] == 3
+        assert body["items"][0]["@controls"]["self"]["href"] == "/api/users/testuser1/workouts/testworkout1/"
+
+        body = self._search(client, f"include={self.MOVE1}&include={self.MOVE2}")
+        assert [(item["name"], item["overlap"]) for item in body["items"]] == [("testworkout2", 2), ("testworkout3", 2)]
+        body = self._search(client, f"include={self.MOVE1}&include={self.MOVE2}&match=any")
+        assert [(item["name"], item["overlap"]) for item in body["items"]] == [
+            ("testworkout2", 2), ("testworkout3", 2), ("testworkout1", 1)
+        ]
+        body = self._search(client, f"include={self.MOVE1}&include={self.MOVE2}&exclude={self.MOVE3}&match=any")
+        assert [item["name"] for item in body["items"]] == ["testworkout2", "testworkout1"]
+        body = self._search(client, f"include={self.MOVE3}&include={self.MOVE2}&exclude={self.MOVE1}")
+        assert body["items"] == []
+
+        body = self._search(client, f"include={self.MOVE1}&include={self.MOVE2}&match=any&limit=2")
+        assert body["total"] == 3 and len(body["items"]) == 2
+        body = self._search(client, body["@controls"]["next"]["href"].split("?", 1)[1])
+        assert [item["name"] for item in body["items"]] == ["testworkout1"]
+        assert "next" not in body["@controls"]
+
+    def test_repeated_move(self, client):
+        # a move used many times in a workout counts once towards the overlap
+        for _ in range(2):
+            client.post("/api/users/testuser1/workouts/testworkout1/moves/", json=_get_movelistitem_json("testmove1", "testuser1"))
+        body = self._search(client, f"include={self.MOVE1}&include={self.MOVE2}")
+        assert body["items"] == [] and body["total"] == 0
+        body = self._search(client, f"include={self.MOVE1}&include={self.MOVE2}&match=any")
+        assert [(item["name"], item["overlap"]) for item in body["items"]] == [("testworkout1", 1), ("testworkout2", 1)]
+        body = self._search(client, f"include={self.MOVE1}&offset=5")
+        assert body["items"] == [] and body["total"] == 1
+
+    def test_errors(self, client):
+        assert client.get(self.RESOURCE_URL).status_code == 400
+        assert client.get(self.RESOURCE_URL + f"?include={self.MOVE1}&match=some").status_code == 400
+        assert client.get(self.RESOURCE_URL + f"?include={self.MOVE1}&sort=name").status_code == 400
+        assert client.get(self.RESOURCE_URL + "?include=/api/users/testuser1/").status_code == 404
+        assert client.get(self.RESOURCE_URL + "?include=/api/users/testuser1/moves/nomove/").status_code == 404
+
+    def test_reserved_name(self, client):
+        # a workout named search would be shadowed by the search
+        workouts = "/api/users/testuser1/workouts/"
+        assert client.post(workouts, json=_get_workout_json("search")).status_code == 400
+        clone = {"name": "search", "source": workouts + "testworkout1/"}
+        assert client.post(workouts, json=clone).status_code == 400
+        assert client.put(workouts + "testworkout1/", json=_get_workout_json("search")).status_code == 400
+        resp = client.patch(
+            workouts + "testworkout1/",
+            data=json.dumps([{"op": "replace", "path": "/name", "value": "search"}]),
+            content_type="application/json-patch+json"
+        )
+        assert resp.status_code == 422
+
+
+class TestContentHash(object):
+
+    RESOURCE_URL = "/api/users/testuser1/workouts/testworkout1/"
+
+    def _identical(self, client, url=RESOURCE_URL):
+        resp = client.get(url + "identical/")
+        assert resp.status_code == 200
+        return [(item["user"], item["name"]) for item in json.loads(resp.data)["items"]]
+
+    def _hashes(self, app):
+        with app.app_context():
+            return {plan.name: plan.content_hash for plan in WorkoutPlan.query.all()}
+
+    def test_identical(self, app, client):
+        from workoutplanner.models import repair_counts
+        body = json.loads(client.get(self.RESOURCE_URL).data)
+        assert body["@controls"]["workoutplanner:identical"]["href"] == self.RESOURCE_URL + "identical/"
+        assert self._identical(client) == []
+
+        resp = client.post("/api/users/testuser2/workouts/", json={"name": "copy", "source": self.RESOURCE_URL})
+        assert resp.status_code == 201
+        assert self._identical(client) == [("testuser2", "copy")]
+
+        # the order, the moves and the repetitions all count
+        copy_url = "/api/users/testuser2/workouts/copy/"
+        client.post(copy_url + "moves/", json=_get_movelistitem_json("testmove2", "testuser2", position=99))
+        client.post(self.RESOURCE_URL + "moves/", json=_get_movelistitem_json("testmove2", "testuser2", position=0))
+        assert self._identical(client) == []
+        assert client.delete(self.RESOURCE_URL + "moves/0/").status_code == 200
+        client.post(self.RESOURCE_URL + "moves/", json=_get_movelistitem_json("testmove2", "testuser2", position=99))
+        assert self._identical(client) == [("testuser2", "copy")]
+        assert self._identical(client, copy_url) == [("testuser1", "testworkout1")]
+        client.post(copy_url + "moves/", json=_get_movelistitem_json("testmove2", "testuser2", reps=5, position=99))
+        client.post(self.RESOURCE_URL + "moves/", json=_get_movelistitem_json("testmove2", "testuser2", reps=6, position=99))
+        assert self._identical(client) == []
+
+        hashes = self._hashes(app)
+        with app.app_context():
+            repair_counts()
+        assert self._hashes(app) == hashes
+
+        assert client.get("/api/users/testuser1/workouts/nothing/identical/").status_code == 404
+
+    def test_dedupe_clone(self, client):
+        clone = {"name": "copy", "source": self.RESOURCE_URL, "dedupe": True}
+        resp = client.post("/api/users/testuser1/workouts/", json=clone)
+        assert resp.status_code == 303
+        assert resp.headers["Location"] == self.RESOURCE_URL
+
+        assert client.post("/api/users/testuser2/workouts/", json=clone).status_code == 201
+        resp = client.post("/api/users/testuser2/workouts/", json=dict(clone, name="another"))
+        assert resp.status_code == 303
+        assert resp.headers["Location"] == "/api/users/testuser2/workouts/copy/"
+        assert client.post("/api/users/testuser2/workouts/", json=dict(clone, name="another", dedupe=False)).status_code == 201
+
+    def test_hash_collision(self, app, client):
+        # a plan with another move list but the same hash and length is not identical
+        with app.app_context():
+            db.session.execute(db.text(
+                "UPDATE workout_plan SET content_hash = (SELECT content_hash FROM workout_plan WHERE name = 'testworkout1') "
+                "WHERE name = 'testworkout2'"
+            ))
+            db.session.commit()
+        assert self._hashes(app)["testworkout1"] == self._hashes(app)["testworkout2"]
+        assert self._identical(client) == []
+        clone = {"name": "copy", "source": self.RESOURCE_URL, "dedupe": True}
+        assert client.post("/api/users/testuser2/workouts/", json=clone).status_code == 201
+        assert self._identical(client) == [("testuser2", "copy")]
+
+
+class TestWorkoutDiff(object):
+
+    RESOURCE_URL = "/api/workouts/diff/"
+    WORKOUT = "/api/users/testuser1/workouts/testworkout1/"
+    COPY = "/api/users/testuser1/workouts/copy/"
+
+    def _diff(self, client, source, target):
+        resp = client.get(self.RESOURCE_URL, query_string={"from": source, "to": target})
+        assert resp.status_code == 200
+        assert resp.mimetype == "application/vnd.mason+json"
+        return json.loads(resp.data)
+
+    def test_diff_move_lists(self):
+        from workoutplanner.resources.diff import diff_move_lists
+        items = lambda moves: [(position, move, reps, f"/m/{move}") for position, (move, reps) in enumerate(moves)]
+        assert diff_move_lists(items([(1, 5), (2, 5), (3, 5)]), items([(3, 5), (1, 5), (2, 6)])) == [
+            {"op": "move", "from": 2, "to": 0, "move": "/m/3", "repetitions": 5},
+            {"op": "repetitions", "from": 1, "to": 2, "move": "/m/2", "old": 5, "new": 6},
+        ]
+        assert diff_move_lists(items([(1, 1), (2, 2)]), items([(2, 3), (4, 4)])) == [
+            {"op": "delete", "from": 0, "move": "/m/1", "repetitions": 1},
+            {"op": "repetitions", "from": 1, "to": 0, "move": "/m/2", "old": 2, "new": 3},
+            {"op": "insert", "to": 1, "move": "/m/4", "repetitions": 4},
+        ]
+        assert diff_move_lists(items([(1, 1)]), items([(1, 1)])) == []
+
+    def test_get(self, client):
+        client.post(self.WORKOUT + "moves/", json=_get_movelistitem_json("testmove2", "testuser2", position=99))
+        client.post("/api/users/testuser1/workouts/", json={"name": "copy", "source": self.WORKOUT})
+        body = json.loads(client.get(self.WORKOUT).data)
+        assert body["@controls"]["workoutplanner:diff"]["isHrefTemplate"]
+        assert self._diff(client, self.WORKOUT, self.COPY)["items"] == []
+
+        # [testmove1, testmove2] -> [testmove2, testmove1, testmove3]
+        assert client.delete(self.COPY + "moves/0/").status_code == 200
+        client.post(self.COPY + "moves/", json=_get_movelistitem_json("testmove1", "testuser1", reps=10, position=99))
+        client.post(self.COPY + "moves/", json=_get_movelistitem_json("testmove3", "testuser3", reps=3, position=99))
+        body = self._diff(client, self.WORKOUT, self.COPY)
+        assert body["from"] == self.WORKOUT and body["to"] == self.COPY
+        assert body["@controls"]["workoutplanner:diff-to"]["href"] == self.COPY
+        assert sorted(item["op"] for item in body["items"]) == ["insert", "move"]
+        assert {"op": "insert", "to": 2, "move": "/api/users/testuser3/moves/testmove3/", "repetitions": 3} in body["items"]
+
+        reverse = self._diff(client, self.COPY, self.WORKOUT)["items"]
+        assert sorted(item["op"] for item in reverse) == ["delete", "move"]
+
+    def test_errors(self, client):
+        assert client.get(self.RESOURCE_URL, query_string={"from": self.WORKOUT}).status_code == 400
+        query = {"from": self.WORKOUT, "to": self.WORKOUT, "sort": "op"}
+        assert client.get(self.RESOURCE_URL, query_string=query).status_code == 400
+        query = {"from": self.WORKOUT, "to": "/api/users/testuser1/workouts/nothing/"}
+        assert client.get(self.RESOURCE_URL, query_string=query).status_code == 404
+
+    def test_reserved_name(self, client):
+        # a workout named diff would be shadowed by the diff
+        assert client.post("/api/users/testuser1/workouts/", json=_get_workout_json("diff")).status_code == 400
+        assert client.put(self.WORKOUT, json=_get_workout_json("diff")).status_code == 400
+
+
+class TestSubPlans(object):
+
+    WORKOUT1 = "/api/users/testuser1/workouts/testworkout1/"
+    WORKOUT2 = "/api/users/testuser2/workouts/testworkout2/"
+    WORKOUT3 = "/api/users/testuser3/workouts/testworkout3/"
+
+    def _add(self, client, plan, subplan, reps=None):
+        doc = {"subplan": subplan, "position": 99}
+        if reps is not None:
+            doc["repetitions"] = reps
+        return client.post(plan + "moves/", json=doc).status_code
+
+    def _patch(self, client, url, operations):
+        return client.patch(url, data=json.dumps(operations), content_type="application/json-patch+json").status_code
+
+    def _expand(self, client, query="expand=full"):
+        resp = client.get(self.WORKOUT1 + "moves/?" + query)
+        assert resp.status_code == 200
+        return json.loads(resp.data)
+
+    def test_subplans(self, client):
+        assert self._add(client, self.WORKOUT1, self.WORKOUT2, reps=3) == 201
+        assert self._add(client, self.WORKOUT2, self.WORKOUT3) == 201
+
+        body = json.loads(client.get(self.WORKOUT1 + "moves/1/").data)
+        assert body["workout"] == "testworkout2" and body["workout_creator"] == "testuser2"
+        assert body["repetitions"] == 3
+        assert body["@controls"]["workoutplanner:subplan"]["href"] == self.WORKOUT2
+        body = json.loads(client.get(self.WORKOUT1 + "moves/").data)
+        assert [item.get("move") or item.get("workout") for item in body["items"]] == ["testmove1", "testworkout2"]
+        assert json.loads(client.get(self.WORKOUT1).data)["move_count"] == 2
+
+        # a workout can not contain itself, directly or through other workouts
+        assert self._add(client, self.WORKOUT1, self.WORKOUT1) == 409
+        assert self._add(client, self.WORKOUT2, self.WORKOUT1) == 409
+        assert self._add(client, self.WORKOUT3, self.WORKOUT1) == 409
+        resp = client.put(self.WORKOUT3 + "moves/0/", json={"subplan": self.WORKOUT1})
+        assert resp.status_code == 409
+        patch = [{"op": "add", "path": "/moves/-", "value": {"subplan": self.WORKOUT2}}]
+        assert self._patch(client, self.WORKOUT3, patch) == 409
+        assert self._add(client, self.WORKOUT3, "/api/users/testuser3/workouts/nothing/") == 404
+
+        # the patched document has the workouts of the move list
+        patch = [
+            {"op": "test", "path": "/moves/1", "value": {"subplan": self.WORKOUT2, "repetitions": 3}},
+            {"op": "replace", "path": "/moves/1/repetitions", "value": 4},
+            {"op": "copy", "from": "/moves/1", "path": "/moves/0"},
+        ]
+        assert self._patch(client, self.WORKOUT1, patch) == 200
+        body = json.loads(client.get(self.WORKOUT1 + "moves/").data)
+        assert [item.get("move") or item.get("workout") for item in body["items"]] == ["testworkout2", "testmove1", "testworkout2"]
+
+        # a workout entry becomes a move only when both of its fields are given
+        patch = [{"op": "replace", "path": "/moves/2/move_name", "value": "testmove1"}]
+        assert self._patch(client, self.WORKOUT1, patch) == 422
+        patch.append({"op": "replace", "path": "/moves/2/move_creator", "value": "testuser1"})
+        assert self._patch(client, self.WORKOUT1, patch) == 200
+        patch = [{"op": "replace", "path": "/moves/2", "value": {"subplan": self.WORKOUT2}}]
+        assert self._patch(client, self.WORKOUT1, patch) == 200
+
+        resp = client.delete(self.WORKOUT2)
+        assert resp.status_code == 200
+        body = json.loads(client.get(self.WORKOUT1 + "moves/").data)
+        assert [item["move"] for item in body["items"]] == ["testmove1"]
+        assert json.loads(client.get(self.WORKOUT1).data)["move_count"] == 1
+
+    def _positions(self, client):
+        body = json.loads(client.get(self.WORKOUT1 + "moves/").data)
+        return [(item["position"], item.get("move") or item.get("workout")) for item in body["items"]]
+
+    @pytest.mark.parametrize("deleted", [WORKOUT2, "/api/users/testuser2/"])
+    def test_delete_compacts_parents(self, client, deleted):
+        client.post(self.WORKOUT1 + "moves/", json={"subplan": self.WORKOUT2, "position": 0})
+        client.post(self.WORKOUT1 + "moves/", json=_get_movelistitem_json("testmove3", "testuser3", 5, 99))
+        assert self._positions(client) == [(0, "testworkout2"), (1, "testmove1"), (2, "testmove3")]
+
+        assert client.delete(deleted).status_code == 200
+        assert self._positions(client) == [(0, "testmove1"), (1, "testmove3")]
+        assert client.get(self.WORKOUT1 + "moves/0/").status_code == 200
+        client.post(self.WORKOUT1 + "moves/", json=_get_movelistitem_json("testmove4", "testuser4", 5, 99))
+        assert self._positions(client) == [(0, "testmove1"), (1, "testmove3"), (2, "testmove4")]
+
+    def test_expand(self, client, monkeypatch):
+        self._add(client, self.WORKOUT1, self.WORKOUT2)
+        self._add(client, self.WORKOUT2, self.WORKOUT3)
+
+        body = self._expand(client)
+        assert not body["truncated"]
+        assert [(item["depth"], item["path"], item.get("move") or item.get("workout")) for item in body["items"]] == [
+            (0, "0", "testmove1"),
+            (0, "1", "testworkout2"),
+            (1, "1.0", "testmove2"),
+            (1, "1.1", "testworkout3"),
+            (2, "1.1.0", "testmove3"),
+        ]
+        assert body["items"][4]["@controls"]["self"]["href"] == self.WORKOUT3 + "moves/0/"
+        assert body["items"][4]["@controls"]["workoutplanner:move"]["href"] == "/api/users/testuser3/moves/testmove3/"
+
+        assert len(self._expand(client, "expand=full&depth=1")["items"]) == 4
+        assert len(self._expand(client, "expand=full&depth=0")["items"]) == 2
+
+        import workoutplanner.resources.move_list_item as move_list_item
+        monkeypatch.setattr(move_list_item, "EXPAND_MAX_ROWS", 3)
+        body = self._expand(client)
+        assert body["truncated"] and len(body["items"]) == 3
+        # the rows are cut in workout order, not level by level
+        self._add(client, self.WORKOUT1, self.WORKOUT3)
+        monkeypatch.setattr(move_list_item, "EXPAND_MAX_ROWS", 5)
+        body = self._expand(client)
+        assert body["truncated"] and [item["path"] for item in body["items"]] == ["0", "1", "1.0", "1.1", "1.1.0"]
+
+        assert client.get(self.WORKOUT1 + "moves/?expand=some").status_code == 400
+        assert client.get(self.WORKOUT1 + "moves/?expand=full&depth=-1").status_code == 400
+
+
+class TestSessions(object):
+
+    RESOURCE_URL = "/api/users/testuser1/sessions/"
+    WORKOUT = "/api/users/testuser1/workouts/testworkout1/"
+
+    def _log(self, client, performed_at, *sets):
+        resp = client.post(self.RESOURCE_URL, json={"workout": self.WORKOUT, "performed_at": performed_at})
+        assert resp.status_code == 201
+        session_url = resp.headers["Location"]
+        for repetitions in sets:
+            resp = client.post(session_url + "sets/", json={"position": 0, "repetitions": repetitions})
+            assert resp.status_code == 201
+        return session_url
+
+    def _history(self, client, query):
+        resp = client.get("/api/users/testuser1/history/?" + query)
+        assert resp.status_code == 200
+        return [(item["start"], item["sessions"], item["sets"], item["repetitions"]) for item in json.loads(resp.data)["items"]]
+
+    def test_sessions(self, client):
+        body = json.loads(client.get("/api/users/testuser1/").data)
+        assert body["@controls"]["workoutplanner:sessions"]["href"] == self.RESOURCE_URL
+
+        session_url = self._log(client, "2024-03-04T10:00:00", 8, 9)
+        assert session_url == self.RESOURCE_URL + "1/"
+        self._log(client, "2024-03-10T20:00:00+02:00", 10)
+
+        body = json.loads(client.get(session_url).data)
+        assert (body["workout"], body["performed_at"], body["sets"], body["repetitions"]) == (
+            "testworkout1", "2024-03-04T10:00:00", 2, 17
+        )
+        assert body["@controls"]["workoutplanner:workout"]["href"] == self.WORKOUT
+        body = json.loads(client.get(session_url + "sets/").data)
+        assert [(item["move"], item["repetitions"]) for item in body["items"]] == [("testmove1", 8), ("testmove1", 9)]
+
+        body = json.loads(client.get(self.RESOURCE_URL).data)
+        assert [item["performed_at"] for item in body["items"]] == ["2024-03-10T18:00:00", "2024-03-04T10:00:00"]
+        body = json.loads(client.get(self.RESOURCE_URL + "?since=2024-03-05T00:00:00").data)
+        assert [item["id"] for item in body["items"]] == [2]
+
+        # the session stays in the history when the workout is deleted
+        assert client.delete(self.WORKOUT).status_code == 200
+        assert json.loads(client.get(session_url).data)["workout"] is None
+
+    def test_history(self, app, client):
+        from sqlalchemy.exc import IntegrityError
+        from workoutplanner.models import rebuild_history
+        self._log(client, "2024-03-04T10:00:00", 8, 9)
+        self._log(client, "2024-03-10T20:00:00", 10)
+        self._log(client, "2024-04-02T07:00:00", 5)
+
+        assert self._history(client, "period=week") == [
+            ("2024-03-04", 2, 3, 27), ("2024-04-01", 1, 1, 5)
+        ]
+        assert self._history(client, "period=month") == [
+            ("2024-03-01", 2, 3, 27), ("2024-04-01", 1, 1, 5)
+        ]
+        assert self._history(client, "period=day&from=2024-03-05&to=2024-03-31") == [("2024-03-10", 1, 1, 10)]
+        assert self._history(client, "period=week&to=2024-03-31") == [("2024-03-04", 2, 3, 27)]
+
+        with app.app_context():
+            with pytest.raises(IntegrityError):
+                db.session.execute(db.text("UPDATE set_log SET repetitions = 100"))
+            db.session.rollback()
+            rebuild_history()
+        assert self._history(client, "period=week") == [("2024-03-04", 2, 3, 27), ("2024-04-01", 1, 1, 5)]
+
+    def test_errors(self, client):
+        resp = client.post(self.RESOURCE_URL, json={"workout": self.WORKOUT, "performed_at": "yesterday"})
+        assert resp.status_code == 400
+        resp = client.post(self.RESOURCE_URL, json={"workout": "/api/users/testuser1/workouts/nothing/"})
+        assert resp.status_code == 404
+        session_url = self._log(client, "2024-03-04T10:00:00")
+        assert client.post(session_url + "sets/", json={"position": 5, "repetitions": 1}).status_code == 404
+        assert client.post(session_url + "sets/", json={"position": 0}).status_code == 400
+        assert client.get(self.RESOURCE_URL + "99/").status_code == 404
+        assert client.get("/api/users/testuser2/sessions/1/").status_code == 404
+        assert client.get("/api/users/testuser1/history/?period=year").status_code == 400
+        assert client.get("/api/users/testuser1/history/?from=March").status_code == 400
+
+
+class TestAnalytics(object):
+
+    RESOURCE_URL = "/api/users/testuser1/moves/testmove1/paired/"
+    ANALYTICS_URL = "/api/users/testuser1/analytics/"
+
+    def _add(self, client, workout, move, reps):
+        resp = client.post(workout + "moves/", json=_get_movelistitem_json(move, "testuser" + move[-1], reps, 99))
+        assert resp.status_code == 201
+
+    def test_paired(self, client):
+        pytest.importorskip("numpy")
+        workout1 = "/api/users/testuser1/workouts/testworkout1/"
+        workout2 = "/api/users/testuser2/workouts/testworkout2/"
+        self._add(client, workout1, "testmove2", 3)
+        self._add(client, workout1, "testmove3", 5)
+        self._add(client, workout2, "testmove1", 20)
+
+        body = json.loads(client.get("/api/users/testuser1/moves/testmove1/").data)
+        assert body["@controls"]["workoutplanner:paired-moves"]["href"] == self.RESOURCE_URL
+        resp = client.get(self.RESOURCE_URL)
+        assert resp.status_code == 200
+        body = json.loads(resp.data)
+        assert [(item["name"], item["workouts"], item["adjacent"]) for item in body["items"]] == [
+            ("testmove2", 2, 2), ("testmove3", 1, 0)
+        ]
+        assert body["items"][0]["@controls"]["self"]["href"] == "/api/users/testuser2/moves/testmove2/"
+        assert len(json.loads(client.get(self.RESOURCE_URL + "?limit=1").data)["items"]) == 1
+
+        # the cached result is recomputed after a move list changes
+        assert client.delete(workout2 + "moves/0/").status_code == 200
+        body = json.loads(client.get(self.RESOURCE_URL).data)
+        assert [(item["name"], item["workouts"], item["adjacent"]) for item in body["items"]] == [
+            ("testmove2", 1, 1), ("testmove3", 1, 0)
+        ]
+        body = json.loads(client.get("/api/users/testuser4/moves/testmove4/paired/").data)
+        assert body["items"] == []
+
+        assert client.get(self.RESOURCE_URL + "?limit=0").status_code == 400
+        assert client.get(self.RESOURCE_URL + "?sort=name").status_code == 400
+        assert client.get("/api/users/testuser1/moves/nothing/paired/").status_code == 404
+
+    def test_repetitions(self, client):
+        pytest.importorskip("numpy")
+        workout1 = "/api/users/testuser1/workouts/testworkout1/"
+        self._add(client, workout1, "testmove2", 3)
+        self._add(client, workout1, "testmove3", 5)
+
+        body = json.loads(client.get("/api/users/testuser1/").data)
+        assert body["@controls"]["workoutplanner:analytics"]["href"] == self.ANALYTICS_URL
+        resp = client.get(self.ANALYTICS_URL)
+        assert resp.status_code == 200
+        body = json.loads(resp.data)
+        assert (body["moves_with_repetitions"], body["mean"], body["median"]) == (3, 6.0, 5.0)
+        assert [bin["items"] for bin in body["histogram"]] == [1, 1, 1, 0, 0, 0, 0, 0]
+        assert body["histogram"][-1] == {"min": 100, "max": None, "items": 0}
+
+        self._add(client, workout1, "testmove1", 30)
+        body = json.loads(client.get(self.ANALYTICS_URL).data)
+        assert (body["moves"], body["mean"], body["median"]) == (4, 12.0, 7.5)
+        assert [(item["name"], item["items"], item["mean"], item["median"]) for item in body["items"]][:2] == [
+            ("testmove1", 2, 20.0, 20.0), ("testmove2", 1, 3.0, 3.0)
+        ]
+        assert json.loads(client.get("/api/users/testuser2/analytics/").data)["mean"] == 10.0
+        assert client.get("/api/users/nobody/analytics/").status_code == 404
+
+    def test_write_version(self, app, client):
+        from workoutplanner.analytics import write_version
+
+        def versions():
+            with app.app_context():
+                return write_version(), write_version(1), write_version(2)
+
+        history = [versions()]
+        self._add(client, "/api/users/testuser1/workouts/testworkout1/", "testmove2", 3)
+        history.append(versions())
+        client.put("/api/users/testuser1/workouts/testworkout1/moves/1/", json=_get_movelistitem_json("testmove2", "testuser2", 4, 1))
+        history.append(versions())
+        self._add(client, "/api/users/testuser3/workouts/testworkout3/", "testmove3", 2)
+        history.append(versions())
+        # items removed by a cascade count as writes too, testmove2 is removed from
+        # the plan of testuser1 as well
+        client.delete("/api/users/testuser2/")
+        history.append(versions())
+        client.post("/api/users/", json=_get_user_json("other"))
+        history.append(versions())
+
+        every, user1, user2 = zip(*history)
+        assert every[0] < every[1] < every[2] < every[3] < every[4] == every[5]
+        # the counter of a user only moves with the writes to the user's plans
+        assert user1[0] < user1[1] < user1[2] == user1[3] < user1[4] == user1[5]
+        assert user2[0] == user2[1] == user2[2] == user2[3] < user2[4] == user2[5]
+
+    def test_without_numpy(self, client, monkeypatch):
+        import workoutplanner.analytics
+        monkeypatch.setattr(workoutplanner.analytics, "np", None)
+        assert client.get(self.RESOURCE_URL).status_code == 501
+        assert client.get(self.ANALYTICS_URL).status_code == 501
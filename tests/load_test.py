@@ -0,0 +1,149 @@
+import logging
+import os
+import tempfile
+import threading
+import time
+import urllib.request
+import urllib.error
+from concurrent.futures import ThreadPoolExecutor
+from werkzeug.serving import make_server
+
+from workoutplanner import create_app
+from workoutplanner.links import HEALTH_URL
+
+SERVICE_TIME = 0.05
+CLIENTS = 40
+REQUESTS = 400
+
+
+def _run_load(load_shedding: bool) -> tuple[list, list, list]:
+    """
+    Runs a threaded server with a slow endpoint handling 4 requests at a time
+    and sends it ten times more concurrent requests than it can handle. While
+    they are in flight the API entry point and the health probe are requested.
+
+    Returns:
+        (list, list, list): latencies of the slow requests in seconds, their status
+        codes and the (latency, status) tuples of the entry point and health requests
+    """
+    db_fd, db_fname = tempfile.mkstemp()
+    app = create_app({
+        "SQLALCHEMY_DATABASE_URI": "sqlite:///" + db_fname,
+        "TESTING": True,
+        "RATELIMIT_ENABLED": False,
+        "LOADSHED_ENABLED": load_shedding,
+        "LOADSHED_MAX_IN_FLIGHT": 4,
+        "LOADSHED_MAX_QUEUE": 8,
+        "LOADSHED_MAX_QUEUE_AGE": 0.2,
+    })
+    capacity = threading.Semaphore(4)
+
+    def slow():
+        with capacity:
+            time.sleep(SERVICE_TIME)
+        return "done"
+    app.add_url_rule("/api/slow/", "slow", slow)
+
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    server_thread = threading.Thread(target=server.serve_forever, daemon=True)
+    server_thread.start()
+    url = f"http://127.0.0.1:{server.server_port}"
+
+    def fetch(path):
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(url + path) as resp:
+                status = resp.status
+        except urllib.error.HTTPError as err:
+            status = err.code
+        return time.perf_counter() - start, status
+
+    try:
+        with ThreadPoolExecutor(CLIENTS) as pool:
+            futures = [pool.submit(fetch, "/api/slow/") for _ in range(REQUESTS)]
+            time.sleep(SERVICE_TIME)
+            exempt = [fetch(path) for path in ("/api/", HEALTH_URL) * 3]
+            assert not all(future.done() for future in futures), "The server was not overloaded any more"
+            results = [future.result() for future in futures]
+    finally:
+        server.shutdown()
+        os.close(db_fd)
+        os.unlink(db_fname)
+    return [r[0] for r in results], [r[1] for r in results], exempt
+
+
+def _p99(latencies: list) -> float:
+    return sorted(latencies)[int(len(latencies) * 0.99) - 1]
+
+
+def test_p99_bounded_under_overload():
+    """
+    Without load shedding the queue, and so the latency, grows with the load.
+    With it the p99 latency stays near the queue age limit plus the service
+    time, and the extra requests are rejected quickly with 503.
+    """
+    latencies, statuses, exempt = _run_load(load_shedding=True)
+    assert set(statuses) <= {200, 503}
+    assert statuses.count(503) > 0
+    assert _p99(latencies) < 0.2 + 4 * SERVICE_TIME + 0.3
+    # the entry point and the health probe skip the queue of the overloaded server
+    assert [status for _, status in exempt] == [200] * len(exempt), "The API entry point should never be shed"
+    assert max(latency for latency, _ in exempt) < 0.2
+
+    unbounded, statuses, _ = _run_load(load_shedding=False)
+    assert set(statuses) == {200}
+    assert _p99(unbounded) > 2 * _p99(latencies)
+
+
+def test_rate_limited_requests_skip_the_queue():
+    """
+    Requests over the rate limit are rejected with 429 before admission
+    control, so they are answered at once and never wait in its queue.
+    """
+    db_fd, db_fname = tempfile.mkstemp()
+    app = create_app({
+        "SQLALCHEMY_DATABASE_URI": "sqlite:///" + db_fname,
+        "TESTING": True,
+        "RATELIMIT_READ_RATE": 0.01,
+        "RATELIMIT_READ_BURST": 1,
+        "LOADSHED_MAX_IN_FLIGHT": 1,
+        "LOADSHED_MAX_QUEUE": 8,
+        "LOADSHED_MAX_QUEUE_AGE": 5,
+    })
+    started = threading.Event()
+    release = threading.Event()
+
+    def blocking():
+        started.set()
+        release.wait(5)
+        return "done"
+    app.add_url_rule("/api/blocking/", "blocking", blocking)
+
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/api/blocking/"
+    controller = app.extensions["admission"]
+
+    try:
+        with ThreadPoolExecutor(1) as pool:
+            # takes the only token and the only place in flight
+            holder = pool.submit(urllib.request.urlopen, url)
+            assert started.wait(5)
+            for _ in range(3):
+                start = time.perf_counter()
+                try:
+                    status = urllib.request.urlopen(url).status
+                except urllib.error.HTTPError as err:
+                    status = err.code
+                assert status == 429
+                assert time.perf_counter() - start < 0.5
+                assert (controller.in_flight, controller.queued) == (1, 0)
+            release.set()
+            assert holder.result().status == 200
+    finally:
+        release.set()
+        server.shutdown()
+        os.close(db_fd)
+        os.unlink(db_fname)
@@ -0,0 +1,158 @@
+import asyncio
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import Counter
+from urllib.parse import unquote
+import pytest
+from flask import Response, request
+from werkzeug.serving import make_server
+
+from workoutplanner import create_app, db
+
+pytest.importorskip("aiohttp")
+from workoutplanner_client import AsyncClient, ApiError
+
+
+@pytest.fixture(scope="function")
+def server():
+    """
+    Runs the API in a threaded server, with endpoints answering 429 and 503,
+    and counts the GET requests per path
+    """
+    db_fd, db_fname = tempfile.mkstemp()
+    app = create_app({
+        "SQLALCHEMY_DATABASE_URI": "sqlite:///" + db_fname,
+        "TESTING": True,
+        "RATELIMIT_ENABLED": False,
+        "LOADSHED_ENABLED": False,
+    })
+    with app.app_context():
+        db.create_all()
+
+    gets = Counter()
+    throttled = Counter()
+
+    @app.before_request
+    def count_gets():
+        if request.method == "GET":
+            gets[request.path] += 1
+
+    def throttle(status, times, retry_after):
+        throttled[request.path] += 1
+        if throttled[request.path] <= times:
+            headers = {"Retry-After": retry_after} if retry_after else {}
+            return Response('{"message": "Try again"}', status, headers=headers, mimetype="application/json")
+        return Response('{"done": true}', 200, mimetype="application/json")
+
+    app.add_url_rule("/api/throttled/", "throttled", lambda: throttle(429, 2, "0.2"))
+    app.add_url_rule("/api/overloaded/", "overloaded", lambda: throttle(503, 2, None))
+    app.add_url_rule("/api/down/", "down", lambda: throttle(503, 100, "0"))
+
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_port}", gets, throttled
+
+    server.shutdown()
+    os.close(db_fd)
+    os.unlink(db_fname)
+
+
+def _run(base_url, scenario, **kwargs):
+    async def main():
+        async with AsyncClient(base_url, **kwargs) as api:
+            return await scenario(api)
+    return asyncio.run(main())
+
+
+class TestAsyncClient(object):
+
+    def test_workflow(self, server):
+        base_url, gets, _ = server
+
+        async def scenario(api):
+            user = await api.create_user("sdk user")
+            move = await api.create_move("sdk user", "squat", "Bend your knees")
+            workout = await api.create_workout("sdk user", "legs")
+            item = await api.add_move(workout, move, repetitions=10)
+            move_list = await api.list_move_list(workout)
+            return user, move, workout, item, move_list, await api.get_move_list_item(item), await api.get_user("sdk user")
+
+        user, move, workout, item, move_list, entry, fetched = _run(base_url, scenario)
+        # the hrefs are the Location headers of the created resources
+        assert unquote(user.href) == "/api/users/sdk user/"
+        assert unquote(move.href) == "/api/users/sdk user/moves/squat/"
+        assert unquote(workout.href) == "/api/users/sdk user/workouts/legs/"
+        assert unquote(item) == "/api/users/sdk user/workouts/legs/moves/0/"
+        assert [(listed.position, listed.move_name) for listed in move_list] == [(0, "squat")]
+        assert (entry.move_name, entry.repetitions) == ("squat", 10)
+        assert fetched.username == "sdk user"
+        # the user item was found from the users collection once and its controls reused,
+        # the other GET is get_user
+        assert gets["/api/users/sdk user/"] == 2
+
+        async def missing(api):
+            with pytest.raises(ApiError) as err:
+                await api.get_user("nobody")
+            return err.value.status
+        assert _run(base_url, missing) == 404
+
+    def test_subplans(self, server):
+        base_url, _, _ = server
+
+        async def scenario(api):
+            await api.create_user("nester")
+            move = await api.create_move("nester", "squat")
+            outer = await api.create_workout("nester", "outer")
+            inner = await api.create_workout("nester", "inner")
+            await api.add_move(inner, move)
+            await api.add_move(outer, move, repetitions=5)
+            item = await api.add_workout(outer, inner, repetitions=2)
+            return await api.list_move_list(outer), await api.get_move_list_item(item)
+
+        move_list, entry = _run(base_url, scenario)
+        assert [(listed.position, listed.move_name, listed.workout) for listed in move_list] == [
+            (0, "squat", None), (1, None, "inner")
+        ]
+        assert (entry.move_name, entry.workout, entry.repetitions) == (None, "inner", 2)
+
+    def test_shared_lookups(self, server):
+        base_url, gets, _ = server
+
+        async def scenario(api):
+            await api.create_user("seeder")
+            gets.clear()
+            await asyncio.gather(*(api.create_workout("seeder", f"plan{i}") for i in range(20)))
+            return await api.list_workouts("seeder")
+
+        workouts = _run(base_url, scenario, concurrency=8)
+        assert sorted(workout.name for workout in workouts) == sorted(f"plan{i}" for i in range(20))
+        # concurrent requests share the lookups of the entry point, the users and the user
+        assert gets["/api/"] == 0
+        assert gets["/api/users/"] == 1
+        assert gets["/api/users/seeder/"] == 1
+
+    def test_retry_after(self, server):
+        base_url, _, throttled = server
+        start = time.perf_counter()
+        status, _, body = _run(base_url, lambda api: api.request("GET", "/api/throttled/"), backoff=5)
+        assert (status, body) == (200, {"done": True})
+        assert throttled["/api/throttled/"] == 3
+        # the waits follow Retry-After instead of the much longer backoff
+        assert 0.4 <= time.perf_counter() - start < 2
+
+    def test_backoff(self, server):
+        base_url, _, throttled = server
+        status, _, _ = _run(base_url, lambda api: api.request("GET", "/api/overloaded/"), backoff=0.01)
+        assert status == 200
+        assert throttled["/api/overloaded/"] == 3
+
+        async def scenario(api):
+            with pytest.raises(ApiError) as err:
+                await api.request("GET", "/api/down/")
+            return err.value.status
+        assert _run(base_url, scenario, retries=2, backoff=0.01) == 503
+        assert throttled["/api/down/"] == 3
@@ -19,7 +19,24 @@ def create_app(test_config=None):
     app.config.from_mapping(
         SECRET_KEY="dev",
         SQLALCHEMY_DATABASE_URI="sqlite:///" + os.path.join(app.instance_path, "development.db"),
-        SQLALCHEMY_TRACK_MODIFICATIONS=False
+        SQLALCHEMY_TRACK_MODIFICATIONS=False,
+        PAGE_SIZE=50,
+        MAX_PAGE_SIZE=500,
+        RATELIMIT_ENABLED=True,
+        RATELIMIT_READ_RATE=50,
+        RATELIMIT_READ_BURST=200,
+        RATELIMIT_WRITE_RATE=10,
+        RATELIMIT_WRITE_BURST=50,
+        RATELIMIT_MAX_KEYS=10000,
+        LOADSHED_ENABLED=True,
+        LOADSHED_MAX_IN_FLIGHT=16,
+        LOADSHED_MAX_QUEUE=64,
+        LOADSHED_MAX_QUEUE_AGE=0.5,
+        LOADSHED_RETRY_AFTER=1,
+        LOADSHED_EXEMPT_ENDPOINTS=("api_entry", "health"),
+        TRAFFIC_RECORD_PATH=None,
+        TRAFFIC_REDACT_FIELDS=(),
+        ANALYTICS_CACHE_SIZE=256
     )
     
     app.config["SWAGGER"] = {
@@ -43,13 +60,31 @@ def create_app(test_config=None):
     
     from . import api as api_
     from . import models
+    from . import autocomplete
+    from . import analytics
+    from . import ratelimit
+    from . import admission
+    from . import yamler
+    from . import traffic
 
     app.register_blueprint(api_.api_bp)
     api = api_.make_api(app)
+    autocomplete.init_app(app)
+    analytics.init_app(app)
+    traffic.init_app(app)
+    #  Rate limited requests are rejected before they can take a place in the admission queue
+    ratelimit.init_app(app)
+    admission.init_app(app)
 
     # Register cli commands to create and populate db
     app.cli.add_command(models.initialize_db_command)
     app.cli.add_command(models.populate_db_command)
     app.cli.add_command(models.nuke_db_command)
+    app.cli.add_command(models.rebuild_search_index_command)
+    app.cli.add_command(models.repair_counts_command)
+    app.cli.add_command(models.rebuild_stats_command)
+    app.cli.add_command(models.rebuild_history_command)
+    app.cli.add_command(yamler.generate_docs_command)
+    app.cli.add_command(traffic.replay_traffic_command)
 
     return app
@@ -0,0 +1,117 @@
+"""
+Admission control of the API.
+
+At most LOADSHED_MAX_IN_FLIGHT requests are handled at the same time, the rest
+wait in a queue. Instead of letting the queue grow until every request is slow,
+new work is rejected with 503 right away when the queue already holds
+LOADSHED_MAX_QUEUE requests, and a queued request gives up when it has waited
+LOADSHED_MAX_QUEUE_AGE seconds. Time spent in front of the app is counted as
+well when a proxy sets the X-Request-Start header.
+
+The API entry point and the health probe are never queued or rejected.
+"""
+
+import threading
+import time
+from flask import g, request
+from workoutplanner.utils import create_error_response
+
+
+class AdmissionController(object):
+    """
+    Counts the requests in flight and in the queue
+    """
+
+    def __init__(self, max_in_flight, max_queue, max_queue_age):
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.max_queue_age = max_queue_age
+        self.in_flight = 0
+        self.queued = 0
+        self._condition = threading.Condition()
+
+    def admit(self, age=0.0):
+        """
+        Waits for a free slot.
+        : param float age: seconds the request has already waited before reaching the app
+        : return: True if the request got a slot, False if it should be rejected
+        """
+        deadline = time.monotonic() + self.max_queue_age - age
+        with self._condition:
+            if self.in_flight < self.max_in_flight:
+                self.in_flight += 1
+                return True
+            if self.queued >= self.max_queue or age >= self.max_queue_age:
+                return False
+            self.queued += 1
+            try:
+                while self.in_flight >= self.max_in_flight:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0 or not self._condition.wait(remaining):
+                        if self.in_flight < self.max_in_flight:
+                            break
+                        return False
+                self.in_flight += 1
+                return True
+            finally:
+                self.queued -= 1
+
+    def release(self):
+        with self._condition:
+            self.in_flight -= 1
+            self._condition.notify()
+
+
+def _request_age():
+    """
+    Seconds since a proxy received the request, from X-Request-Start: t=<timestamp>.
+    The timestamp may be in seconds, milliseconds or microseconds.
+    """
+    header = request.headers.get("X-Request-Start", "")
+    try:
+        start = float(header.replace("t=", ""))
+    except ValueError:
+        return 0.0
+    now = time.time()
+    for scale in (1, 1e3, 1e6):
+        if start / scale <= now * 10:
+            return max(now - start / scale, 0.0)
+    return 0.0
+
+
+def init_app(app):
+    """
+    Adds admission control to the app. The limits are read from the config:
+    LOADSHED_ENABLED, LOADSHED_MAX_IN_FLIGHT, LOADSHED_MAX_QUEUE,
+    LOADSHED_MAX_QUEUE_AGE, LOADSHED_RETRY_AFTER and LOADSHED_EXEMPT_ENDPOINTS.
+    """
+    if not app.config["LOADSHED_ENABLED"]:
+        return
+
+    controller = AdmissionController(
+        app.config["LOADSHED_MAX_IN_FLIGHT"],
+        app.config["LOADSHED_MAX_QUEUE"],
+        app.config["LOADSHED_MAX_QUEUE_AGE"]
+    )
+    app.extensions["admission"] = controller
+    exempt = set(app.config["LOADSHED_EXEMPT_ENDPOINTS"])
+
+    @app.before_request
+    def admit_request():
+        if request.endpoint in exempt:
+            return None
+        if not controller.admit(_request_age()):
+            response = create_error_response(
+                503,
+                "Service overloaded",
+                "The server is handling too many requests, try again later"
+            )
+            response.headers["Retry-After"] = str(app.config["LOADSHED_RETRY_AFTER"])
+            return response
+        g.admitted = True
+        return None
+
+    @app.teardown_request
+    def release_request(exception=None):
+        if g.pop("admitted", False):
+            controller.release()
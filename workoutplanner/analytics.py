@@ -0,0 +1,171 @@
+"""
+Move list analytics computed with NumPy: moves often used together with a
+move, moves done right before or after it, and the distribution of the
+repetitions of a user's workouts.
+
+The move lists are read with one query into arrays of plan ids, move ids,
+positions and repetitions, and everything is computed with array operations
+instead of iterating ORM objects. NumPy is an optional dependency, installed
+with the analytics extra.
+
+Loaded arrays and results are cached per app. Every entry is stored with the
+value the move list write counter had when it was computed and is recomputed
+when the counter has moved on. Results of a user's plans use the counter of
+that user, so writes of the other users keep them valid.
+"""
+
+import threading
+from collections import OrderedDict
+from flask import current_app
+from sqlalchemy import select, func
+from workoutplanner import db
+from workoutplanner.models import MoveListItem, WorkoutPlan, WriteCounter
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+#  Lower bounds of the repetition histogram bins, the last bin has no upper bound
+REPETITION_BINS = (0, 5, 10, 15, 20, 30, 50, 100)
+
+
+class AnalyticsCache(object):
+    """
+    A least recently used cache of values that are valid for one write version
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, version, compute):
+        """
+        Returns the cached value of the key if it was computed for the version,
+        otherwise computes and caches it
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end(key)
+                return entry[1]
+        value = compute()
+        with self._lock:
+            self._entries[key] = (version, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+def write_version(user_id=None):
+    """
+    Version of the move lists of all plans or the plans of a user, a counter
+    the database bumps on every write to them, even when items are removed by a
+    cascade. Reading it is a primary key lookup of a single row.
+    """
+    if user_id is None:
+        return WriteCounter.current("move_list")
+    return WriteCounter.current(WriteCounter.owner_name("move_list", user_id))
+
+
+def load_arrays(user_id=None):
+    """
+    Reads the moves of the move lists of all plans or the plans of a user into
+    arrays sorted by plan and position. Missing repetitions are -1 and items
+    that are workouts are left out.
+    : return: dict of arrays plan, move, position and repetitions
+    """
+    query = (
+        select(
+            MoveListItem.plan_id,
+            MoveListItem.move_id,
+            MoveListItem.position,
+            func.coalesce(MoveListItem.repetitions, -1)
+        )
+        .where(MoveListItem.move_id.is_not(None))
+        .order_by(MoveListItem.plan_id, MoveListItem.position)
+    )
+    if user_id is not None:
+        query = query.join(WorkoutPlan, WorkoutPlan.id == MoveListItem.plan_id).where(WorkoutPlan.user_id == user_id)
+    columns = np.array(db.session.execute(query).all(), dtype=np.int64).reshape(-1, 4).T
+    return dict(zip(("plan", "move", "position", "repetitions"), columns))
+
+
+def paired_moves(arrays, move_id, top):
+    """
+    Moves used in the same workouts as the given move
+    : return: list of (move id, workouts using both, times right before or after the move),
+    most workouts first
+    """
+    plan, move, position = arrays["plan"], arrays["move"], arrays["position"]
+    if not len(move) or move_id > move.max():
+        return []
+    size = move.max() + 1
+
+    #  Distinct (plan, move) pairs of the plans that use the move
+    in_plans = np.isin(plan, np.unique(plan[move == move_id]))
+    pairs = np.unique(np.stack((plan[in_plans], move[in_plans]), axis=1), axis=0)
+    together = np.bincount(pairs[:, 1], minlength=size)
+
+    #  Neighbours are consecutive items of the same plan
+    consecutive = (plan[1:] == plan[:-1]) & (position[1:] - position[:-1] == 1)
+    before, after = move[:-1], move[1:]
+    neighbours = np.concatenate((after[consecutive & (before == move_id)], before[consecutive & (after == move_id)]))
+    adjacent = np.bincount(neighbours, minlength=size)
+
+    together[move_id] = 0
+    candidates = np.nonzero(together)[0]
+    order = np.lexsort((candidates, -adjacent[candidates], -together[candidates]))[:top]
+    return [(int(id), int(together[id]), int(adjacent[id])) for id in candidates[order]]
+
+
+def repetition_distribution(arrays, top):
+    """
+    Distribution of the repetitions of the items of a user's workouts
+    : return: tuple of (summary dict, histogram list of (lower bound, upper bound or None, items),
+    list of (move id, items, mean, median) of the most used moves)
+    """
+    move, repetitions = arrays["move"], arrays["repetitions"]
+    counted = repetitions >= 0
+    reps, moves = repetitions[counted], move[counted]
+
+    bins = np.searchsorted(np.array(REPETITION_BINS), reps, side="right") - 1
+    counts = np.bincount(bins, minlength=len(REPETITION_BINS))
+    upper = [bound - 1 for bound in REPETITION_BINS[1:]] + [None]
+    histogram = [(low, high, int(count)) for low, high, count in zip(REPETITION_BINS, upper, counts)]
+
+    summary = {
+        "moves": int(len(move)),
+        "moves_with_repetitions": int(len(reps)),
+        "mean": float(reps.mean()) if len(reps) else None,
+        "median": float(np.median(reps)) if len(reps) else None,
+    }
+
+    per_move = []
+    if len(reps):
+        #  Sorting by move and repetitions makes every move a run whose middle is the median
+        order = np.lexsort((reps, moves))
+        moves, reps = moves[order], reps[order]
+        ids, starts, sizes = np.unique(moves, return_index=True, return_counts=True)
+        sums = np.add.reduceat(reps, starts)
+        medians = (reps[starts + (sizes - 1) // 2] + reps[starts + sizes // 2]) / 2
+        for index in np.lexsort((ids, -sizes))[:top]:
+            per_move.append((int(ids[index]), int(sizes[index]), float(sums[index] / sizes[index]), float(medians[index])))
+    return summary, histogram, per_move
+
+
+def init_app(app):
+    """
+    Adds the analytics cache to the app, ANALYTICS_CACHE_SIZE entries at most
+    """
+    app.extensions["analytics"] = AnalyticsCache(app.config["ANALYTICS_CACHE_SIZE"])
+
+
+def get_cache():
+    return current_app.extensions["analytics"]
@@ -6,13 +6,21 @@ Author: Eemil Hyvari, Antti Luukkonen and Oskar Byman
 """
 
 import json
-from flask import Flask, Blueprint, Response
+from flask import Flask, Blueprint, Response, request
 from flask_restful import Api
+from sqlalchemy.orm.exc import StaleDataError
+from workoutplanner import db
+from workoutplanner.utils import create_error_response, with_body_hash
 
 from workoutplanner.resources.user import UserItem, UserCollection, UserConverter
-from workoutplanner.resources.move import MoveItem, MoveCollection, MoveConverter
-from workoutplanner.resources.workout_plan import WorkoutPlanItem, WorkoutPlanCollection, WorkoutPlanConverter
-from workoutplanner.resources.move_list_item import MoveListItemItem, MoveListItemCollection, MoveListItemConverter
+from workoutplanner.resources.move import MoveItem, MoveCollection, MoveConverter, PopularMoves, MoveWorkouts
+from workoutplanner.resources.workout_plan import WorkoutPlanItem, WorkoutPlanCollection, WorkoutPlanConverter, WorkoutSearch, WorkoutPlanIdentical
+from workoutplanner.resources.move_list_item import MoveListItemItem, MoveListItemCollection, MoveListItemConverter, MoveListOrder
+from workoutplanner.resources.autocomplete import AutocompleteCollection
+from workoutplanner.resources.stats import UserStats, WorkoutPlanStats
+from workoutplanner.resources.diff import WorkoutPlanDiff
+from workoutplanner.resources.session import WorkoutSessionCollection, WorkoutSessionItem, SetLogCollection, ActivityHistory
+from workoutplanner.resources.analytics import MovePairs, UserAnalytics
 
 from workoutplanner.links import *
 
@@ -37,6 +45,8 @@ def make_api(app):
         "/users/<user>/moves/<move>/",
         "/moves/<move>/"
     )
+    api.add_resource(PopularMoves, "/moves/popular/")
+    api.add_resource(MoveWorkouts, "/users/<user>/moves/<move>/workouts/")
 
     #  Workout resources from resource/workout_plan.py
     api.add_resource(WorkoutPlanCollection,
@@ -47,6 +57,9 @@ def make_api(app):
         "/users/<user>/workouts/<workout>/",
         "/workouts/<workout>/"
     )
+    api.add_resource(WorkoutPlanIdentical, "/users/<user>/workouts/<workout>/identical/")
+    api.add_resource(WorkoutSearch, "/workouts/search/")
+    api.add_resource(WorkoutPlanDiff, "/workouts/diff/")
 
     #  MoveListItem resources from resources/move_list_item.py
     api.add_resource(MoveListItemCollection,
@@ -57,12 +70,56 @@ def make_api(app):
         "/users/<user>/workouts/<workout>/moves/<int:position>/",
         "/workouts/<workout>/moves/<int:position>/"
     )
+    api.add_resource(MoveListOrder,
+        "/users/<user>/workouts/<workout>/moves/order/"
+    )
+
+    #  Statistics resources from resources/stats.py
+    api.add_resource(UserStats, "/users/<user>/stats/")
+    api.add_resource(WorkoutPlanStats, "/users/<user>/workouts/<workout>/stats/")
+
+    #  Session resources from resources/session.py
+    api.add_resource(WorkoutSessionCollection, "/users/<user>/sessions/")
+    api.add_resource(WorkoutSessionItem, "/users/<user>/sessions/<int:session>/")
+    api.add_resource(SetLogCollection, "/users/<user>/sessions/<int:session>/sets/")
+    api.add_resource(ActivityHistory, "/users/<user>/history/")
+
+    #  Analytics resources from resources/analytics.py
+    api.add_resource(MovePairs, "/users/<user>/moves/<move>/paired/")
+    api.add_resource(UserAnalytics, "/users/<user>/analytics/")
+
+    #  Autocomplete resource from resources/autocomplete.py
+    api.add_resource(AutocompleteCollection, "/autocomplete/<kind>/")
     
     app.url_map.converters["user"] = UserConverter
     app.url_map.converters["move"] = MoveConverter
     app.url_map.converters["workout_plan"] = WorkoutPlanConverter
     app.url_map.converters["move_list_item"] = MoveListItemConverter
 
+    @app.errorhandler(StaleDataError)
+    def handle_stale_data(error):
+        #  A conditional UPDATE or DELETE found another version than the request read
+        db.session.rollback()
+        if request.if_match:
+            return create_error_response(412, "Precondition failed", "The resource was changed after it was read")
+        return create_error_response(409, "Conflict", "The resource was changed by another request, try again")
+
+    @app.after_request
+    def conditional_get(response):
+        #  Every API representation can be revalidated against a hash of its body, items
+        #  carry their version in front of it for If-Match. Clients have to revalidate
+        #  before reusing a cached copy, an unchanged document then costs a 304.
+        if request.method not in ("GET", "HEAD") or not request.path.startswith("/api/"):
+            return response
+        if response.status_code != 200 or response.is_streamed:
+            return response
+        if "ETag" in response.headers:
+            with_body_hash(response)
+        else:
+            response.add_etag()
+        response.headers["Cache-Control"] = "no-cache"
+        return response.make_conditional(request)
+
     @app.route("/api/")
     def api_entry():
         api_entrypoint = {
@@ -80,14 +137,26 @@ def make_api(app):
                     "title": "Show all moves",
                     "href": "/api/moves/"
                 },
+                "workoutplanner:moves-popular": {
+                    "title": "Show the most used moves",
+                    "href": "/api/moves/popular/"
+                },
                 "workoutplanner:workouts-all": {
                     "title": "Show all workouts",
                     "href": "/api/workouts/"
+                },
+                "workoutplanner:autocomplete": {
+                    "href": "/api/autocomplete/{kind}/?prefix={prefix}",
+                    "isHrefTemplate": True
                 }
             }
         }
         return Response(json.dumps(api_entrypoint), 200, mimetype=MASON)
         
+    @app.route(HEALTH_URL)
+    def health():
+        return "OK"
+
     @app.route(USER_PROFILE_URL)
     def profile_user():
         return "Absolute nonsense"
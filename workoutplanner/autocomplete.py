@@ -0,0 +1,247 @@
+"""
+In-memory prefix indexes for autocompleting usernames, move names and workout names.
+
+The indexes are built from the database when the app starts and kept up to date
+by listening to the ORM session: changes are collected when a session flushes
+and applied to the indexes only after the transaction commits.
+"""
+
+import threading
+from bisect import bisect_left, insort
+from flask import current_app, has_app_context
+from sqlalchemy import event, inspect
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+from workoutplanner import db
+from workoutplanner.models import User, Move, WorkoutPlan
+
+KINDS = {
+    "users": User,
+    "moves": Move,
+    "workouts": WorkoutPlan,
+}
+
+
+class PrefixIndex(object):
+    """
+    A sorted list of case folded names. A lookup is a binary search for the
+    prefix followed by a scan of the k following entries, so lookups stay
+    logarithmic in the amount of names. Not thread safe, the indexes are only
+    used under the lock of their Autocomplete.
+    """
+
+    def __init__(self):
+        self._keys = []
+        self._entries = {}
+        self._owned = {}
+
+    def __len__(self):
+        return len(self._keys)
+
+    def add(self, id, name, owner_id=None):
+        """
+        Adds or replaces the name of the row with the given id
+        """
+        self.remove(id)
+        key = (name.casefold(), id)
+        self._entries[id] = (key, name, owner_id)
+        insort(self._keys, key)
+        if owner_id is not None:
+            self._owned.setdefault(owner_id, set()).add(id)
+
+    def get(self, id):
+        """
+        Returns (name, owner_id) of the row with the given id or None if it is not indexed
+        """
+        entry = self._entries.get(id)
+        return None if entry is None else entry[1:]
+
+    def remove(self, id):
+        """
+        Removes the row with the given id if it is indexed
+        """
+        entry = self._entries.pop(id, None)
+        if entry is not None:
+            index = bisect_left(self._keys, entry[0])
+            del self._keys[index]
+            if entry[2] is not None:
+                self._owned.get(entry[2], set()).discard(id)
+
+    def remove_owner(self, owner_id):
+        """
+        Removes all rows owned by the given user
+        """
+        for id in self._owned.pop(owner_id, set()):
+            self.remove(id)
+
+    def lookup(self, prefix, k):
+        """
+        Returns (id, name, owner_id) tuples of at most k names starting with the prefix, in alphabetical order
+        """
+        prefix = prefix.casefold()
+        keys = self._keys
+        matches = []
+        index = bisect_left(keys, (prefix,))
+        while index < len(keys) and len(matches) < k and keys[index][0].startswith(prefix):
+            _, name, owner_id = self._entries[keys[index][1]]
+            matches.append((keys[index][1], name, owner_id))
+            index += 1
+        return matches
+
+
+class Autocomplete(object):
+    """
+    Holds one prefix index per kind of named resource of an app
+    """
+
+    def __init__(self):
+        self.indexes = {kind: PrefixIndex() for kind in KINDS}
+        self.usernames = {}
+        self.ready = False
+        self._lock = threading.Lock()
+
+    def build(self):
+        """
+        Reads every name from the database. Needs an app context.
+        """
+        with self._lock:
+            self.indexes = {kind: PrefixIndex() for kind in KINDS}
+            self.usernames = {}
+            for id, username in db.session.query(User.id, User.username):
+                self.indexes["users"].add(id, username)
+                self.usernames[id] = username
+            for id, name, user_id in db.session.query(Move.id, Move.name, Move.user_id):
+                self.indexes["moves"].add(id, name, user_id)
+            for id, name, user_id in db.session.query(WorkoutPlan.id, WorkoutPlan.name, WorkoutPlan.user_id):
+                self.indexes["workouts"].add(id, name, user_id)
+            self.ready = True
+
+    def apply(self, changes):
+        """
+        Applies committed changes collected from a session. Removing a user
+        removes everything they own as well.
+        """
+        if not self.ready:
+            return
+        with self._lock:
+            for kind, id, name, owner_id in changes:
+                if name is None:
+                    self.indexes[kind].remove(id)
+                    if kind == "users":
+                        self.usernames.pop(id, None)
+                        self.indexes["moves"].remove_owner(id)
+                        self.indexes["workouts"].remove_owner(id)
+                else:
+                    self.indexes[kind].add(id, name, owner_id)
+                    if kind == "users":
+                        self.usernames[id] = name
+
+    def lookup(self, kind, prefix, k):
+        """
+        Returns at most k (name, owner username, href) tuples of the given kind starting with the prefix
+        """
+        if not self.ready:
+            self.build()
+        with self._lock:
+            matches = [(name, self.usernames.get(owner_id)) for _, name, owner_id in self.indexes[kind].lookup(prefix, k)]
+        results = []
+        for name, owner in matches:
+            if kind == "users":
+                results.append((name, None, "/api/users/" + name + "/"))
+            else:
+                results.append((name, owner, "/api/users/" + str(owner) + "/" + kind + "/" + name + "/"))
+        return results
+
+    def indexed(self, kind, id):
+        """
+        Returns (name, owner_id) of the indexed row or None if it is not indexed
+        """
+        if not self.ready:
+            return None
+        with self._lock:
+            return self.indexes[kind].get(id)
+
+
+def init_app(app):
+    """
+    Registers the autocomplete indexes of the app and builds them if the database exists already
+    """
+    autocomplete = Autocomplete()
+    app.extensions["autocomplete"] = autocomplete
+    with app.app_context():
+        try:
+            autocomplete.build()
+        except OperationalError:
+            #  Tables are not created yet, the indexes are built on the first lookup
+            db.session.rollback()
+
+
+def get_autocomplete():
+    return current_app.extensions["autocomplete"]
+
+
+def record_delete(session, obj):
+    """
+    Records the deletion of a user, move or workout done with a set-based DELETE,
+    which the session does not see. Applied to the indexes when the session commits.
+    """
+    session.info.setdefault("autocomplete", []).append((_kind_of(obj), obj.id, None, None))
+
+
+def _kind_of(obj):
+    for kind, model in KINDS.items():
+        if isinstance(obj, model):
+            return kind
+    return None
+
+def _name_of(obj):
+    return obj.username if isinstance(obj, User) else obj.name
+
+def _owner_of(obj):
+    return None if isinstance(obj, User) else obj.user_id
+
+def _known(session, kind, id):
+    """
+    Latest (name, owner_id) of the row, from the changes collected in the session
+    or from the index, None if it is not known
+    """
+    for change in reversed(session.info.get("autocomplete", [])):
+        if change[:2] == (kind, id):
+            return change[2:]
+    if has_app_context() and "autocomplete" in current_app.extensions:
+        return get_autocomplete().indexed(kind, id)
+    return None
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_changes(session, flush_context):
+    changes = session.info.setdefault("autocomplete", [])
+    for obj in session.new:
+        kind = _kind_of(obj)
+        if kind:
+            changes.append((kind, obj.id, _name_of(obj), _owner_of(obj)))
+    for obj in session.dirty:
+        kind = _kind_of(obj)
+        if kind and session.is_modified(obj):
+            state = inspect(obj)
+            name_attr = "username" if kind == "users" else "name"
+            #  WorkoutPlan.touch() flags the name as modified without its old value,
+            #  so the name is compared with the one last indexed before queueing it
+            if state.attrs[name_attr].history.has_changes() or (
+                    kind != "users" and state.attrs.user_id.history.has_changes()):
+                if _known(session, kind, obj.id) != (_name_of(obj), _owner_of(obj)):
+                    changes.append((kind, obj.id, _name_of(obj), _owner_of(obj)))
+    for obj in session.deleted:
+        kind = _kind_of(obj)
+        if kind:
+            changes.append((kind, obj.id, None, None))
+
+@event.listens_for(Session, "after_commit")
+def _apply_changes(session):
+    changes = session.info.pop("autocomplete", None)
+    if changes and has_app_context() and "autocomplete" in current_app.extensions:
+        get_autocomplete().apply(changes)
+
+@event.listens_for(Session, "after_soft_rollback")
+def _discard_changes(session, previous_transaction):
+    session.info.pop("autocomplete", None)
@@ -3,6 +3,7 @@ API_URL = "http://localhost:5000/api"
 MASON = "application/vnd.mason+json"
 ERROR_PROFILE = "/profiles/error/"
 LINK_RELATIONS_URL = "/link-relations/"
+HEALTH_URL = "/health/"
 
 USER_PROFILE_URL = "/profiles/user/"
 MOVE_PROFILE_URL = "/profiles/move/"
@@ -12,4 +13,19 @@ MOVELISTITEM_PROFILE_URL = "/profiles/movelistitem/"
 USER_COLLECTION_PROFILE_URL = "/profiles/usercollection/"
 MOVE_COLLECTION_PROFILE_URL = "/profiles/movecollection/"
 WORKOUT_COLLECTION_PROFILE_URL = "/profiles/workoutcollection/"
-MOVELISTITEM_COLLECTION_PROFILE_URL = "/profiles/movelistitemcollection/"
\ No newline at end of file
+MOVELISTITEM_COLLECTION_PROFILE_URL = "/profiles/movelistitemcollection/"
+
+AUTOCOMPLETE_SIZE = 10
+AUTOCOMPLETE_MAX_SIZE = 100
+
+POPULAR_SIZE = 10
+POPULAR_MAX_SIZE = 100
+
+STATS_TOP_MOVES = 5
+STATS_MAX_TOP_MOVES = 100
+
+PAIRED_SIZE = 10
+PAIRED_MAX_SIZE = 100
+
+EXPAND_MAX_DEPTH = 5
+EXPAND_MAX_ROWS = 1000
@@ -1,8 +1,15 @@
+import hashlib
+import sqlite3
 from enum import unique
 from workoutplanner import db
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event, DDL, text, insert, select, update, delete, literal, case, func, union, exists, and_, or_
+from sqlalchemy.engine import Engine
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.orderinglist import ordering_list
+from sqlalchemy.orm import aliased
+from sqlalchemy.orm.attributes import flag_modified
+from sqlalchemy.orm.exc import StaleDataError
 import json
 import click
 from flask.cli import with_appcontext
@@ -16,9 +23,12 @@ class User(db.Model):
 
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(64), unique=True, nullable=False)
+    version = db.Column(db.Integer, nullable=False, default=1, server_default="1")
 
-    user_moves = db.relationship("Move", back_populates="user")
-    workouts = db.relationship("WorkoutPlan", back_populates="user")
+    user_moves = db.relationship("Move", back_populates="user", passive_deletes=True)
+    workouts = db.relationship("WorkoutPlan", back_populates="user", passive_deletes=True)
+
+    __mapper_args__ = {"version_id_col": version}
     
     def serialize(self):
         return {
@@ -34,6 +44,30 @@ class User(db.Model):
     def get_collection_url(self):
         return "/api/users/"
 
+    def delete(self):
+        """
+        Deletes the user with a single DELETE. The database cascades it to the moves and
+        workouts of the user and to the move list items using those, so none of them
+        are loaded. Workouts of other users that lose moves or sub-plans get their
+        positions compacted.
+        """
+        subplan = aliased(WorkoutPlan)
+        using_moves = select(MoveListItem.plan_id).join(Move, MoveListItem.move_id == Move.id).join(
+            WorkoutPlan, MoveListItem.plan_id == WorkoutPlan.id
+        ).where(Move.user_id == self.id, WorkoutPlan.user_id != self.id)
+        using_workouts = select(MoveListItem.plan_id).join(subplan, MoveListItem.subplan_id == subplan.id).join(
+            WorkoutPlan, MoveListItem.plan_id == WorkoutPlan.id
+        ).where(subplan.user_id == self.id, WorkoutPlan.user_id != self.id)
+        plan_ids = db.session.scalars(union(using_moves, using_workouts)).all()
+
+        result = db.session.execute(
+            delete(User).where(User.id == self.id, User.version == self.version)
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount == 0:
+            raise StaleDataError("The user was changed by another request")
+        WorkoutPlan.compact_positions(plan_ids)
+
     @staticmethod
     def json_schema():
         return json.load(open('workoutplanner/schemas/user_schema.json'))
@@ -45,27 +79,40 @@ class WorkoutPlan(db.Model):
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(64), nullable=False)
+    version = db.Column(db.Integer, nullable=False, default=1, server_default="1")
+    #  Amount of items in the move list, maintained by triggers on move_list_item
+    move_count = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    #  Hash of the ordered (move, repetitions) sequence of the move list, maintained by triggers on move_list_item
+    content_hash = db.Column(db.Integer, nullable=False, default=0, server_default="0")
 
-    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id", ondelete="CASCADE"), nullable=False)
 
     user = db.relationship("User", back_populates="workouts", uselist=False)
     workout_moves = db.relationship("MoveListItem",
                                     back_populates="plan",
+                                    foreign_keys="MoveListItem.plan_id",
                                     cascade="all, delete",
                                     passive_deletes=True,
                                     order_by="MoveListItem.position",
                                     collection_class=ordering_list("position"))
 
-    __table_args__ = (db.UniqueConstraint("name", "user_id", name="_name_user_constraint"),)
+    __table_args__ = (
+        db.UniqueConstraint("name", "user_id", name="_name_user_constraint"),
+        db.Index("ix_workout_plan_user_id_name", "user_id", "name"),
+        db.Index("ix_workout_plan_content_hash", "content_hash", "move_count"),
+    )
+    __mapper_args__ = {"version_id_col": version}
 
     def serialize(self, short_form=False):
         if short_form:
             return {
-                "name": self.name
+                "name": self.name,
+                "move_count": self.move_count
             }
         return {
             "name": self.name,
-            "user": self.user.username
+            "user": self.user.username,
+            "move_count": self.move_count
         }
         
     def deserialize(self, doc):
@@ -78,10 +125,254 @@ class WorkoutPlan(db.Model):
     def get_collection_url(self):
         return "/api/users/" + self.user.username + "/workouts/"
 
+    def clone(self, name, user_id):
+        """
+        Creates a copy of the plan and its move list in the current transaction.
+        The move list items are copied with a single INSERT ... SELECT.
+        """
+        plan = WorkoutPlan(name=name, user_id=user_id)
+        db.session.add(plan)
+        db.session.flush()
+        db.session.execute(
+            insert(MoveListItem).from_select(
+                ["position", "repetitions", "plan_id", "move_id", "subplan_id"],
+                select(
+                    MoveListItem.position,
+                    MoveListItem.repetitions,
+                    literal(plan.id),
+                    MoveListItem.move_id,
+                    MoveListItem.subplan_id
+                ).where(MoveListItem.plan_id == self.id)
+            )
+        )
+        return plan
+
+    def _same_content(self):
+        """
+        Condition matching the plans whose move list has the same items as this plan's
+        at every position. The candidates come from the content hash index, a hash
+        collision is ruled out by this item by item comparison.
+        """
+        mine = aliased(MoveListItem)
+        theirs = aliased(MoveListItem)
+        return and_(
+            WorkoutPlan.content_hash == self.content_hash,
+            WorkoutPlan.move_count == self.move_count,
+            ~exists().where(mine.plan_id == self.id, ~exists().where(
+                theirs.plan_id == WorkoutPlan.id,
+                theirs.position == mine.position,
+                theirs.move_id.is_not_distinct_from(mine.move_id),
+                theirs.subplan_id.is_not_distinct_from(mine.subplan_id),
+                theirs.repetitions.is_not_distinct_from(mine.repetitions)
+            ).correlate_except(theirs)).correlate_except(mine)
+        )
+
+    def identical(self):
+        """
+        Returns a query of the other plans with the same move list
+        """
+        return WorkoutPlan.query.filter(self._same_content(), WorkoutPlan.id != self.id).order_by(WorkoutPlan.id)
+
+    def find_copy(self, user_id):
+        """
+        Returns a plan of the user with the same move list, this plan included, or None
+        """
+        return WorkoutPlan.query.filter(
+            WorkoutPlan.user_id == user_id,
+            or_(WorkoutPlan.id == self.id, self._same_content())
+        ).order_by(WorkoutPlan.id).first()
+
+    def get_move_list(self):
+        """
+        Returns the (position, (move id, sub-plan id), repetitions, URI of the move or
+        sub-plan) tuples of the move list in the order of their positions, with a single query
+        """
+        subplan = aliased(WorkoutPlan)
+        owner = aliased(User)
+        query = (
+            db.session.query(
+                MoveListItem.position, MoveListItem.move_id, MoveListItem.subplan_id, MoveListItem.repetitions,
+                func.coalesce(Move.name, subplan.name), owner.username
+            )
+            .outerjoin(Move, MoveListItem.move_id == Move.id)
+            .outerjoin(subplan, MoveListItem.subplan_id == subplan.id)
+            .join(owner, owner.id == func.coalesce(Move.user_id, subplan.user_id))
+            .filter(MoveListItem.plan_id == self.id)
+            .order_by(MoveListItem.position, MoveListItem.id)
+        )
+        return [
+            (
+                position, (move_id, subplan_id), repetitions,
+                "/api/users/" + username + ("/moves/" if move_id is not None else "/workouts/") + name + "/"
+            )
+            for position, move_id, subplan_id, repetitions, name, username in query
+        ]
+
+    def creates_cycle(self, subplan_id):
+        """
+        Whether adding the plan with the given id to this plan's move list would make
+        the plan contain itself. The plans reachable from the sub-plan are found with
+        one recursive query.
+        """
+        result = db.session.execute(text(
+            "WITH RECURSIVE reachable(id) AS ("
+            "SELECT :subplan_id UNION "
+            "SELECT move_list_item.subplan_id FROM move_list_item JOIN reachable ON move_list_item.plan_id = reachable.id "
+            "WHERE move_list_item.subplan_id IS NOT NULL"
+            ") SELECT 1 FROM reachable WHERE id = :plan_id LIMIT 1"
+        ), {"subplan_id": subplan_id, "plan_id": self.id})
+        return result.first() is not None
+
+    def expand(self, max_depth, max_rows):
+        """
+        Flattens the move list and the move lists of its sub-plans, down to max_depth
+        levels of nesting, with a single recursive query. The rows come in the order a
+        workout goes through them, a sub-plan followed by its items. The recursion takes
+        the rows in that order too, so when it stops at max_rows the rows are the first
+        ones of the workout instead of a cut through one level of nesting.
+        : return: tuple of (list of row mappings, whether the rows were cut at max_rows)
+        """
+        rows = db.session.execute(text(
+            "WITH RECURSIVE flat(depth, path, item_id, plan_id, position, move_id, subplan_id, repetitions) AS ("
+            "SELECT 0, printf('%06d', position), id, plan_id, position, move_id, subplan_id, repetitions "
+            "FROM move_list_item WHERE plan_id = :plan_id "
+            "UNION ALL "
+            "SELECT flat.depth + 1, flat.path || '.' || printf('%06d', item.position), item.id, item.plan_id, "
+            "item.position, item.move_id, item.subplan_id, item.repetitions "
+            "FROM move_list_item AS item JOIN flat ON item.plan_id = flat.subplan_id "
+            "WHERE flat.depth < :max_depth "
+            "ORDER BY 2 LIMIT :limit"
+            ") SELECT flat.depth, flat.path, flat.position, flat.repetitions, flat.move_id, flat.subplan_id, "
+            "coalesce(move.name, subplan.name) AS name, owner.username AS owner, "
+            "plan.name AS plan_name, plan_owner.username AS plan_owner "
+            "FROM flat "
+            "LEFT JOIN move ON move.id = flat.move_id "
+            "LEFT JOIN workout_plan AS subplan ON subplan.id = flat.subplan_id "
+            "JOIN user AS owner ON owner.id = coalesce(move.user_id, subplan.user_id) "
+            "JOIN workout_plan AS plan ON plan.id = flat.plan_id "
+            "JOIN user AS plan_owner ON plan_owner.id = plan.user_id "
+            "ORDER BY flat.path"
+        ), {"plan_id": self.id, "max_depth": max_depth, "limit": max_rows + 1}).mappings().all()
+        return rows[:max_rows], len(rows) > max_rows
+
+    def delete(self):
+        """
+        Deletes the plan with a single DELETE, the database cascades it to the move list
+        and to the items using the plan as a sub-plan, whose plans get their positions compacted
+        """
+        plan_ids = db.session.scalars(
+            select(MoveListItem.plan_id).where(MoveListItem.subplan_id == self.id).distinct()
+        ).all()
+        result = db.session.execute(
+            delete(WorkoutPlan).where(WorkoutPlan.id == self.id, WorkoutPlan.version == self.version)
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount == 0:
+            raise StaleDataError("The workout was changed by another request")
+        WorkoutPlan.compact_positions(plan_ids)
+
+    def touch(self):
+        """
+        Marks the plan as changed when its move list changes. The flush bumps the version
+        of the plan with a conditional UPDATE, which fails if another request changed the
+        move list after this one read the plan.
+        """
+        flag_modified(self, "name")
+
+    @staticmethod
+    def compact_positions(plan_ids):
+        """
+        Renumbers the move list positions of the given plans to 0..n-1 keeping their order,
+        with one UPDATE over a window function
+        """
+        if not plan_ids:
+            return
+        db.session.execute(
+            text(
+                "UPDATE move_list_item SET position = ranked.position FROM ("
+                "SELECT id, row_number() OVER (PARTITION BY plan_id ORDER BY position, id) - 1 AS position "
+                "FROM move_list_item WHERE plan_id IN (SELECT value FROM json_each(:plan_ids))"
+                ") AS ranked WHERE move_list_item.id = ranked.id AND move_list_item.position != ranked.position"
+            ),
+            {"plan_ids": json.dumps(list(plan_ids))}
+        )
+
+    @staticmethod
+    def search_by_moves(include, exclude=(), match_all=True, offset=0, limit=None):
+        """
+        Finds the workouts containing the included moves and none of the excluded
+        ones. With match_all every included move has to be in the workout, otherwise
+        any of them is enough and the workouts are ranked by the amount of included
+        moves they contain. The plans are grouped, counted and paginated in the
+        database from the (move_id, plan_id) index.
+        : param include: ids of the included moves
+        : param exclude: ids of the excluded moves
+        : return: tuple of (list of (plan id, overlap) tuples of the page, largest overlap
+        first, then by id, and the amount of matching workouts)
+        """
+        include, exclude = set(include), set(exclude)
+        if not include:
+            return [], 0
+        overlap = func.count(MoveListItem.move_id.distinct()).label("overlap")
+        ranked = (
+            select(MoveListItem.plan_id, overlap)
+            .where(MoveListItem.move_id.in_(include))
+            .group_by(MoveListItem.plan_id)
+        )
+        if match_all:
+            ranked = ranked.having(overlap == len(include))
+        if exclude:
+            excluded = aliased(MoveListItem)
+            ranked = ranked.where(~exists().where(
+                excluded.plan_id == MoveListItem.plan_id, excluded.move_id.in_(exclude)
+            ))
+        ranked = ranked.subquery()
+
+        total = db.session.scalar(select(func.count()).select_from(ranked))
+        page = select(ranked.c.plan_id, ranked.c.overlap).order_by(ranked.c.overlap.desc(), ranked.c.plan_id)
+        page = page.offset(offset).limit(limit)
+        return [tuple(row) for row in db.session.execute(page)], total
+
+    def get_move_ids(self):
+        """
+        Returns the ids of the move list items in the order of their positions
+        """
+        query = db.session.query(MoveListItem.id).filter_by(plan_id=self.id)
+        return [row[0] for row in query.order_by(MoveListItem.position, MoveListItem.id)]
+
+    def set_move_order(self, ids):
+        """
+        Rewrites the positions of the move list items so that they follow the order
+        of the given ids. The rewrite is a single UPDATE and leaves positions contiguous.
+        """
+        self.set_move_positions({id: position for position, id in enumerate(ids)})
+
+    def set_move_positions(self, positions):
+        """
+        Sets the positions of the move list items given as a dictionary of ids to positions
+        with a single UPDATE
+        """
+        if not positions:
+            return
+        db.session.execute(
+            update(MoveListItem)
+            .where(MoveListItem.plan_id == self.id, MoveListItem.id.in_(positions))
+            .values(position=case(positions, value=MoveListItem.id))
+            .execution_options(synchronize_session=False)
+        )
+
     @staticmethod
     def json_schema():
         return json.load(open('workoutplanner/schemas/workout_plan_schema.json'))
 
+    @staticmethod
+    def patch_json_schema():
+        return json.load(open('workoutplanner/schemas/workout_plan_patch_schema.json'))
+
+    @staticmethod
+    def clone_json_schema():
+        return json.load(open('workoutplanner/schemas/workout_plan_clone_schema.json'))
+
 class MoveListItem(db.Model):
     """
     Database model for MoveListItem. Is an instance of a list item in a workout plan.
@@ -91,25 +382,47 @@ class MoveListItem(db.Model):
     position = db.Column(db.Integer, nullable=False)
 
     repetitions = db.Column(db.Integer)
+    version = db.Column(db.Integer, nullable=False, default=1, server_default="1")
 
     plan_id = db.Column(db.Integer, db.ForeignKey("workout_plan.id", ondelete="CASCADE"), nullable=False)
-    move_id = db.Column(db.Integer, db.ForeignKey("move.id"), nullable=False)
+    #  An item is either a move or another workout plan done as a part of this one, e.g. a circuit
+    move_id = db.Column(db.Integer, db.ForeignKey("move.id", ondelete="CASCADE"))
+    subplan_id = db.Column(db.Integer, db.ForeignKey("workout_plan.id", ondelete="CASCADE"))
 
     move = db.relationship("Move", back_populates="workout_move", uselist=False)
-    plan = db.relationship("WorkoutPlan", back_populates="workout_moves", uselist=False)
+    plan = db.relationship("WorkoutPlan", back_populates="workout_moves", foreign_keys=[plan_id], uselist=False)
+    subplan = db.relationship("WorkoutPlan", foreign_keys=[subplan_id], uselist=False)
+
+    __table_args__ = (
+        db.CheckConstraint("(move_id IS NULL) != (subplan_id IS NULL)", name="_move_or_subplan_constraint"),
+        db.Index("ix_move_list_item_plan_id_position", "plan_id", "position"),
+        db.Index("ix_move_list_item_move_id_plan_id", "move_id", "plan_id"),
+        db.Index("ix_move_list_item_subplan_id", "subplan_id"),
+    )
+    __mapper_args__ = {"version_id_col": version}
 
     def serialize(self, short_form=False):
         if short_form:
+            if self.subplan_id is not None:
+                return {
+                    "position": self.position,
+                    "workout": self.subplan.name
+                }
             return {
                 "position": self.position,
                 "move": self.move.name
             }
-        return {
+        doc = {
             "position": self.position,
             "repetitions": self.repetitions,
-            "plan": self.plan.name,
-            "move": self.move.name
+            "plan": self.plan.name
         }
+        if self.subplan_id is not None:
+            doc["workout"] = self.subplan.name
+            doc["workout_creator"] = self.subplan.user.username
+        else:
+            doc["move"] = self.move.name
+        return doc
         
     def deserialize(self, doc):
         self.position = doc["position"]
@@ -127,6 +440,10 @@ class MoveListItem(db.Model):
     def json_schema():
         return json.load(open('workoutplanner/schemas/move_list_item_schema.json'))
 
+    @staticmethod
+    def order_json_schema():
+        return json.load(open('workoutplanner/schemas/move_list_order_schema.json'))
+
 class Move(db.Model):
     """
     Database model for Move. Includes references to the creator of the move information about the move.
@@ -135,23 +452,35 @@ class Move(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(64), nullable=False)
     description = db.Column(db.String(256), nullable=False)
+    version = db.Column(db.Integer, nullable=False, default=1, server_default="1")
+    #  Amount of distinct workouts using the move, maintained by triggers on move_list_item
+    workout_count = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    #  Amount of move list items using the move, maintained by triggers on move_list_item
+    item_count = db.Column(db.Integer, nullable=False, default=0, server_default="0")
 
-    user_id = db.Column(db.Integer, db.ForeignKey("user.id"))
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id", ondelete="CASCADE"))
 
     user = db.relationship("User", back_populates="user_moves", uselist=False)
-    workout_move = db.relationship("MoveListItem", back_populates="move")
+    workout_move = db.relationship("MoveListItem", back_populates="move", passive_deletes=True)
 
-    __table_args__ = (db.UniqueConstraint("name", "user_id", name="_name_user_constraint"),)
+    __table_args__ = (
+        db.UniqueConstraint("name", "user_id", name="_name_user_constraint"),
+        db.Index("ix_move_user_id_name", "user_id", "name"),
+        db.Index("ix_move_item_count", "item_count", "id"),
+    )
+    __mapper_args__ = {"version_id_col": version}
 
     def serialize(self, short_form=False):
         if short_form:
             return {
                 "name": self.name,
+                "workout_count": self.workout_count
             }
         return {
             "name": self.name,
             "description": self.description,
-            "user": self.user.username
+            "user": self.user.username,
+            "workout_count": self.workout_count
         }
         
     def deserialize(self, doc):
@@ -171,6 +500,466 @@ class Move(db.Model):
         return json.load(open('workoutplanner/schemas/move_schema.json'))
 
 
+    @staticmethod
+    def popular(limit):
+        """
+        The most used moves of all workouts. Reads the first rows of the
+        item_count index backwards, so the cost depends only on the limit.
+        """
+        return (
+            Move.query.filter(Move.item_count > 0)
+            .order_by(Move.item_count.desc(), Move.id.desc())
+            .limit(limit)
+            .all()
+        )
+
+    @staticmethod
+    def search(query, user_id=None, offset=0, limit=None):
+        """
+        Full-text search over move names and descriptions using the move_fts index.
+        Returns the matching moves ordered by relevance, names weighing more than descriptions.
+        """
+        statement = (
+            "SELECT move.id FROM move_fts JOIN move ON move.id = move_fts.rowid "
+            "WHERE move_fts MATCH :query"
+        )
+        params = {"query": query, "offset": offset, "limit": -1 if limit is None else limit}
+        if user_id is not None:
+            statement += " AND move.user_id = :user_id"
+            params["user_id"] = user_id
+        statement += " ORDER BY bm25(move_fts, 10.0, 1.0) LIMIT :limit OFFSET :offset"
+
+        ids = [row[0] for row in db.session.execute(text(statement), params)]
+        moves = {move.id: move for move in Move.query.filter(Move.id.in_(ids)).all()}
+        return [moves[move_id] for move_id in ids]
+
+
+class PlanMoveStats(db.Model):
+    """
+    Summary of the uses of a move in a workout plan, maintained by triggers on move_list_item
+    """
+
+    plan_id = db.Column(db.Integer, db.ForeignKey("workout_plan.id", ondelete="CASCADE"), primary_key=True)
+    move_id = db.Column(db.Integer, db.ForeignKey("move.id", ondelete="CASCADE"), primary_key=True)
+    uses = db.Column(db.Integer, nullable=False, default=0)
+    repetitions = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (db.Index("ix_plan_move_stats_plan_id_uses", "plan_id", "uses"),)
+
+    @staticmethod
+    def summary(plan, top=5):
+        """
+        Statistics of a workout plan read from the summary table
+        """
+        total_repetitions, distinct_moves = db.session.query(
+            db.func.coalesce(db.func.sum(PlanMoveStats.repetitions), 0),
+            db.func.count()
+        ).filter(PlanMoveStats.plan_id == plan.id).one()
+        most_used = (
+            db.session.query(Move, PlanMoveStats.uses, PlanMoveStats.repetitions)
+            .join(PlanMoveStats, PlanMoveStats.move_id == Move.id)
+            .filter(PlanMoveStats.plan_id == plan.id)
+            .order_by(PlanMoveStats.uses.desc(), Move.id)
+            .limit(top)
+        )
+        return {
+            "length": plan.move_count,
+            "total_repetitions": total_repetitions,
+            "distinct_moves": distinct_moves,
+        }, most_used.all()
+
+class UserMoveStats(db.Model):
+    """
+    Summary of the uses of a move in all workout plans of a user, maintained by triggers on move_list_item
+    """
+
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id", ondelete="CASCADE"), primary_key=True)
+    move_id = db.Column(db.Integer, db.ForeignKey("move.id", ondelete="CASCADE"), primary_key=True)
+    uses = db.Column(db.Integer, nullable=False, default=0)
+    repetitions = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (db.Index("ix_user_move_stats_user_id_uses", "user_id", "uses"),)
+
+    @staticmethod
+    def summary(user, top=5):
+        """
+        Statistics of all workout plans of a user read from the summary tables
+        """
+        total_repetitions, distinct_moves = db.session.query(
+            db.func.coalesce(db.func.sum(UserMoveStats.repetitions), 0),
+            db.func.count()
+        ).filter(UserMoveStats.user_id == user.id).one()
+        lengths = (
+            db.session.query(UserPlanLength.length, UserPlanLength.plans)
+            .filter(UserPlanLength.user_id == user.id, UserPlanLength.plans > 0)
+            .order_by(UserPlanLength.length)
+            .all()
+        )
+        most_used = (
+            db.session.query(Move, UserMoveStats.uses, UserMoveStats.repetitions)
+            .join(UserMoveStats, UserMoveStats.move_id == Move.id)
+            .filter(UserMoveStats.user_id == user.id)
+            .order_by(UserMoveStats.uses.desc(), Move.id)
+            .limit(top)
+        )
+        return {
+            "workouts": sum(plans for _, plans in lengths),
+            "total_repetitions": total_repetitions,
+            "distinct_moves": distinct_moves,
+            "length_distribution": [{"length": length, "workouts": plans} for length, plans in lengths],
+        }, most_used.all()
+
+class UserPlanLength(db.Model):
+    """
+    Amount of workout plans of a user by their length, maintained by triggers on workout_plan
+    """
+
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id", ondelete="CASCADE"), primary_key=True)
+    length = db.Column(db.Integer, primary_key=True)
+    plans = db.Column(db.Integer, nullable=False, default=0)
+
+class WorkoutSession(db.Model):
+    """
+    A performed workout. Sessions are only ever added, the workout plan is
+    forgotten if it is deleted but the session stays in the history.
+    """
+
+    id = db.Column(db.Integer, primary_key=True)
+    performed_at = db.Column(db.DateTime, nullable=False)
+
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id", ondelete="CASCADE"), nullable=False)
+    plan_id = db.Column(db.Integer, db.ForeignKey("workout_plan.id", ondelete="SET NULL"))
+
+    user = db.relationship("User", uselist=False)
+    plan = db.relationship("WorkoutPlan", uselist=False)
+
+    __table_args__ = (db.Index("ix_workout_session_user_id_performed_at", "user_id", "performed_at"),)
+
+    def serialize(self):
+        return {
+            "id": self.id,
+            "performed_at": self.performed_at.isoformat(),
+            "workout": self.plan.name if self.plan else None
+        }
+
+    def get_url(self):
+        return "/api/users/" + self.user.username + "/sessions/" + str(self.id) + "/"
+
+    @staticmethod
+    def json_schema():
+        return json.load(open('workoutplanner/schemas/workout_session_schema.json'))
+
+class SetLog(db.Model):
+    """
+    Repetitions actually done of a move list item during a session. The log is
+    append-only, the rows are indexed by the user and the time like the sessions.
+    """
+
+    id = db.Column(db.Integer, primary_key=True)
+    performed_at = db.Column(db.DateTime, nullable=False)
+    position = db.Column(db.Integer, nullable=False)
+    repetitions = db.Column(db.Integer, nullable=False)
+
+    session_id = db.Column(db.Integer, db.ForeignKey("workout_session.id", ondelete="CASCADE"), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id", ondelete="CASCADE"), nullable=False)
+    move_id = db.Column(db.Integer, db.ForeignKey("move.id", ondelete="SET NULL"))
+
+    session = db.relationship("WorkoutSession", uselist=False)
+    move = db.relationship("Move", uselist=False)
+
+    __table_args__ = (
+        db.Index("ix_set_log_user_id_performed_at", "user_id", "performed_at"),
+        db.Index("ix_set_log_session_id", "session_id"),
+    )
+
+    def serialize(self):
+        return {
+            "performed_at": self.performed_at.isoformat(),
+            "position": self.position,
+            "move": self.move.name if self.move else None,
+            "repetitions": self.repetitions
+        }
+
+    @staticmethod
+    def json_schema():
+        return json.load(open('workoutplanner/schemas/set_log_schema.json'))
+
+#  Lengths of the periods of the activity history
+HISTORY_PERIODS = ("day", "week", "month")
+
+class ActivityRollup(db.Model):
+    """
+    Sessions, sets and repetitions of a user per day, week (starting on Monday)
+    and month, maintained by triggers on workout_session and set_log
+    """
+
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id", ondelete="CASCADE"), primary_key=True)
+    period = db.Column(db.String(8), primary_key=True)
+    start = db.Column(db.Date, primary_key=True)
+    sessions = db.Column(db.Integer, nullable=False, default=0)
+    sets = db.Column(db.Integer, nullable=False, default=0)
+    repetitions = db.Column(db.Integer, nullable=False, default=0)
+
+    @staticmethod
+    def history(user, period, start=None, end=None):
+        """
+        The activity of the user per period between the start and end dates, read from the rollups
+        """
+        query = ActivityRollup.query.filter_by(user_id=user.id, period=period)
+        if start is not None:
+            query = query.filter(ActivityRollup.start >= start)
+        if end is not None:
+            query = query.filter(ActivityRollup.start <= end)
+        return query.order_by(ActivityRollup.start).all()
+
+class WriteCounter(db.Model):
+    """
+    Counters that only grow, bumped by triggers on every write to the tables they
+    count. A cache of data derived from the tables is valid while the counter
+    has the value it had when the data was read.
+    """
+
+    name = db.Column(db.String(32), primary_key=True)
+    value = db.Column(db.Integer, nullable=False, default=0)
+
+    @staticmethod
+    def current(name):
+        return db.session.scalar(select(WriteCounter.value).where(WriteCounter.name == name)) or 0
+
+    @staticmethod
+    def owner_name(name, user_id):
+        """
+        Name of the counter of the rows owned by a user, the counter of all rows
+        is the plain name
+        """
+        return f"{name}:{user_id}"
+
+
+#  The content hash of a plan is the sum of the hashes of its items modulo a
+#  Mersenne prime. Every item is hashed together with its position, so the sum
+#  depends on the order, and adding, removing or changing an item only adds or
+#  subtracts the hashes of the rows that changed instead of rehashing the plan.
+CONTENT_HASH_MODULUS = 2 ** 61 - 1
+
+def item_hash(position, move_id, repetitions, subplan_id=None):
+    """
+    Hash of a move list item at a position, in the range of CONTENT_HASH_MODULUS
+    """
+    item = f"{position}:{move_id}:{repetitions}" if subplan_id is None else f"{position}:plan{subplan_id}:{repetitions}"
+    digest = hashlib.blake2b(item.encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big") % CONTENT_HASH_MODULUS
+
+@event.listens_for(Engine, "connect")
+def _register_functions(dbapi_connection, connection_record):
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        dbapi_connection.create_function("item_hash", 4, item_hash, deterministic=True)
+
+#  SQLite only enforces foreign keys, and so the ON DELETE CASCADE rules, when asked to
+@event.listens_for(Engine, "connect")
+def _enable_foreign_keys(dbapi_connection, connection_record):
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA foreign_keys=ON")
+        cursor.close()
+
+
+#  Full-text index of the moves. The index is an external content FTS5 table,
+#  it does not store a copy of the rows but is kept in sync with the move table by triggers.
+MOVE_SEARCH_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS move_fts USING fts5("
+    "name, description, content='move', content_rowid='id')",
+    "CREATE TRIGGER IF NOT EXISTS move_fts_insert AFTER INSERT ON move BEGIN "
+    "INSERT INTO move_fts(rowid, name, description) VALUES (new.id, new.name, new.description); "
+    "END",
+    "CREATE TRIGGER IF NOT EXISTS move_fts_delete AFTER DELETE ON move BEGIN "
+    "INSERT INTO move_fts(move_fts, rowid, name, description) VALUES ('delete', old.id, old.name, old.description); "
+    "END",
+    "CREATE TRIGGER IF NOT EXISTS move_fts_update AFTER UPDATE OF name, description ON move BEGIN "
+    "INSERT INTO move_fts(move_fts, rowid, name, description) VALUES ('delete', old.id, old.name, old.description); "
+    "INSERT INTO move_fts(rowid, name, description) VALUES (new.id, new.name, new.description); "
+    "END",
+]
+
+for statement in MOVE_SEARCH_DDL:
+    event.listen(Move.__table__, "after_create", DDL(statement).execute_if(dialect="sqlite"))
+event.listen(Move.__table__, "before_drop", DDL("DROP TABLE IF EXISTS move_fts").execute_if(dialect="sqlite"))
+
+#  Counters of the move lists. Every change of a move_list_item row updates
+#  workout_plan.move_count, move.item_count and move.workout_count in the same
+#  statement, so ORM writes, set-based writes and foreign key cascades all keep
+#  them right. For workout_count a move counts once per workout however many
+#  times the workout uses it.
+_ADD_ITEM_COUNTS = (
+    "UPDATE workout_plan SET move_count = move_count + 1 WHERE id = new.plan_id; "
+    "UPDATE move SET item_count = item_count + 1 WHERE id = new.move_id; "
+    "UPDATE move SET workout_count = workout_count + 1 WHERE id = new.move_id AND NOT EXISTS ("
+    "SELECT 1 FROM move_list_item WHERE plan_id = new.plan_id AND move_id = new.move_id AND id != new.id); "
+)
+_REMOVE_ITEM_COUNTS = (
+    "UPDATE workout_plan SET move_count = move_count - 1 WHERE id = old.plan_id; "
+    "UPDATE move SET item_count = item_count - 1 WHERE id = old.move_id; "
+    "UPDATE move SET workout_count = workout_count - 1 WHERE id = old.move_id AND NOT EXISTS ("
+    "SELECT 1 FROM move_list_item WHERE plan_id = old.plan_id AND move_id = old.move_id AND id != old.id); "
+)
+MOVE_COUNT_DDL = [
+    "CREATE TRIGGER IF NOT EXISTS move_list_item_count_insert AFTER INSERT ON move_list_item BEGIN "
+    + _ADD_ITEM_COUNTS + "END",
+    "CREATE TRIGGER IF NOT EXISTS move_list_item_count_delete AFTER DELETE ON move_list_item BEGIN "
+    + _REMOVE_ITEM_COUNTS + "END",
+    "CREATE TRIGGER IF NOT EXISTS move_list_item_count_update AFTER UPDATE OF plan_id, move_id ON move_list_item "
+    "WHEN old.plan_id IS NOT new.plan_id OR old.move_id IS NOT new.move_id BEGIN "
+    + _REMOVE_ITEM_COUNTS + _ADD_ITEM_COUNTS + "END",
+]
+
+for statement in MOVE_COUNT_DDL:
+    event.listen(MoveListItem.__table__, "after_create", DDL(statement).execute_if(dialect="sqlite"))
+
+#  Content hashes of the plans, see item_hash. The DDL text is a format string, so the modulo is %%
+_ADD_ITEM_HASH = (
+    f"UPDATE workout_plan SET content_hash = (content_hash + item_hash(new.position, new.move_id, new.repetitions, new.subplan_id)) "
+    f"%% {CONTENT_HASH_MODULUS} WHERE id = new.plan_id; "
+)
+_REMOVE_ITEM_HASH = (
+    f"UPDATE workout_plan SET content_hash = (content_hash - item_hash(old.position, old.move_id, old.repetitions, old.subplan_id) "
+    f"+ {CONTENT_HASH_MODULUS}) %% {CONTENT_HASH_MODULUS} WHERE id = old.plan_id; "
+)
+CONTENT_HASH_DDL = [
+    "CREATE TRIGGER IF NOT EXISTS move_list_item_hash_insert AFTER INSERT ON move_list_item BEGIN "
+    + _ADD_ITEM_HASH + "END",
+    "CREATE TRIGGER IF NOT EXISTS move_list_item_hash_delete AFTER DELETE ON move_list_item BEGIN "
+    + _REMOVE_ITEM_HASH + "END",
+    "CREATE TRIGGER IF NOT EXISTS move_list_item_hash_update AFTER UPDATE OF plan_id, position, move_id, subplan_id, repetitions "
+    "ON move_list_item BEGIN " + _REMOVE_ITEM_HASH + _ADD_ITEM_HASH + "END",
+]
+
+for statement in CONTENT_HASH_DDL:
+    event.listen(MoveListItem.__table__, "after_create", DDL(statement).execute_if(dialect="sqlite"))
+
+#  Statistics summary tables. Adding or removing an item changes the summary
+#  rows of its (plan, move) and (plan owner, move) pairs, and the changes of
+#  workout_plan.move_count move the plan between the length buckets of its
+#  owner. When a plan is deleted its items are removed by the cascade after
+#  the plan row is gone, so the owner's summary is updated from the plan's
+#  summary before the plan is deleted.
+#  Sub-plan items are not moves and have no statistics of their own.
+_ADD_ITEM_STATS = (
+    "INSERT INTO plan_move_stats (plan_id, move_id, uses, repetitions) "
+    "SELECT new.plan_id, new.move_id, 1, coalesce(new.repetitions, 0) WHERE new.move_id IS NOT NULL "
+    "ON CONFLICT (plan_id, move_id) DO UPDATE SET uses = uses + 1, repetitions = repetitions + excluded.repetitions; "
+    "INSERT INTO user_move_stats (user_id, move_id, uses, repetitions) "
+    "SELECT user_id, new.move_id, 1, coalesce(new.repetitions, 0) FROM workout_plan "
+    "WHERE id = new.plan_id AND new.move_id IS NOT NULL "
+    "ON CONFLICT (user_id, move_id) DO UPDATE SET uses = uses + 1, repetitions = repetitions + excluded.repetitions; "
+)
+_REMOVE_ITEM_STATS = (
+    "UPDATE plan_move_stats SET uses = uses - 1, repetitions = repetitions - coalesce(old.repetitions, 0) "
+    "WHERE plan_id = old.plan_id AND move_id = old.move_id; "
+    "DELETE FROM plan_move_stats WHERE plan_id = old.plan_id AND move_id = old.move_id AND uses <= 0; "
+    "UPDATE user_move_stats SET uses = uses - 1, repetitions = repetitions - coalesce(old.repetitions, 0) "
+    "WHERE user_id = (SELECT user_id FROM workout_plan WHERE id = old.plan_id) AND move_id = old.move_id; "
+    "DELETE FROM user_move_stats WHERE user_id = (SELECT user_id FROM workout_plan WHERE id = old.plan_id) "
+    "AND move_id = old.move_id AND uses <= 0; "
+)
+_ADD_PLAN_LENGTH = (
+    "INSERT INTO user_plan_length (user_id, length, plans) VALUES (new.user_id, new.move_count, 1) "
+    "ON CONFLICT (user_id, length) DO UPDATE SET plans = plans + 1; "
+)
+_REMOVE_PLAN_LENGTH = (
+    "UPDATE user_plan_length SET plans = plans - 1 WHERE user_id = old.user_id AND length = old.move_count; "
+    "DELETE FROM user_plan_length WHERE user_id = old.user_id AND length = old.move_count AND plans <= 0; "
+)
+STATS_DDL = {MoveListItem.__table__: [
+    "CREATE TRIGGER IF NOT EXISTS move_list_item_stats_insert AFTER INSERT ON move_list_item BEGIN "
+    + _ADD_ITEM_STATS + "END",
+    "CREATE TRIGGER IF NOT EXISTS move_list_item_stats_delete AFTER DELETE ON move_list_item BEGIN "
+    + _REMOVE_ITEM_STATS + "END",
+    "CREATE TRIGGER IF NOT EXISTS move_list_item_stats_update AFTER UPDATE OF plan_id, move_id, repetitions "
+    "ON move_list_item BEGIN " + _REMOVE_ITEM_STATS + _ADD_ITEM_STATS + "END",
+], WorkoutPlan.__table__: [
+    "CREATE TRIGGER IF NOT EXISTS workout_plan_stats_insert AFTER INSERT ON workout_plan BEGIN "
+    + _ADD_PLAN_LENGTH + "END",
+    "CREATE TRIGGER IF NOT EXISTS workout_plan_stats_update AFTER UPDATE OF move_count, user_id ON workout_plan "
+    "BEGIN " + _REMOVE_PLAN_LENGTH + _ADD_PLAN_LENGTH + "END",
+    "CREATE TRIGGER IF NOT EXISTS workout_plan_stats_delete BEFORE DELETE ON workout_plan BEGIN "
+    + _REMOVE_PLAN_LENGTH +
+    "UPDATE user_move_stats SET uses = user_move_stats.uses - p.uses, "
+    "repetitions = user_move_stats.repetitions - p.repetitions "
+    "FROM plan_move_stats AS p WHERE p.plan_id = old.id "
+    "AND user_move_stats.user_id = old.user_id AND user_move_stats.move_id = p.move_id; "
+    "DELETE FROM user_move_stats WHERE user_id = old.user_id AND uses <= 0; "
+    "END",
+]}
+
+for table, statements in STATS_DDL.items():
+    for statement in statements:
+        event.listen(table, "after_create", DDL(statement).execute_if(dialect="sqlite"))
+
+#  Activity rollups. Every new session and set is added to the rollup rows of
+#  its day, week and month, so reading a history never touches the logs.
+_ROLLUP_PERIODS = (
+    "SELECT 'day' AS period, date(new.performed_at) AS start "
+    "UNION ALL SELECT 'week', date(new.performed_at, 'weekday 0', '-6 days') "
+    "UNION ALL SELECT 'month', date(new.performed_at, 'start of month')"
+)
+
+def _add_to_rollups(sessions, sets, repetitions):
+    return (
+        "INSERT INTO activity_rollup (user_id, period, start, sessions, sets, repetitions) "
+        f"SELECT new.user_id, period, start, {sessions}, {sets}, {repetitions} FROM ({_ROLLUP_PERIODS}) WHERE true "
+        "ON CONFLICT (user_id, period, start) DO UPDATE SET sessions = sessions + excluded.sessions, "
+        "sets = sets + excluded.sets, repetitions = repetitions + excluded.repetitions; "
+    )
+
+HISTORY_DDL = {WorkoutSession.__table__: [
+    "CREATE TRIGGER IF NOT EXISTS workout_session_rollup AFTER INSERT ON workout_session BEGIN "
+    + _add_to_rollups(1, 0, 0) + "END",
+    "CREATE TRIGGER IF NOT EXISTS workout_session_append_only BEFORE UPDATE OF performed_at, user_id "
+    "ON workout_session BEGIN SELECT RAISE(ABORT, 'sessions can not be changed'); END",
+], SetLog.__table__: [
+    "CREATE TRIGGER IF NOT EXISTS set_log_rollup AFTER INSERT ON set_log BEGIN "
+    + _add_to_rollups(0, 1, "new.repetitions") + "END",
+    "CREATE TRIGGER IF NOT EXISTS set_log_append_only BEFORE UPDATE OF performed_at, position, repetitions, "
+    "session_id, user_id ON set_log BEGIN SELECT RAISE(ABORT, 'set logs can not be changed'); END",
+]}
+
+for table, statements in HISTORY_DDL.items():
+    for statement in statements:
+        event.listen(table, "after_create", DDL(statement).execute_if(dialect="sqlite"))
+
+#  Writes to the move lists, including foreign key cascades and set-based updates.
+#  The move_list counter counts the writes to all move lists and move_list:<user id>
+#  the writes to the move lists of the user's plans, so a user's writes leave the
+#  caches of the other users valid. When a plan is deleted its items are removed
+#  by the cascade after the plan row is gone, so the owner's counter is bumped by
+#  the plan's delete instead.
+_BUMP_MOVE_LIST_WRITES = "UPDATE write_counter SET value = value + 1 WHERE name = 'move_list'; "
+
+def _bump_owner_writes(plan_id, condition="true"):
+    return (
+        "INSERT INTO write_counter (name, value) SELECT 'move_list:' || user_id, 1 FROM workout_plan "
+        f"WHERE id = {plan_id} AND {condition} ON CONFLICT (name) DO UPDATE SET value = value + 1; "
+    )
+
+WRITE_COUNTER_DDL = {WriteCounter.__table__: [
+    "INSERT OR IGNORE INTO write_counter (name, value) VALUES ('move_list', 0)",
+], MoveListItem.__table__: [
+    "CREATE TRIGGER IF NOT EXISTS move_list_item_writes_insert AFTER INSERT ON move_list_item BEGIN "
+    + _BUMP_MOVE_LIST_WRITES + _bump_owner_writes("new.plan_id") + "END",
+    "CREATE TRIGGER IF NOT EXISTS move_list_item_writes_delete AFTER DELETE ON move_list_item BEGIN "
+    + _BUMP_MOVE_LIST_WRITES + _bump_owner_writes("old.plan_id") + "END",
+    "CREATE TRIGGER IF NOT EXISTS move_list_item_writes_update AFTER UPDATE ON move_list_item BEGIN "
+    + _BUMP_MOVE_LIST_WRITES + _bump_owner_writes("new.plan_id")
+    + _bump_owner_writes("old.plan_id", condition="old.plan_id != new.plan_id") + "END",
+], WorkoutPlan.__table__: [
+    "CREATE TRIGGER IF NOT EXISTS workout_plan_writes_delete AFTER DELETE ON workout_plan BEGIN "
+    "INSERT INTO write_counter (name, value) VALUES ('move_list:' || old.user_id, 1) "
+    "ON CONFLICT (name) DO UPDATE SET value = value + 1; END",
+]}
+
+for table, statements in WRITE_COUNTER_DDL.items():
+    for statement in statements:
+        event.listen(table, "after_create", DDL(statement).execute_if(dialect="sqlite"))
+
 
 # Utility functions to create and populate a database
 @click.command("init-db")
@@ -178,9 +967,109 @@ class Move(db.Model):
 def initialize_db_command():
     db.create_all()
 
+@click.command("rebuild-search-index")
+@with_appcontext
+def rebuild_search_index_command():
+    db.session.execute(text("INSERT INTO move_fts(move_fts) VALUES ('rebuild')"))
+    db.session.commit()
+
+@click.command("repair-counts")
+@with_appcontext
+def repair_counts_command():
+    repair_counts()
+
+def repair_counts():
+    """
+    Recomputes the move list counters and content hashes of every workout and
+    move, e.g. after writes that bypassed the triggers
+    """
+    hashes = {}
+    for position, move_id, repetitions, subplan_id, plan_id in db.session.execute(select(
+        MoveListItem.position, MoveListItem.move_id, MoveListItem.repetitions, MoveListItem.subplan_id, MoveListItem.plan_id
+    )):
+        item = item_hash(position, move_id, repetitions, subplan_id)
+        hashes[plan_id] = (hashes.get(plan_id, 0) + item) % CONTENT_HASH_MODULUS
+    db.session.execute(text("UPDATE workout_plan SET content_hash = 0"))
+    if hashes:
+        db.session.execute(
+            text("UPDATE workout_plan SET content_hash = :content_hash WHERE id = :id"),
+            [{"id": plan_id, "content_hash": content_hash} for plan_id, content_hash in hashes.items()]
+        )
+    db.session.execute(text(
+        "UPDATE workout_plan SET move_count = "
+        "(SELECT count(*) FROM move_list_item WHERE plan_id = workout_plan.id)"
+    ))
+    db.session.execute(text(
+        "UPDATE move SET workout_count = "
+        "(SELECT count(DISTINCT plan_id) FROM move_list_item WHERE move_id = move.id), "
+        "item_count = (SELECT count(*) FROM move_list_item WHERE move_id = move.id)"
+    ))
+    db.session.commit()
+
+@click.command("rebuild-stats")
+@with_appcontext
+def rebuild_stats_command():
+    rebuild_stats()
+
+def rebuild_stats():
+    """
+    Recomputes the statistics summary tables from the move lists
+    """
+    db.session.execute(delete(PlanMoveStats))
+    db.session.execute(delete(UserMoveStats))
+    db.session.execute(delete(UserPlanLength))
+    db.session.execute(text(
+        "INSERT INTO plan_move_stats (plan_id, move_id, uses, repetitions) "
+        "SELECT plan_id, move_id, count(*), sum(coalesce(repetitions, 0)) "
+        "FROM move_list_item WHERE move_id IS NOT NULL GROUP BY plan_id, move_id"
+    ))
+    db.session.execute(text(
+        "INSERT INTO user_move_stats (user_id, move_id, uses, repetitions) "
+        "SELECT workout_plan.user_id, plan_move_stats.move_id, sum(uses), sum(plan_move_stats.repetitions) "
+        "FROM plan_move_stats JOIN workout_plan ON workout_plan.id = plan_move_stats.plan_id "
+        "GROUP BY workout_plan.user_id, plan_move_stats.move_id"
+    ))
+    db.session.execute(text(
+        "INSERT INTO user_plan_length (user_id, length, plans) "
+        "SELECT user_id, move_count, count(*) FROM workout_plan GROUP BY user_id, move_count"
+    ))
+    db.session.commit()
+
+@click.command("rebuild-history")
+@with_appcontext
+def rebuild_history_command():
+    rebuild_history()
+
+def rebuild_history():
+    """
+    Recomputes the activity rollups from the sessions and set logs
+    """
+    db.session.execute(delete(ActivityRollup))
+    periods = {
+        "day": "date(performed_at)",
+        "week": "date(performed_at, 'weekday 0', '-6 days')",
+        "month": "date(performed_at, 'start of month')",
+    }
+    for period, start in periods.items():
+        db.session.execute(text(
+            "INSERT INTO activity_rollup (user_id, period, start, sessions, sets, repetitions) "
+            f"SELECT user_id, '{period}', start, sum(sessions), sum(sets), sum(repetitions) FROM ("
+            f"SELECT user_id, {start} AS start, 1 AS sessions, 0 AS sets, 0 AS repetitions FROM workout_session "
+            f"UNION ALL SELECT user_id, {start}, 0, 1, repetitions FROM set_log"
+            ") GROUP BY user_id, start"
+        ))
+    db.session.commit()
+
 @click.command("gen-testdata")
 @with_appcontext
 def populate_db_command():
+    populate_db()
+
+def populate_db():
+    """
+    Adds the example users, moves and workouts to the database, the API
+    documentation examples are generated from them as well
+    """
     u1 = User(username="ProAthlete35")
     u2 = User(username="Noob")
 
@@ -0,0 +1,92 @@
+"""
+Token bucket rate limiting of the API.
+
+Every client address gets a bucket per user in the request path, separately for
+reads and writes. A bucket holds at most *burst* tokens and refills at *rate*
+tokens per second, each request takes one token. Buckets live in process
+memory in a bounded LRU, so a check is a dictionary lookup and some arithmetic.
+"""
+
+import math
+import threading
+import time
+from collections import OrderedDict
+from flask import request
+from workoutplanner.utils import create_error_response
+
+READ_METHODS = ("GET", "HEAD", "OPTIONS")
+
+
+class RateLimiter(object):
+    """
+    Token buckets of a single budget, e.g. reads or writes
+    """
+
+    def __init__(self, rate, burst, max_keys=10000, clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self.clock = clock
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def acquire(self, key):
+        """
+        Takes a token from the bucket of the key.
+        : return: 0 if the request is allowed, otherwise seconds until a token is available
+        """
+        now = self.clock()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            if tokens >= 1:
+                tokens -= 1
+                wait = 0
+            else:
+                wait = (1 - tokens) / self.rate
+            self._buckets[key] = (tokens, now)
+            #  The least recently used bucket goes first, it has the most time to refill
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return wait
+
+
+def init_app(app):
+    """
+    Adds the rate limits to the API of the app. The limits are read from the config:
+    RATELIMIT_ENABLED, RATELIMIT_READ_RATE, RATELIMIT_READ_BURST,
+    RATELIMIT_WRITE_RATE, RATELIMIT_WRITE_BURST and RATELIMIT_MAX_KEYS.
+    """
+    if not app.config["RATELIMIT_ENABLED"]:
+        return
+
+    limiters = {
+        "read": RateLimiter(
+            app.config["RATELIMIT_READ_RATE"],
+            app.config["RATELIMIT_READ_BURST"],
+            app.config["RATELIMIT_MAX_KEYS"]
+        ),
+        "write": RateLimiter(
+            app.config["RATELIMIT_WRITE_RATE"],
+            app.config["RATELIMIT_WRITE_BURST"],
+            app.config["RATELIMIT_MAX_KEYS"]
+        ),
+    }
+    app.extensions["ratelimit"] = limiters
+
+    @app.before_request
+    def check_rate_limit():
+        if not request.path.startswith("/api/"):
+            return None
+        budget = "read" if request.method in READ_METHODS else "write"
+        user = (request.view_args or {}).get("user")
+        wait = limiters[budget].acquire((user, request.remote_addr))
+        if wait:
+            response = create_error_response(
+                429,
+                "Too many requests",
+                f"The {budget} limit of {limiters[budget].rate} requests per second was exceeded"
+            )
+            response.headers["Retry-After"] = str(math.ceil(wait))
+            return response
+        return None
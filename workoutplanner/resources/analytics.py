@@ -0,0 +1,148 @@
+import json
+from flask import Response, request
+from flask_restful import Resource
+from werkzeug.exceptions import NotFound, BadRequest, NotImplemented as NotImplementedHTTP
+from workoutplanner.models import User, Move
+from workoutplanner.utils import MasonBuilder
+from workoutplanner.links import *
+from workoutplanner import analytics
+
+
+def _require_numpy():
+    if analytics.np is None:
+        raise NotImplementedHTTP(description="Analytics need NumPy, install the package with the analytics extra")
+
+
+def _get_limit():
+    for key in request.args:
+        if key != "limit":
+            raise BadRequest(description=f"Unknown query parameter {key}")
+    try:
+        limit = int(request.args.get("limit", PAIRED_SIZE))
+    except ValueError:
+        raise BadRequest(description="limit must be an integer")
+    if limit < 1:
+        raise BadRequest(description="limit must be larger than zero")
+    return min(limit, PAIRED_MAX_SIZE)
+
+
+def _get_arrays(user_id, version):
+    #  The arrays are shared by every result computed from the same move lists
+    return analytics.get_cache().get(("arrays", user_id), version, lambda: analytics.load_arrays(user_id))
+
+
+def _get_moves(ids):
+    return {move.id: move for move in Move.query.filter(Move.id.in_(ids))}
+
+
+class MovePairs(Resource):
+    """
+    Moves used together with a move
+    Computed from the move lists of all workouts
+
+    Covers the following URIs:
+    /api/users/{user}/moves/{move}/paired/, GET
+    """
+
+    def get(self, user: str, move: str) -> Response:
+        """
+        Get the moves paired with the move
+        ---
+        description: "Moves that are in the same workouts as the move, with the amount of workouts containing both and how many times they are done right before or after the move. Needs the analytics extra."
+        parameters:
+        - $ref: '#/components/parameters/user'
+        - $ref: '#/components/parameters/move'
+        - $ref: '#/components/parameters/limit'
+        responses:
+            '200':
+                description: Paired moves returned successfully, most shared workouts first
+            '400':
+                description: Bad request
+            '404':
+                description: Not found
+            '501':
+                description: NumPy is not installed
+        """
+        limit = _get_limit()
+        move_obj = (
+            Move.query.join(User, Move.user_id == User.id)
+            .filter(User.username == user, Move.name == move)
+            .first()
+        )
+        if not move_obj:
+            raise NotFound
+        _require_numpy()
+
+        version = analytics.write_version()
+        pairs = analytics.get_cache().get(
+            ("paired", move_obj.id, limit), version,
+            lambda: analytics.paired_moves(_get_arrays(None, version), move_obj.id, limit)
+        )
+        moves = _get_moves([move_id for move_id, _, _ in pairs])
+
+        body = MasonBuilder(name=move_obj.name, user=user, items=[])
+        body.add_namespace("workoutplanner", LINK_RELATIONS_URL)
+        body.add_control("self", href=request.full_path if request.query_string else request.path)
+        body.add_control("up", href=move_obj.get_url(), title="Up")
+        body.add_control("workoutplanner:workouts-using", href=move_obj.get_url() + "workouts/", title="Workouts using the move")
+        for move_id, workouts, adjacent in pairs:
+            paired = moves[move_id]
+            item = MasonBuilder(name=paired.name, user=paired.user.username, workouts=workouts, adjacent=adjacent)
+            item.add_control("self", paired.get_url())
+            body["items"].append(item)
+        return Response(json.dumps(body), 200, mimetype=MASON)
+
+
+class UserAnalytics(Resource):
+    """
+    Composition of the workouts of a user
+    Computed from the move lists of the user's workouts
+
+    Covers the following URIs:
+    /api/users/{user}/analytics/, GET
+    """
+
+    def get(self, user: str) -> Response:
+        """
+        Get the repetition analytics of the user
+        ---
+        description: "Mean and median repetitions and a histogram of the repetitions of the moves in the workouts of the user, and the same per move for the most used moves. Needs the analytics extra."
+        parameters:
+        - $ref: '#/components/parameters/user'
+        - $ref: '#/components/parameters/limit'
+        responses:
+            '200':
+                description: Analytics returned successfully, the most used moves are the items
+            '400':
+                description: Bad request
+            '404':
+                description: Not found
+            '501':
+                description: NumPy is not installed
+        """
+        limit = _get_limit()
+        user_obj = User.query.filter_by(username=user).first()
+        if not user_obj:
+            raise NotFound
+        _require_numpy()
+
+        version = analytics.write_version(user_obj.id)
+        summary, histogram, per_move = analytics.get_cache().get(
+            ("repetitions", user_obj.id, limit), version,
+            lambda: analytics.repetition_distribution(_get_arrays(user_obj.id, version), limit)
+        )
+        moves = _get_moves([move_id for move_id, _, _, _ in per_move])
+
+        body = MasonBuilder(user=user_obj.username, **summary)
+        body["histogram"] = [{"min": low, "max": high, "items": count} for low, high, count in histogram]
+        body.add_namespace("workoutplanner", LINK_RELATIONS_URL)
+        body.add_control("self", href=request.full_path if request.query_string else request.path)
+        body.add_control("up", href=user_obj.get_url(), title="Up")
+        body.add_control("workoutplanner:stats", href=user_obj.get_url() + "stats/", title="Statistics of the user")
+        body["items"] = []
+        for move_id, items, mean, median in per_move:
+            move_obj = moves[move_id]
+            item = MasonBuilder(name=move_obj.name, user=move_obj.user.username, items=items, mean=mean, median=median)
+            item.add_control("self", move_obj.get_url())
+            body["items"].append(item)
+        return Response(json.dumps(body), 200, mimetype=MASON)
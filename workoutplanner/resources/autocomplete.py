@@ -0,0 +1,58 @@
+import json
+from flask import Response, request
+from flask_restful import Resource
+from werkzeug.exceptions import NotFound, BadRequest
+from workoutplanner.autocomplete import KINDS, get_autocomplete
+from workoutplanner.utils import MasonBuilder
+from workoutplanner.links import *
+
+class AutocompleteCollection(Resource):
+    """
+    Autocomplete resource
+    Returns the names starting with a prefix from the in-memory prefix indexes
+
+    Covers the following URIs:
+    /api/autocomplete/{kind}/, GET
+    """
+
+    def get(self, kind: str) -> Response:
+        """
+        Get the names starting with the given prefix
+        ---
+        description: "Allows GET from the following URIs: /api/autocomplete/users/, /api/autocomplete/moves/ and /api/autocomplete/workouts/"
+        parameters:
+        - $ref: '#/components/parameters/kind'
+        - $ref: '#/components/parameters/prefix'
+        - $ref: '#/components/parameters/limit'
+        responses:
+            '200':
+                description: Matching names returned successfully, in alphabetical order
+            '400':
+                description: Bad request
+            '404':
+                description: Not found
+        """
+        if kind not in KINDS:
+            raise NotFound
+        prefix = request.args.get("prefix", "")
+        try:
+            limit = int(request.args.get("limit", AUTOCOMPLETE_SIZE))
+        except ValueError:
+            raise BadRequest(description="limit must be an integer")
+        if limit < 1:
+            raise BadRequest(description="limit must be larger than zero")
+        limit = min(limit, AUTOCOMPLETE_MAX_SIZE)
+
+        body = MasonBuilder(items=[])
+        body.add_namespace("workoutplanner", LINK_RELATIONS_URL)
+        body.add_control("self", href=request.full_path)
+        body.add_control("up", href="/api/", title="Up")
+
+        for name, owner, href in get_autocomplete().lookup(kind, prefix, limit):
+            item = MasonBuilder(name=name)
+            if owner is not None:
+                item["user"] = owner
+            item.add_control("self", href)
+            body["items"].append(item)
+
+        return Response(json.dumps(body), 200, mimetype=MASON)
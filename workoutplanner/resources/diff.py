@@ -0,0 +1,116 @@
+import json
+from difflib import SequenceMatcher
+from flask import Response, request
+from flask_restful import Resource, url_for
+from werkzeug.exceptions import BadRequest
+from workoutplanner.utils import MasonBuilder, get_workout_plan
+from workoutplanner.links import *
+
+
+def diff_move_lists(old, new):
+    """
+    Computes the edit script that turns one move list into another.
+    The lists are (position, (move id, sub-plan id), repetitions, URI) tuples in
+    order. The item sequences are aligned with difflib's matcher; an item that is
+    deleted in one place and inserted in another becomes a move, and aligned
+    items whose repetitions differ become repetition changes.
+    : return: list of operations, positions refer to the old list in "from"
+    and to the new list in "to"
+    """
+
+    matcher = SequenceMatcher(None, [item[1] for item in old], [item[1] for item in new], autojunk=False)
+    changes = []
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            changes.extend(
+                ("repetitions", before, after)
+                for before, after in zip(old[i1:i2], new[j1:j2]) if before[2] != after[2]
+            )
+        else:
+            changes.extend(("delete", before, None) for before in old[i1:i2])
+            changes.extend(("insert", None, after) for after in new[j1:j2])
+
+    #  A deletion and an insertion of the same move is a move, paired in order of the positions
+    deletions = {}
+    for index, (kind, before, _) in enumerate(changes):
+        if kind == "delete":
+            deletions.setdefault(before[1], []).append(index)
+    paired = set()
+    for index, (kind, _, after) in enumerate(changes):
+        if kind == "insert" and deletions.get(after[1]):
+            deleted = deletions[after[1]].pop(0)
+            paired.add(deleted)
+            changes[index] = ("move", changes[deleted][1], after)
+
+    operations = []
+    for index, (kind, before, after) in enumerate(changes):
+        if index in paired:
+            continue
+        if kind == "delete":
+            operations.append({"op": kind, "from": before[0], "move": before[3], "repetitions": before[2]})
+        elif kind == "insert":
+            operations.append({"op": kind, "to": after[0], "move": after[3], "repetitions": after[2]})
+        elif kind == "move":
+            operation = {"op": kind, "from": before[0], "to": after[0], "move": after[3], "repetitions": after[2]}
+            if before[2] != after[2]:
+                operation["old"] = before[2]
+            operations.append(operation)
+        else:
+            operations.append({
+                "op": kind, "from": before[0], "to": after[0], "move": after[3], "old": before[2], "new": after[2]
+            })
+    return operations
+
+
+class WorkoutPlanDiff(Resource):
+    """
+    Differences between two workouts
+    An edit script of insertions, deletions, moves and repetition changes
+    that turns the move list of one workout into that of another
+
+    Covers the following URIs:
+    /api/workouts/diff/, GET
+    """
+
+    def get(self) -> Response:
+        """
+        Get the differences between two workouts
+        ---
+        description: "Edit script from the move list of the workout at from to the move list of the workout at to. The operations are the items: insert and delete, move for a move that changed its position and repetitions for a move that only changed its repetitions."
+        parameters:
+        - $ref: '#/components/parameters/from'
+        - $ref: '#/components/parameters/to'
+        responses:
+            '200':
+                description: Edit script returned successfully
+            '400':
+                description: Bad request
+            '404':
+                description: A workout was not found
+        """
+        for key in request.args:
+            if key not in ("from", "to"):
+                raise BadRequest(description=f"Unknown query parameter {key}")
+        if "from" not in request.args or "to" not in request.args:
+            raise BadRequest(description="Both from and to are required")
+        source = get_workout_plan(request.args["from"])
+        target = get_workout_plan(request.args["to"])
+        script = diff_move_lists(source.get_move_list(), target.get_move_list())
+
+        body = MasonBuilder(**{"from": source.get_url(), "to": target.get_url()})
+        body.add_namespace("workoutplanner", LINK_RELATIONS_URL)
+        body.add_control("self", href=request.full_path)
+        body.add_control("up", href=url_for("api.workoutplancollection"), title="Up")
+        body.add_control("workoutplanner:diff-from", href=source.get_url(), title="Workout diffed from")
+        body.add_control("workoutplanner:diff-to", href=target.get_url(), title="Workout diffed to")
+
+        #  The document is written out operation by operation instead of in one string
+        head = json.dumps(body, separators=(",", ":"))[:-1]
+
+        def generate():
+            yield head + ',"items":['
+            for index, operation in enumerate(script):
+                yield ("," if index else "") + json.dumps(operation, separators=(",", ":"))
+            yield "]}"
+
+        return Response(generate(), 200, mimetype=MASON)
@@ -1,4 +1,5 @@
 import json
+import re
 from flask import Response, request, url_for
 from flask_restful import Resource
 from jsonschema import validate, ValidationError
@@ -6,11 +7,35 @@ from werkzeug.exceptions import NotFound, Conflict, BadRequest, UnsupportedMedia
 from sqlalchemy.exc import IntegrityError
 from workoutplanner.models import *
 from workoutplanner import db
-from workoutplanner.utils import MasonBuilder
+from workoutplanner.utils import MasonBuilder, get_page_args, get_collection_page, prefix_filter, get_etag, check_if_match
 from werkzeug.routing import BaseConverter
 from workoutplanner.links import *
 from flasgger import swag_from
 
+#  Allowed sort keys and filters of the move collections
+MOVE_SORT_FIELDS = {
+    "id": Move.id,
+    "name": Move.name,
+    "creator": User.username,
+}
+MOVE_FILTERS = {
+    "creator": lambda query, creator: query.filter(User.username == creator),
+    "name": lambda query, name: query.filter(Move.name == name),
+    "name_prefix": prefix_filter(Move.name),
+}
+
+#  Allowed sort keys and filters of the workouts using a move
+MOVE_WORKOUT_OCCURRENCES = db.func.count(MoveListItem.id).label("occurrences")
+MOVE_WORKOUT_SORT_FIELDS = {
+    "id": WorkoutPlan.id,
+    "name": WorkoutPlan.name,
+    "creator": User.username,
+    "occurrences": MOVE_WORKOUT_OCCURRENCES,
+}
+MOVE_WORKOUT_FILTERS = {
+    "creator": lambda query, creator: query.filter(User.username == creator),
+}
+
 class MoveConverter(BaseConverter):
     def to_python(self, user):
         db_user = User.query.filter_by(username=user).first()
@@ -104,6 +129,12 @@ class MoveCollection(Resource):
         parameters:
         - $ref: '#/components/parameters/username'
         - $ref: '#/components/parameters/move'
+        - $ref: '#/components/parameters/q'
+        - $ref: '#/components/parameters/sort'
+        - $ref: '#/components/parameters/creator'
+        - $ref: '#/components/parameters/name_prefix'
+        - $ref: '#/components/parameters/offset'
+        - $ref: '#/components/parameters/limit'
         responses:
             '200':
                 description: Moves returned successfully  
@@ -122,12 +153,35 @@ class MoveCollection(Resource):
         #  Check if user was present in the URI.
         #  If so, query only the moves by that user.
         #  Else query all moves in the database.
+        user_id = None
         if user:
             user_obj = User.query.filter_by(username=user).first()
+            if not user_obj:
+                raise NotFound
             user_id = user_obj.id
-            query = Move.query.filter_by(user_id=user_id).all()
+
+        #  A search query returns a ranked page of the matching moves,
+        #  otherwise filters, sorting and pagination are done in SQL
+        if "q" in request.args:
+            for key in request.args:
+                if key not in ("q", "creator", "offset", "limit"):
+                    raise BadRequest(description=f"Unknown query parameter {key} for a search")
+            if "creator" in request.args:
+                creator_obj = User.query.filter_by(username=request.args["creator"]).first()
+                if not creator_obj or (user_id is not None and creator_obj.id != user_id):
+                    raise NotFound
+                user_id = creator_obj.id
+            offset, limit = get_page_args()
+            query = Move.search(_to_fts_query(request.args["q"]), user_id=user_id, offset=offset, limit=limit + 1)
+            has_next = len(query) > limit
+            query = query[:limit]
         else:
-            query = Move.query.all()
+            query = Move.query.join(User, Move.user_id == User.id)
+            if user:
+                query = query.filter(Move.user_id == user_id)
+            query, offset, limit, has_next = get_collection_page(
+                query, MOVE_SORT_FIELDS, MOVE_FILTERS, "id", Move.id
+            )
 
         body = MoveCollectionBuilder(items=[])
         body.add_namespace("workoutplanner", LINK_RELATIONS_URL)
@@ -139,7 +193,10 @@ class MoveCollection(Resource):
             body.add_control_add_move(user_obj)
         else:
             body.add_control("up", href=url_for("api_entry"), title="Up")
-        
+        body.add_control_search_moves(request.path)
+        body.add_control_popular_moves()
+        body.add_control_pages(offset, limit, has_next)
+
         for move in query:
             item = MoveBuilder(move.serialize(short_form=True))
             item.add_control("self", move.get_url())
@@ -147,6 +204,50 @@ class MoveCollection(Resource):
 
         return Response(json.dumps(body), 200, mimetype=MASON)
 
+class PopularMoves(Resource):
+    """
+    Popular moves resource
+    The most used moves of all workouts, read from a counter maintained on write
+
+    Covers the following URIs:
+    /api/moves/popular/, GET
+    """
+
+    def get(self) -> Response:
+        """
+        Get the most used moves
+        ---
+        description: "Moves ordered by the amount of move list items using them, most used first"
+        parameters:
+        - $ref: '#/components/parameters/limit'
+        responses:
+            '200':
+                description: Moves returned successfully
+            '400':
+                description: Bad request
+        """
+        try:
+            limit = int(request.args.get("limit", POPULAR_SIZE))
+        except ValueError:
+            raise BadRequest(description="limit must be an integer")
+        if limit < 1:
+            raise BadRequest(description="limit must be larger than zero")
+
+        body = MoveCollectionBuilder(items=[])
+        body.add_namespace("workoutplanner", LINK_RELATIONS_URL)
+        body.add_control("self", href=request.full_path if request.query_string else request.path)
+        body.add_control("profile", href=MOVE_COLLECTION_PROFILE_URL)
+        body.add_control("up", href=url_for("api.movecollection"), title="Up")
+
+        for move in Move.popular(min(limit, POPULAR_MAX_SIZE)):
+            item = MoveBuilder(move.serialize(short_form=True))
+            item["user"] = move.user.username
+            item["uses"] = move.item_count
+            item.add_control("self", move.get_url())
+            body["items"].append(item)
+
+        return Response(json.dumps(body), 200, mimetype=MASON)
+
 class MoveItem(Resource):
     """
     Workout move resource
@@ -165,6 +266,7 @@ class MoveItem(Resource):
         - $ref: '#/components/parameters/user'    
         - $ref: '#/components/parameters/move'         
         - $ref: '#/components/parameters/moveitem' 
+        - $ref: '#/components/parameters/ifmatch'
         responses:
             '200':
                 description: Move edited successfully
@@ -181,6 +283,8 @@ class MoveItem(Resource):
                 description: Method not allowed
             '409':
                 description: Conflict (already exists)
+            '412':
+                description: Precondition failed, the move was changed after it was read
             '415':
                 description: Unsupported media type
         """
@@ -203,6 +307,9 @@ class MoveItem(Resource):
                 creator_id = creator_obj.id
                 #  Query the requested move
                 move = Move.query.filter_by(name=move, user_id=creator_id).first()
+                if move is None:
+                    raise NotFound
+                check_if_match(move)
                 #  Change it's attributes
                 move.name  = request.json["name"]
                 move.description = request.json["description"]
@@ -253,6 +360,8 @@ class MoveItem(Resource):
             user_id = user_obj.id
             #  Filter the move based on the previous user id and the moves name
             query = Move.query.filter_by(name=move, user_id=user_id).first()
+            if not query:
+                raise NotFound
         else:
             raise MethodNotAllowed
 
@@ -262,12 +371,117 @@ class MoveItem(Resource):
         body.add_control("profile", href=MOVE_PROFILE_URL)
         body.add_control("collection", url_for("api.movecollection"), title="All moves")
         body.add_control("up", query.get_collection_url(), title="Up")
+        body.add_control_get_workouts_using(query)
+        body.add_control_get_paired_moves(query)
         body.add_control_edit_move(query)
         #body.add_control_delete_move(query)
+        response = Response(json.dumps(body), 200, mimetype=MASON)
+        response.set_etag(get_etag(query))
+        return response
+
+class MoveWorkouts(Resource):
+    """
+    Workouts using a move
+    The reverse of the move lists: the distinct workouts that contain the move
+    and how many times they contain it
+
+    Covers the following URIs:
+    /api/users/{user}/moves/{move}/workouts/, GET
+    """
+
+    def get(self, user: str, move: str) -> Response:
+        """
+        Get the workouts using the move
+        ---
+        description: "Workouts containing the move with the amount of times they contain it, sortable by id, name, creator and occurrences"
+        parameters:
+        - $ref: '#/components/parameters/user'
+        - $ref: '#/components/parameters/move'
+        - $ref: '#/components/parameters/sort'
+        - $ref: '#/components/parameters/creator'
+        - $ref: '#/components/parameters/offset'
+        - $ref: '#/components/parameters/limit'
+        responses:
+            '200':
+                description: Workouts returned successfully
+            '400':
+                description: Bad request
+            '404':
+                description: Not found
+        """
+        move_obj = (
+            Move.query.join(User, Move.user_id == User.id)
+            .filter(User.username == user, Move.name == move)
+            .first()
+        )
+        if not move_obj:
+            raise NotFound
+
+        #  One grouped query over the (move_id, plan_id) index
+        query = (
+            db.session.query(WorkoutPlan, MOVE_WORKOUT_OCCURRENCES)
+            .join(MoveListItem, MoveListItem.plan_id == WorkoutPlan.id)
+            .join(User, WorkoutPlan.user_id == User.id)
+            .filter(MoveListItem.move_id == move_obj.id)
+            .group_by(WorkoutPlan.id)
+        )
+        query, offset, limit, has_next = get_collection_page(
+            query, MOVE_WORKOUT_SORT_FIELDS, MOVE_WORKOUT_FILTERS, "-occurrences", WorkoutPlan.id
+        )
+
+        body = MasonBuilder(items=[])
+        body.add_namespace("workoutplanner", LINK_RELATIONS_URL)
+        body.add_control("self", href=request.path)
+        body.add_control("up", href=move_obj.get_url(), title="Up")
+        body.add_control_pages(offset, limit, has_next)
+
+        for plan, occurrences in query:
+            item = MasonBuilder(name=plan.name, user=plan.user.username, occurrences=occurrences)
+            item.add_control("self", plan.get_url())
+            body["items"].append(item)
+
         return Response(json.dumps(body), 200, mimetype=MASON)
 
+def _to_fts_query(query: str) -> str:
+    """
+    Turns free text into an FTS5 query matching moves that contain every word as a prefix.
+    The words are quoted so that FTS5 operators in the text are not interpreted.
+    """
+    words = re.findall(r"\w+", query)
+    if not words:
+        raise BadRequest(description="The search query has to contain at least one word")
+    return " ".join(f'"{word}"*' for word in words)
+
 class MoveCollectionBuilder(MasonBuilder):
 
+    def add_control_popular_moves(self):
+        '''GET the most used moves'''
+        self.add_control(
+            ctrl_name="workoutplanner:moves-popular",
+            href=url_for("api.popularmoves"),
+            method="GET",
+            title="Show the most used moves"
+        )
+
+    def add_control_search_moves(self, href):
+        '''GET the moves matching a search query'''
+        self.add_control(
+            ctrl_name="workoutplanner:search-moves",
+            href=href + "?q={q}",
+            isHrefTemplate=True,
+            method="GET",
+            schema={
+                "type": "object",
+                "required": ["q"],
+                "properties": {
+                    "q": {
+                        "description": "Words to search from the move names and descriptions",
+                        "type": "string"
+                    }
+                }
+            }
+        )
+
     def add_control_add_move(self, user):
         '''POST a new move'''
         self.add_control_post(
@@ -287,11 +501,34 @@ class MoveBuilder(MasonBuilder):
             href=obj.get_url()
         )
 
+    def add_control_get_workouts_using(self, obj):
+        '''GET the workouts using the move'''
+        self.add_control(
+            ctrl_name="workoutplanner:workouts-using",
+            href=obj.get_url() + "workouts/",
+            method="GET",
+            title="Get the workouts using this move"
+        )
+
+    def add_control_get_paired_moves(self, obj):
+        '''GET the moves used together with the move'''
+        self.add_control(
+            ctrl_name="workoutplanner:paired-moves",
+            href=obj.get_url() + "paired/",
+            method="GET",
+            title="Get the moves used together with this move"
+        )
+
     def add_control_edit_move(self, obj):
-        '''PUT a move'''
+        '''PUT a move, warning about the workouts the change affects'''
         self.add_control_put(
             ctrl_name="edit",
             title="Edit this move",
             href=obj.get_url(),
             schema=Move.json_schema()
         )
+        if obj.workout_count:
+            self["@controls"]["edit"]["description"] = (
+                f"Changing this move changes {obj.workout_count} "
+                f"workout{'s' if obj.workout_count != 1 else ''} using it"
+            )
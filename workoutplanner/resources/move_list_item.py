@@ -5,7 +5,7 @@ from werkzeug.exceptions import NotFound, Conflict, BadRequest, UnsupportedMedia
 from sqlalchemy.exc import IntegrityError
 from workoutplanner.models import *
 from workoutplanner import db
-from workoutplanner.utils import MasonBuilder
+from workoutplanner.utils import MasonBuilder, get_etag, check_if_match, get_workout_plan
 from werkzeug.routing import BaseConverter
 from workoutplanner.links import *
 from flasgger import swag_from
@@ -19,6 +19,26 @@ class MoveListItemConverter(BaseConverter):
     def to_url(self, db_user):
         return db_user.username
 
+def _resolve_item(doc: dict, plan: WorkoutPlan) -> tuple:
+    """
+    Finds the move or the workout plan a move list item document refers to
+    : return: tuple of (move id, sub-plan id), one of them is None
+    : raise Conflict: if the workout plan contains the plan the item is added to
+    """
+    if "subplan" in doc:
+        subplan = get_workout_plan(doc["subplan"])
+        if plan.creates_cycle(subplan.id):
+            raise Conflict(description=f"{doc['subplan']} is or contains the workout {plan.name}")
+        return None, subplan.id
+
+    move_creator = User.query.filter_by(username=doc["move_creator"]).first()
+    if not move_creator:
+        raise NotFound(f"No such user as {doc['move_creator']} found")
+    move = Move.query.filter_by(name=doc["move_name"], user_id=move_creator.id).first()
+    if not move:
+        raise NotFound(f"No such move as {doc['move_name']} found")
+    return move.id, None
+
 class MoveListItemCollection(Resource):
     """
     MoveListItem collection is a collection of wrapped move items in a workout
@@ -78,15 +98,7 @@ class MoveListItemCollection(Resource):
                     raise NotFound(f"No such workout as {workout} found")
                 plan_id = plan.id    
                 
-                move_creator = User.query.filter_by(username=request.json["move_creator"]).first()
-                if not move_creator:
-                    raise NotFound(f"No such user as {move_creator} found")
-                   
-                move = Move.query.filter_by(name=request.json["move_name"], user_id=move_creator.id).first()
-                if not move:
-                    move_name = request.json["move_name"]
-                    raise NotFound(f"No such move as {move_name} found")
-                move_id = move.id
+                move_id, subplan_id = _resolve_item(request.json, plan)
 
                 
                 
@@ -121,9 +133,10 @@ class MoveListItemCollection(Resource):
                     #  The next free index will be the length of the result array
                     position = len(MoveListItem.query.filter_by(plan_id=plan_id).all())
                     
-                if not move_id or not plan_id or not creator_id:
+                if not plan_id or not creator_id:
                     raise NotFound
-                move = MoveListItem(position=position, plan_id=plan_id, move_id=move_id, repetitions=repetitions)
+                plan.touch()
+                move = MoveListItem(position=position, plan_id=plan_id, move_id=move_id, subplan_id=subplan_id, repetitions=repetitions)
             else:
                 raise MethodNotAllowed
             db.session.add(move)
@@ -145,10 +158,12 @@ class MoveListItemCollection(Resource):
         """ 
         Get the list of workout move list items.
         ---
-        description: "Allows GET from the following URIs: /api/users/{user}/workouts/{workout}/moves"
+        description: "Allows GET from the following URIs: /api/users/{user}/workouts/{workout}/moves. With expand=full the items of the workouts in the move list are included after them, down to depth levels. At most 1000 items are returned in that order and truncated tells whether the rest were left out."
         parameters:
         - $ref: '#/components/parameters/user'     
         - $ref: '#/components/parameters/workout' 
+        - $ref: '#/components/parameters/expand'
+        - $ref: '#/components/parameters/depth'
         responses:
             '200':
                 description: List of movelist items returned successfully
@@ -165,6 +180,8 @@ class MoveListItemCollection(Resource):
                             creator: ProAthlete35
                             repetitions: 60
                             position: 1
+            '400':
+                description: Bad request
             '404':
                 description: Not found
             '405':
@@ -179,14 +196,15 @@ class MoveListItemCollection(Resource):
                 raise NotFound(f"The user {user} does not exist")
             user_id = user_obj.id
             plan_obj = WorkoutPlan.query.filter_by(user_id=user_id, name=workout).first()
-            plan_id  = plan_obj.id
-            if not plan_id:
+            if not plan_obj:
                 raise NotFound(f"The user {user} or their workout {workout} does not exist")
+            plan_id = plan_obj.id
         else:
             raise MethodNotAllowed
+        if "expand" in request.args:
+            return self._get_expanded(plan_obj)
 
-        query = MoveListItem.query.filter_by(plan_id=plan_id).all()
-        query.sort(key=lambda x: x.position)
+        query = MoveListItem.query.filter_by(plan_id=plan_id).order_by(MoveListItem.position).all()
         
         body = MoveListItemCollectionBuilder(items=[])
         body.add_namespace("workoutplanner", LINK_RELATIONS_URL)
@@ -195,6 +213,7 @@ class MoveListItemCollection(Resource):
         body.add_control("up", href=plan_obj.get_url(), title="Up")
         if user and workout:
             body.add_control_add_move_list_item(plan_obj)
+            body.add_control_reorder_move_list(plan_obj)
         
         for movelistitem in query:
             item = MoveListItemBuilder(movelistitem.serialize(short_form=True))
@@ -203,6 +222,46 @@ class MoveListItemCollection(Resource):
         
         return Response(json.dumps(body), 200, mimetype=MASON)
 
+    def _get_expanded(self, plan: WorkoutPlan) -> Response:
+        """
+        The move list with the move lists of its sub-plans flattened into it
+        """
+        if request.args["expand"] != "full":
+            raise BadRequest(description="expand must be full")
+        try:
+            depth = int(request.args.get("depth", EXPAND_MAX_DEPTH))
+        except ValueError:
+            raise BadRequest(description="depth must be an integer")
+        if depth < 0:
+            raise BadRequest(description="depth must not be negative")
+        rows, truncated = plan.expand(min(depth, EXPAND_MAX_DEPTH), EXPAND_MAX_ROWS)
+
+        body = MoveListItemCollectionBuilder(items=[], truncated=truncated)
+        body.add_namespace("workoutplanner", LINK_RELATIONS_URL)
+        body.add_control("self", href=request.full_path)
+        body.add_control("profile", href=MOVELISTITEM_COLLECTION_PROFILE_URL)
+        body.add_control("up", href=plan.get_url(), title="Up")
+
+        for row in rows:
+            item = MoveListItemBuilder(
+                depth=row["depth"],
+                path=".".join(str(int(position)) for position in row["path"].split(".")),
+                position=row["position"],
+                repetitions=row["repetitions"],
+                creator=row["owner"]
+            )
+            item["move" if row["move_id"] is not None else "workout"] = row["name"]
+            item.add_control(
+                "self", "/api/users/" + row["plan_owner"] + "/workouts/" + row["plan_name"] + "/moves/" + str(row["position"]) + "/"
+            )
+            if row["move_id"] is not None:
+                item.add_control("workoutplanner:move", "/api/users/" + row["owner"] + "/moves/" + row["name"] + "/")
+            else:
+                item.add_control("workoutplanner:subplan", "/api/users/" + row["owner"] + "/workouts/" + row["name"] + "/")
+            body["items"].append(item)
+
+        return Response(json.dumps(body), 200, mimetype=MASON)
+
 
 class MoveListItemItem(Resource):
     """
@@ -224,6 +283,7 @@ class MoveListItemItem(Resource):
         - $ref: '#/components/parameters/workout'  
         - $ref: '#/components/parameters/position' 
         - $ref: '#/components/parameters/movelistitem'
+        - $ref: '#/components/parameters/ifmatch'
         responses:
             '200':
                 description: Movelist item posted successfully
@@ -241,6 +301,8 @@ class MoveListItemItem(Resource):
                 description: Method not allowed
             '409':
                 description: Conflict (already exists)
+            '412':
+                description: Precondition failed, the move list item was changed after it was read
             '415':
                 description: Unsupported media type
         """
@@ -267,21 +329,15 @@ class MoveListItemItem(Resource):
                     raise NotFound(f"No such workout as {workout} found")
                 plan_id = plan.id
 
-                move_creator = User.query.filter_by(username=request.json["move_creator"]).first()
-                if not move_creator:
-                    raise NotFound(f"No such user as {move_creator} found")
-
-                move = Move.query.filter_by(name=request.json["move_name"], user_id=move_creator.id).first()
-                if not move:
-                    move_name = request.json["move_name"]
-                    raise NotFound(f"No such move as {move_name} found")
-                move_id = move.id
+                move_id, subplan_id = _resolve_item(request.json, plan)
 
                 #  Get the current Move list item object
                 move_list_item = MoveListItem.query.filter_by(plan_id=plan_id, position=position).first()
                 if not move_list_item:
                     db.session.rollback()
                     raise NotFound(f"No move at position {position}")
+                check_if_match(move_list_item)
+                plan.touch()
 
                 if "position" in request.json:
                     new_position = request.json["position"]
@@ -324,6 +380,7 @@ class MoveListItemItem(Resource):
                 print(move_list_item.position)
                 #  Change the values of the requested move list object
                 move_list_item.move_id = move_id
+                move_list_item.subplan_id = subplan_id
                 move_list_item.position = new_position
                 move_list_item.repetitions = new_repetitions
 
@@ -385,10 +442,15 @@ class MoveListItemItem(Resource):
         body.add_control("profile", href=MOVELISTITEM_PROFILE_URL)
         body.add_control("up", href=query_result.get_collection_url(), title="Up")
         body.add_control_get_workout_plan(query_result)
-        body.add_control_get_move(query_result)
+        if query_result.subplan_id is not None:
+            body.add_control_get_subplan(query_result)
+        else:
+            body.add_control_get_move(query_result)
         body.add_control_edit_movelist_item(query_result)
         body.add_control_delete_movelist_item(query_result)
-        return Response(json.dumps(body), 200, mimetype=MASON)
+        response = Response(json.dumps(body), 200, mimetype=MASON)
+        response.set_etag(get_etag(query_result))
+        return response
 
     def delete(self, user: str, workout: str, position: int) -> Response:
         """
@@ -399,6 +461,7 @@ class MoveListItemItem(Resource):
         - $ref: '#/components/parameters/user' 
         - $ref: '#/components/parameters/workout'    
         - $ref: '#/components/parameters/position' 
+        - $ref: '#/components/parameters/ifmatch'
         responses:
             '200':
                 description: Move list item deleted successfully
@@ -406,6 +469,8 @@ class MoveListItemItem(Resource):
                 description: Not found
             '405':
                 description: Method not allowed
+            '412':
+                description: Precondition failed, the move list item was changed after it was read
         """
         #if user and workout and position:
         if (workout!=None) and (user!=None) and (position!=None):
@@ -424,6 +489,8 @@ class MoveListItemItem(Resource):
             if not query_result:
                 raise NotFound
             else:
+                check_if_match(query_result)
+                plan.touch()
                 db.session.delete(query_result)
                 #  Reduce all list item positions that were larger than the deleted position
                 for item in MoveListItem.query.filter(MoveListItem.plan_id == plan_id, MoveListItem.position > position).all():
@@ -433,6 +500,79 @@ class MoveListItemItem(Resource):
         else:
             raise MethodNotAllowed
 
+class MoveListOrder(Resource):
+    """
+    Move list order resource
+    Reorders the whole move list of a workout in one request
+
+    Covers the following URI:s,
+    /api/users/{user}/workouts/{workout}/moves/order/, PUT
+    """
+
+    def put(self, user: str, workout: str) -> Response:
+        """
+        Reorder the move list of a workout.
+        ---
+        description: "Allows PUT to the following URI: /api/users/{user}/workouts/{workout}/moves/order/. The body either has the order, a permutation of the current positions, or a list of moves from one position to another which are applied in sequence."
+        parameters:
+        - $ref: '#/components/parameters/user'
+        - $ref: '#/components/parameters/workout'
+        - $ref: '#/components/parameters/movelistorder'
+        - $ref: '#/components/parameters/ifmatch'
+        responses:
+            '200':
+                description: Move list reordered successfully
+                headers:
+                    Location:
+                        description: URI of the move list
+                        schema:
+                            type: string
+                            example: /api/users/Noob/workouts/Light Exercise/moves/
+            '400':
+                description: Bad request, the order is not valid for the move list
+            '404':
+                description: Not found
+            '412':
+                description: Precondition failed, the workout was changed after it was read
+            '415':
+                description: Unsupported media type
+        """
+        if not request.content_type == "application/json":
+            raise UnsupportedMediaType
+        try:
+            validate(request.json, MoveListItem.order_json_schema())
+        except ValidationError as err:
+            raise BadRequest(description=str(err))
+
+        creator = User.query.filter_by(username=user).first()
+        if not creator:
+            raise NotFound(f"No such user as {user} found")
+        plan = WorkoutPlan.query.filter_by(user_id=creator.id, name=workout).first()
+        if not plan:
+            raise NotFound(f"No such workout as {workout} found")
+        check_if_match(plan)
+
+        ids = plan.get_move_ids()
+        if "order" in request.json:
+            order = request.json["order"]
+            #  The order has to be a permutation of the current positions
+            if sorted(order) != list(range(len(ids))):
+                raise BadRequest(description=f"order must contain each position from 0 to {len(ids) - 1} once")
+            new_ids = [ids[position] for position in order]
+        else:
+            new_ids = list(ids)
+            for move in request.json["moves"]:
+                if move["from"] >= len(ids) or move["to"] >= len(ids):
+                    raise BadRequest(description=f"Positions must be smaller than {len(ids)}")
+                new_ids.insert(move["to"], new_ids.pop(move["from"]))
+
+        plan.set_move_order(new_ids)
+        plan.touch()
+        db.session.commit()
+        return Response(status=200, headers={
+            "Location": plan.get_url() + "moves/"
+        })
+
 class MoveListItemCollectionBuilder(MasonBuilder):
 
     def add_control_add_move_list_item(self, plan):
@@ -444,6 +584,15 @@ class MoveListItemCollectionBuilder(MasonBuilder):
             schema=MoveListItem.json_schema()
         )
 
+    def add_control_reorder_move_list(self, plan):
+        '''PUT a new order for the move list'''
+        self.add_control_put(
+            ctrl_name="workoutplanner:reorder-movelist",
+            title="Reorder the moves of the workout",
+            href=plan.get_url() + "moves/order/",
+            schema=MoveListItem.order_json_schema()
+        )
+
 class MoveListItemBuilder(MasonBuilder):
 
     def add_control_get_move(self, obj):
@@ -455,6 +604,15 @@ class MoveListItemBuilder(MasonBuilder):
             title="Get the move of the movelist item"
         )
 
+    def add_control_get_subplan(self, obj):
+        '''GET the workout plan the movelistitem refers to'''
+        self.add_control(
+            ctrl_name="workoutplanner:subplan",
+            href=obj.subplan.get_url(),
+            method="GET",
+            title="Get the workout done as this movelist item"
+        )
+
     def add_control_get_workout_plan(self, obj):
         '''GET the workout plan the movelistitem is a part of'''
         self.add_control(
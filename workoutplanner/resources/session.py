@@ -0,0 +1,371 @@
+import json
+from datetime import date, datetime, timezone
+from flask import Response, request
+from flask_restful import Resource
+from jsonschema import validate, ValidationError
+from werkzeug.exceptions import NotFound, BadRequest, UnsupportedMediaType
+from workoutplanner.models import *
+from workoutplanner import db
+from workoutplanner.utils import MasonBuilder, get_collection_page, get_workout_plan
+from workoutplanner.links import *
+
+
+def _parse_time(value: str) -> datetime:
+    """
+    Parses an ISO 8601 date and time, times with an offset are converted to UTC
+    """
+    try:
+        moment = datetime.fromisoformat(value)
+    except ValueError:
+        raise BadRequest(description=f"{value} is not an ISO 8601 date and time")
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return moment
+
+
+def _parse_date(value: str) -> date:
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise BadRequest(description=f"{value} is not an ISO 8601 date")
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+#  Allowed sort keys and filters of the session collection
+SESSION_SORT_FIELDS = {
+    "id": WorkoutSession.id,
+    "performed_at": WorkoutSession.performed_at,
+}
+SESSION_FILTERS = {
+    "since": lambda query, since: query.filter(WorkoutSession.performed_at >= _parse_time(since)),
+    "until": lambda query, until: query.filter(WorkoutSession.performed_at < _parse_time(until)),
+}
+
+
+def _get_user(user: str) -> User:
+    user_obj = User.query.filter_by(username=user).first()
+    if not user_obj:
+        raise NotFound(f"No such user as {user} found")
+    return user_obj
+
+
+def _get_session(user: str, session: int) -> WorkoutSession:
+    session_obj = (
+        WorkoutSession.query.join(User, WorkoutSession.user_id == User.id)
+        .filter(User.username == user, WorkoutSession.id == session)
+        .first()
+    )
+    if not session_obj:
+        raise NotFound(f"No such session as {session} found")
+    return session_obj
+
+
+class WorkoutSessionCollection(Resource):
+    """
+    Performed workouts of a user
+    Sessions can only be added, the history is append-only
+
+    Covers the following URIs:
+    /api/users/{user}/sessions/, GET, POST
+    """
+
+    def post(self, user: str) -> Response:
+        """
+        Log a performed workout
+        ---
+        description: "Allows POST to the following URI: /api/users/{user}/sessions/"
+        parameters:
+        - $ref: '#/components/parameters/user'
+        - $ref: '#/components/parameters/sessionitem'
+        responses:
+            '201':
+                description: Session logged successfully
+                headers:
+                    Location:
+                        description: URI of the new session
+                        schema:
+                            type: string
+                            example: /api/users/Noob/sessions/1/
+            '400':
+                description: Bad request
+            '404':
+                description: Not found
+            '415':
+                description: Unsupported media type
+        """
+        if not request.content_type == "application/json":
+            raise UnsupportedMediaType
+        try:
+            validate(request.json, WorkoutSession.json_schema())
+        except ValidationError as err:
+            raise BadRequest(description=str(err))
+
+        user_obj = _get_user(user)
+        plan = get_workout_plan(request.json["workout"])
+        performed_at = _parse_time(request.json["performed_at"]) if "performed_at" in request.json else _now()
+        session = WorkoutSession(user_id=user_obj.id, plan_id=plan.id, performed_at=performed_at)
+        db.session.add(session)
+        db.session.commit()
+        return Response(status=201, headers={
+            "Location": session.get_url()
+        })
+
+    def get(self, user: str) -> Response:
+        """
+        Get the performed workouts of a user
+        ---
+        description: "The sessions of the user, newest first by default. since and until limit them to a range of time."
+        parameters:
+        - $ref: '#/components/parameters/user'
+        - $ref: '#/components/parameters/since'
+        - $ref: '#/components/parameters/until'
+        - $ref: '#/components/parameters/sort'
+        - $ref: '#/components/parameters/offset'
+        - $ref: '#/components/parameters/limit'
+        responses:
+            '200':
+                description: Sessions returned successfully
+            '400':
+                description: Bad request
+            '404':
+                description: Not found
+        """
+        user_obj = _get_user(user)
+        #  The range is read from the (user, time) index
+        query = WorkoutSession.query.filter(WorkoutSession.user_id == user_obj.id)
+        sessions, offset, limit, has_next = get_collection_page(
+            query, SESSION_SORT_FIELDS, SESSION_FILTERS, "-performed_at", WorkoutSession.id
+        )
+
+        body = SessionBuilder(items=[])
+        body.add_namespace("workoutplanner", LINK_RELATIONS_URL)
+        body.add_control("self", href=request.path)
+        body.add_control("up", href=user_obj.get_url(), title="Up")
+        body.add_control_add_session(user_obj)
+        body.add_control_get_history(user_obj)
+        body.add_control_pages(offset, limit, has_next)
+
+        for session in sessions:
+            item = MasonBuilder(session.serialize())
+            item.add_control("self", session.get_url())
+            body["items"].append(item)
+
+        return Response(json.dumps(body), 200, mimetype=MASON)
+
+
+class WorkoutSessionItem(Resource):
+    """
+    A performed workout
+
+    Covers the following URIs:
+    /api/users/{user}/sessions/{session}/, GET
+    """
+
+    def get(self, user: str, session: int) -> Response:
+        """
+        Get a performed workout
+        ---
+        description: "The time of the session, the workout that was performed and the amount of sets and repetitions logged for it"
+        parameters:
+        - $ref: '#/components/parameters/user'
+        - $ref: '#/components/parameters/session'
+        responses:
+            '200':
+                description: Session returned successfully
+            '404':
+                description: Not found
+        """
+        session_obj = _get_session(user, session)
+        sets, repetitions = db.session.query(
+            db.func.count(SetLog.id), db.func.coalesce(db.func.sum(SetLog.repetitions), 0)
+        ).filter(SetLog.session_id == session_obj.id).one()
+
+        body = SessionBuilder(session_obj.serialize(), user=user, sets=sets, repetitions=repetitions)
+        body.add_namespace("workoutplanner", LINK_RELATIONS_URL)
+        body.add_control("self", href=request.path)
+        body.add_control("up", href=session_obj.user.get_url() + "sessions/", title="Up")
+        if session_obj.plan:
+            body.add_control("workoutplanner:workout", href=session_obj.plan.get_url(), title="The performed workout")
+        body.add_control("workoutplanner:sets", href=session_obj.get_url() + "sets/", title="Sets of the session")
+        body.add_control_add_set(session_obj)
+        return Response(json.dumps(body), 200, mimetype=MASON)
+
+
+class SetLogCollection(Resource):
+    """
+    Sets done during a performed workout
+    Sets can only be added, the log is append-only
+
+    Covers the following URIs:
+    /api/users/{user}/sessions/{session}/sets/, GET, POST
+    """
+
+    def post(self, user: str, session: int) -> Response:
+        """
+        Log the repetitions done of a move of the workout
+        ---
+        description: "Allows POST to the following URI: /api/users/{user}/sessions/{session}/sets/. The position refers to the move list of the performed workout."
+        parameters:
+        - $ref: '#/components/parameters/user'
+        - $ref: '#/components/parameters/session'
+        - $ref: '#/components/parameters/setitem'
+        responses:
+            '201':
+                description: Set logged successfully
+                headers:
+                    Location:
+                        description: URI of the sets of the session
+                        schema:
+                            type: string
+                            example: /api/users/Noob/sessions/1/sets/
+            '400':
+                description: Bad request
+            '404':
+                description: Not found
+            '415':
+                description: Unsupported media type
+        """
+        if not request.content_type == "application/json":
+            raise UnsupportedMediaType
+        try:
+            validate(request.json, SetLog.json_schema())
+        except ValidationError as err:
+            raise BadRequest(description=str(err))
+
+        session_obj = _get_session(user, session)
+        position = request.json["position"]
+        move_id = None
+        if session_obj.plan_id is not None:
+            item = MoveListItem.query.filter_by(plan_id=session_obj.plan_id, position=position).first()
+            if not item:
+                raise NotFound(f"No move at position {position}")
+            move_id = item.move_id
+        if "performed_at" in request.json:
+            performed_at = _parse_time(request.json["performed_at"])
+        else:
+            performed_at = session_obj.performed_at
+        db.session.add(SetLog(
+            session_id=session_obj.id,
+            user_id=session_obj.user_id,
+            move_id=move_id,
+            position=position,
+            repetitions=request.json["repetitions"],
+            performed_at=performed_at
+        ))
+        db.session.commit()
+        return Response(status=201, headers={
+            "Location": session_obj.get_url() + "sets/"
+        })
+
+    def get(self, user: str, session: int) -> Response:
+        """
+        Get the sets of a performed workout
+        ---
+        description: "The logged sets of the session in the order they were done"
+        parameters:
+        - $ref: '#/components/parameters/user'
+        - $ref: '#/components/parameters/session'
+        responses:
+            '200':
+                description: Sets returned successfully
+            '404':
+                description: Not found
+        """
+        session_obj = _get_session(user, session)
+        sets = (
+            SetLog.query.filter_by(session_id=session_obj.id)
+            .order_by(SetLog.performed_at, SetLog.id)
+            .all()
+        )
+
+        body = SessionBuilder(items=[set_log.serialize() for set_log in sets])
+        body.add_namespace("workoutplanner", LINK_RELATIONS_URL)
+        body.add_control("self", href=request.path)
+        body.add_control("up", href=session_obj.get_url(), title="Up")
+        body.add_control_add_set(session_obj)
+        return Response(json.dumps(body), 200, mimetype=MASON)
+
+
+class ActivityHistory(Resource):
+    """
+    Activity of a user per day, week or month
+    Read from rollup tables that are updated as sessions and sets are logged
+
+    Covers the following URIs:
+    /api/users/{user}/history/, GET
+    """
+
+    def get(self, user: str) -> Response:
+        """
+        Get the activity history of a user
+        ---
+        description: "Sessions, sets and repetitions of the user per period, a day, a week starting on Monday or a month. from and to limit the periods to those starting in a range of dates."
+        parameters:
+        - $ref: '#/components/parameters/user'
+        - $ref: '#/components/parameters/period'
+        - $ref: '#/components/parameters/fromdate'
+        - $ref: '#/components/parameters/todate'
+        responses:
+            '200':
+                description: History returned successfully
+            '400':
+                description: Bad request
+            '404':
+                description: Not found
+        """
+        for key in request.args:
+            if key not in ("period", "from", "to"):
+                raise BadRequest(description=f"Unknown query parameter {key}")
+        period = request.args.get("period", "week")
+        if period not in HISTORY_PERIODS:
+            raise BadRequest(description=f"period must be one of {', '.join(HISTORY_PERIODS)}")
+        start = _parse_date(request.args["from"]) if "from" in request.args else None
+        end = _parse_date(request.args["to"]) if "to" in request.args else None
+        user_obj = _get_user(user)
+
+        body = MasonBuilder(user=user_obj.username, period=period, items=[])
+        body.add_namespace("workoutplanner", LINK_RELATIONS_URL)
+        body.add_control("self", href=request.full_path if request.query_string else request.path)
+        body.add_control("up", href=user_obj.get_url(), title="Up")
+        body.add_control("workoutplanner:sessions", href=user_obj.get_url() + "sessions/", title="Sessions of the user")
+        for rollup in ActivityRollup.history(user_obj, period, start, end):
+            body["items"].append({
+                "start": rollup.start.isoformat(),
+                "sessions": rollup.sessions,
+                "sets": rollup.sets,
+                "repetitions": rollup.repetitions
+            })
+        return Response(json.dumps(body), 200, mimetype=MASON)
+
+
+class SessionBuilder(MasonBuilder):
+
+    def add_control_add_session(self, user):
+        '''POST a performed workout of the user'''
+        self.add_control_post(
+            ctrl_name="workoutplanner:add-session",
+            title="Log a performed workout",
+            href=user.get_url() + "sessions/",
+            schema=WorkoutSession.json_schema()
+        )
+
+    def add_control_add_set(self, session):
+        '''POST a set done during the session'''
+        self.add_control_post(
+            ctrl_name="workoutplanner:add-set",
+            title="Log a set of the workout",
+            href=session.get_url() + "sets/",
+            schema=SetLog.json_schema()
+        )
+
+    def add_control_get_history(self, user):
+        '''GET the activity history of the user'''
+        self.add_control(
+            "workoutplanner:history",
+            href=user.get_url() + "history/?period={period}",
+            title="Activity per day, week or month",
+            isHrefTemplate=True
+        )
@@ -0,0 +1,107 @@
+import json
+from flask import Response, request
+from flask_restful import Resource
+from werkzeug.exceptions import NotFound, BadRequest
+from workoutplanner.models import User, WorkoutPlan, PlanMoveStats, UserMoveStats
+from workoutplanner.utils import MasonBuilder
+from workoutplanner.links import *
+
+
+def _get_top():
+    try:
+        top = int(request.args.get("limit", STATS_TOP_MOVES))
+    except ValueError:
+        raise BadRequest(description="limit must be an integer")
+    if top < 1:
+        raise BadRequest(description="limit must be larger than zero")
+    return min(top, STATS_MAX_TOP_MOVES)
+
+
+def _most_used_items(most_used):
+    items = []
+    for move, uses, repetitions in most_used:
+        item = MasonBuilder(name=move.name, user=move.user.username, uses=uses, repetitions=repetitions)
+        item.add_control("self", move.get_url())
+        items.append(item)
+    return items
+
+
+class UserStats(Resource):
+    """
+    Statistics of the workouts of a user
+    Read from summary tables that are kept up to date when move lists change
+
+    Covers the following URIs:
+    /api/users/{user}/stats/, GET
+    """
+
+    def get(self, user: str) -> Response:
+        """
+        Get the workout statistics of the user
+        ---
+        description: "Total repetitions, distinct moves, most used moves and the distribution of workout lengths of all workouts of the user"
+        parameters:
+        - $ref: '#/components/parameters/user'
+        - $ref: '#/components/parameters/limit'
+        responses:
+            '200':
+                description: Statistics returned successfully, the most used moves are the items
+            '400':
+                description: Bad request
+            '404':
+                description: Not found
+        """
+        user_obj = User.query.filter_by(username=user).first()
+        if not user_obj:
+            raise NotFound
+        summary, most_used = UserMoveStats.summary(user_obj, _get_top())
+
+        body = MasonBuilder(user=user_obj.username, **summary)
+        body.add_namespace("workoutplanner", LINK_RELATIONS_URL)
+        body.add_control("self", href=request.path)
+        body.add_control("up", href=user_obj.get_url(), title="Up")
+        body["items"] = _most_used_items(most_used)
+        return Response(json.dumps(body), 200, mimetype=MASON)
+
+
+class WorkoutPlanStats(Resource):
+    """
+    Statistics of a workout
+    Read from summary tables that are kept up to date when move lists change
+
+    Covers the following URIs:
+    /api/users/{user}/workouts/{workout}/stats/, GET
+    """
+
+    def get(self, user: str, workout: str) -> Response:
+        """
+        Get the statistics of the workout
+        ---
+        description: "Length, total repetitions, distinct moves and most used moves of the workout"
+        parameters:
+        - $ref: '#/components/parameters/user'
+        - $ref: '#/components/parameters/workout'
+        - $ref: '#/components/parameters/limit'
+        responses:
+            '200':
+                description: Statistics returned successfully, the most used moves are the items
+            '400':
+                description: Bad request
+            '404':
+                description: Not found
+        """
+        plan = (
+            WorkoutPlan.query.join(User, WorkoutPlan.user_id == User.id)
+            .filter(User.username == user, WorkoutPlan.name == workout)
+            .first()
+        )
+        if not plan:
+            raise NotFound
+        summary, most_used = PlanMoveStats.summary(plan, _get_top())
+
+        body = MasonBuilder(name=plan.name, user=user, **summary)
+        body.add_namespace("workoutplanner", LINK_RELATIONS_URL)
+        body.add_control("self", href=request.path)
+        body.add_control("up", href=plan.get_url(), title="Up")
+        body["items"] = _most_used_items(most_used)
+        return Response(json.dumps(body), 200, mimetype=MASON)
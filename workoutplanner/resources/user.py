@@ -7,11 +7,21 @@ from sqlalchemy.exc import IntegrityError
 from typing import Union
 from workoutplanner.models import *
 from workoutplanner import db
-from workoutplanner.utils import MasonBuilder
+from workoutplanner.utils import MasonBuilder, get_collection_page, prefix_filter, get_etag, check_if_match
 from werkzeug.routing import BaseConverter
 from workoutplanner.links import *
+from workoutplanner.autocomplete import record_delete
 from flasgger import swag_from
 
+#  Allowed sort keys and filters of the user collection
+USER_SORT_FIELDS = {
+    "id": User.id,
+    "username": User.username,
+}
+USER_FILTERS = {
+    "name_prefix": prefix_filter(User.username),
+}
+
 class UserConverter(BaseConverter):
     def to_python(self, user):
         db_user = User.query.filter_by(username=user).first()
@@ -77,6 +87,11 @@ class UserCollection(Resource):
         Get all users
         ---
         description: Get all the users in the API
+        parameters:
+        - $ref: '#/components/parameters/sort'
+        - $ref: '#/components/parameters/name_prefix'
+        - $ref: '#/components/parameters/offset'
+        - $ref: '#/components/parameters/limit'
         responses:
             '200':
                 description: Users returned successfully
@@ -96,7 +111,12 @@ class UserCollection(Resource):
         body.add_control("up", href="/api/", title="Up")
         body.add_control_add_user()
 
-        for user in User.query.all():
+        query, offset, limit, has_next = get_collection_page(
+            User.query, USER_SORT_FIELDS, USER_FILTERS, "id", User.id
+        )
+        body.add_control_pages(offset, limit, has_next)
+
+        for user in query:
             item = UserBuilder(user.serialize())
             item.add_control("self", user.get_url())
             body["items"].append(item)
@@ -118,6 +138,7 @@ class UserItem(Resource):
         parameters:
         - $ref: '#/components/parameters/user'
         - $ref: '#/components/parameters/useritem'
+        - $ref: '#/components/parameters/ifmatch'
         responses:
             '200':
                 description: User edited successfully
@@ -131,6 +152,8 @@ class UserItem(Resource):
                 description: Bad request
             '404':
                 description: Not found
+            '412':
+                description: Precondition failed, the user was changed after it was read
             '415':
                 description: Unsupported media type
         """
@@ -145,6 +168,7 @@ class UserItem(Resource):
         current_user = User.query.filter_by(username=user).first()
         if current_user is None:
             raise NotFound
+        check_if_match(current_user)
         current_user.username  = request.json["username"]
 
         db.session.commit()
@@ -152,6 +176,32 @@ class UserItem(Resource):
             "Location": current_user.get_url()
         })
 
+    def delete(self, user) -> Response:
+        """
+        Delete an user
+        ---
+        description: "Deletes the user with their moves and workouts. The moves are also removed from the workouts of other users. Obviously should require the user to be authenticated, but auth is not implemented yet."
+        parameters:
+        - $ref: '#/components/parameters/user'
+        - $ref: '#/components/parameters/ifmatch'
+        responses:
+            '200':
+                description: User deleted successfully
+            '404':
+                description: Not found
+            '412':
+                description: Precondition failed, the user was changed after it was read
+        """
+        user_obj = User.query.filter_by(username=user).first()
+        if user_obj is None:
+            raise NotFound
+        check_if_match(user_obj)
+
+        user_obj.delete()
+        record_delete(db.session, user_obj)
+        db.session.commit()
+        return Response(status=200)
+
     @swag_from("/workoutplanner/doc/users/get_item.yml")
     def get(self, user) -> tuple[str, int]:
         """
@@ -183,10 +233,16 @@ class UserItem(Resource):
         body.add_control("up", href=url_for("api.usercollection"), title="Up")# href=api.url_for(UserCollection))
         body.add_control_get_all_moves(user_obj)
         body.add_control_get_all_workouts(user_obj)
+        body.add_control_get_stats(user_obj)
+        body.add_control_get_sessions(user_obj)
+        body.add_control_get_analytics(user_obj)
         body.add_control_add_move(user_obj)
         body.add_control_add_workout(user_obj)
         body.add_control_edit_user(user_obj)
-        return Response(json.dumps(body), 200, mimetype=MASON)
+        body.add_control_delete_user(user_obj)
+        response = Response(json.dumps(body), 200, mimetype=MASON)
+        response.set_etag(get_etag(user_obj))
+        return response
 
 class UserCollectionBuilder(MasonBuilder):
 
@@ -221,6 +277,33 @@ class UserBuilder(MasonBuilder):
             title="Get all workouts of this user"
         )
 
+    def add_control_get_stats(self, user):
+        '''GET the workout statistics of the user'''
+        self.add_control(
+            ctrl_name="workoutplanner:stats",
+            href=user.get_url() + "stats/",
+            method="GET",
+            title="Get the workout statistics of this user"
+        )
+
+    def add_control_get_sessions(self, user):
+        '''GET the performed workouts of the user'''
+        self.add_control(
+            ctrl_name="workoutplanner:sessions",
+            href=user.get_url() + "sessions/",
+            method="GET",
+            title="Get the performed workouts of this user"
+        )
+
+    def add_control_get_analytics(self, user):
+        '''GET the repetition analytics of the user'''
+        self.add_control(
+            ctrl_name="workoutplanner:analytics",
+            href=user.get_url() + "analytics/",
+            method="GET",
+            title="Get the repetition analytics of this user"
+        )
+
     def add_control_delete_user(self, user):
         '''DELETE this user'''
         self.add_control_delete(
@@ -2,16 +2,41 @@ from os import stat
 from flask import Response, request
 from flask_restful import Resource, url_for
 from jsonschema import validate, ValidationError
-from werkzeug.exceptions import NotFound, Conflict, BadRequest, UnsupportedMediaType, MethodNotAllowed, InternalServerError
+from sqlalchemy import insert, update, delete, func
+from sqlalchemy.orm import aliased
+from werkzeug.exceptions import NotFound, Conflict, BadRequest, UnsupportedMediaType, MethodNotAllowed, InternalServerError, UnprocessableEntity
 from sqlalchemy.exc import IntegrityError
 from typing import Union
+from urllib.parse import urlencode
 from workoutplanner.models import *
 from workoutplanner import db
-from workoutplanner.utils import MasonBuilder
+from workoutplanner.utils import MasonBuilder, get_collection_page, get_page_args, prefix_filter, get_workout_plan, get_move, get_etag, check_if_match
 from werkzeug.routing import BaseConverter
 from workoutplanner.links import *
+from workoutplanner.autocomplete import record_delete
 from flasgger import swag_from
 
+#  Allowed sort keys and filters of the workout collections
+WORKOUT_SORT_FIELDS = {
+    "id": WorkoutPlan.id,
+    "name": WorkoutPlan.name,
+    "creator": User.username,
+}
+WORKOUT_FILTERS = {
+    "creator": lambda query, creator: query.filter(User.username == creator),
+    "name": lambda query, name: query.filter(WorkoutPlan.name == name),
+    "name_prefix": prefix_filter(WorkoutPlan.name),
+}
+
+#  Query parameters of the workout search
+WORKOUT_SEARCH_ARGS = ("include", "exclude", "match", "offset", "limit")
+
+JSON_PATCH = "application/json-patch+json"
+
+#  Fields of a move list entry that a patch may change, an entry has either
+#  move_name and move_creator or subplan
+PATCHABLE_MOVE_FIELDS = ("move_name", "move_creator", "subplan", "repetitions")
+
 class WorkoutPlanConverter(BaseConverter):
     def to_python(self, user):
         db_user = User.query.filter_by(username=user).first()
@@ -33,9 +58,9 @@ class WorkoutPlanCollection(Resource):
 
     def post(self, user: str=None) -> Response:
         """
-        Create a new workout plan
+        Create a new workout plan or a copy of an existing one
         ---
-        description: "Allows POST to the following URI:    /api/users/{user}/workouts, NOT from /api/workouts"
+        description: "Allows POST to the following URI:    /api/users/{user}/workouts, NOT from /api/workouts. If the body has a source, the plan and its move list are copied from the workout plan at that URI. With dedupe, a workout of the user with the same moves is returned instead of a new copy."
         parameters:
         - $ref: '#/components/parameters/user'
         - $ref: '#/components/parameters/workoutitem'
@@ -48,6 +73,8 @@ class WorkoutPlanCollection(Resource):
                         schema:
                             type: string
                             example: /api/users/Noob/workouts/Light Excercise
+            '303':
+                description: The user already has a workout with the same moves, its URI is in the Location header
             '400':
                 description: Bad request
             '404':
@@ -67,8 +94,13 @@ class WorkoutPlanCollection(Resource):
                 if not request.content_type == "application/json":
                     raise UnsupportedMediaType
 
+                #  A source in the request means copying an existing plan
+                if isinstance(request.json, dict) and "source" in request.json:
+                    schema = WorkoutPlan.clone_json_schema()
+                else:
+                    schema = WorkoutPlan.json_schema()
                 try:
-                    validate(request.json, WorkoutPlan.json_schema())
+                    validate(request.json, schema)
                 except ValidationError as e:
                     raise BadRequest(description=str(e))
 
@@ -78,9 +110,16 @@ class WorkoutPlanCollection(Resource):
                     raise NotFound
                 user_id = user_obj.id
 
-                plan = WorkoutPlan(name=name, user_id=user_id)
-
-                db.session.add(plan)
+                if "source" in request.json:
+                    source = get_workout_plan(request.json["source"])
+                    if request.json.get("dedupe"):
+                        existing = source.find_copy(user_id)
+                        if existing is not None:
+                            return Response(status=303, headers={"Location": existing.get_url()})
+                    plan = source.clone(name, user_id)
+                else:
+                    plan = WorkoutPlan(name=name, user_id=user_id)
+                    db.session.add(plan)
                 db.session.commit()
                 #return Response(url_for(plan), status=200)
                 return Response(status=201, headers={
@@ -101,6 +140,11 @@ class WorkoutPlanCollection(Resource):
         description: "Allows GET from the following URIs: /api/users/{user}/workouts and /api/workouts/"
         parameters:
         - $ref: '#/components/parameters/username'
+        - $ref: '#/components/parameters/sort'
+        - $ref: '#/components/parameters/creator'
+        - $ref: '#/components/parameters/name_prefix'
+        - $ref: '#/components/parameters/offset'
+        - $ref: '#/components/parameters/limit'
         responses:
             '200':
                 description: List of workout plans returned successfully
@@ -117,14 +161,16 @@ class WorkoutPlanCollection(Resource):
                 description: User not found
         """
         #   If user is specified only gets workouts made by the user, else gets them all
+        query = WorkoutPlan.query.join(User, WorkoutPlan.user_id == User.id)
         if user:
             user_obj = User.query.filter_by(username=user).first()
             if not user_obj:
                 raise NotFound
             user_id = user_obj.id
-            query = WorkoutPlan.query.filter_by(user_id=user_id).all()
-        else:
-            query = WorkoutPlan.query.all()
+            query = query.filter(WorkoutPlan.user_id == user_id)
+        query, offset, limit, has_next = get_collection_page(
+            query, WORKOUT_SORT_FIELDS, WORKOUT_FILTERS, "id", WorkoutPlan.id
+        )
 
         body = WorkoutPlanCollectionBuilder(items=[])
         body.add_namespace("workoutplanner", LINK_RELATIONS_URL)
@@ -134,8 +180,11 @@ class WorkoutPlanCollection(Resource):
         if user:
             body.add_control("up", href=user_obj.get_url(), title="Up")
             body.add_control_add_workout(user_obj)
+            body.add_control_clone_workout(user_obj)
         else:
             body.add_control("up", href=url_for("api_entry"), title="Up")
+        body.add_control_search_workouts()
+        body.add_control_pages(offset, limit, has_next)
 
         for workout in query:
             item = WorkoutPlanBuilder(workout.serialize(short_form=True))
@@ -162,6 +211,7 @@ class WorkoutPlanItem(Resource):
         - $ref: '#/components/parameters/user'
         - $ref: '#/components/parameters/workout'
         - $ref: '#/components/parameters/workoutitem'
+        - $ref: '#/components/parameters/ifmatch'
         responses:
             '200':
                 description: Workout replaced successfully
@@ -177,6 +227,8 @@ class WorkoutPlanItem(Resource):
                 description: Not found
             '405':
                 description: Method not allowed
+            '412':
+                description: Precondition failed, the workout was changed after it was read
             '415':
                 description: Unsupported media type
         """
@@ -196,6 +248,7 @@ class WorkoutPlanItem(Resource):
                 current_workout = WorkoutPlan.query.filter_by(user_id=user_id, name=workout).first()
                 if not current_workout:
                     raise NotFound
+                check_if_match(current_workout)
                 current_workout.name = request.json["name"]
 
                 db.session.commit()
@@ -208,6 +261,151 @@ class WorkoutPlanItem(Resource):
             db.session.rollback()
             raise BadRequest
 
+    def patch(self, user: str=None, workout: str=None) -> Response:
+        """
+        Edit a workout and its move list with a JSON Patch.
+        ---
+        description: "Allows PATCH to the following URI: /api/users/{user}/workouts/{workout}. The patch applies to a document with the name of the workout and its moves, e.g. {\"name\": \"Light Exercise\", \"moves\": [{\"move_name\": \"Push Up\", \"move_creator\": \"ProAthlete35\", \"repetitions\": 20}]}. Workouts in the move list have a subplan URI instead of move_name and move_creator. The whole patch is applied in one transaction."
+        parameters:
+        - $ref: '#/components/parameters/user'
+        - $ref: '#/components/parameters/workout'
+        - $ref: '#/components/parameters/workoutpatch'
+        - $ref: '#/components/parameters/ifmatch'
+        responses:
+            '200':
+                description: Workout patched successfully
+                headers:
+                    Location:
+                        description: URI of the workout
+                        schema:
+                            type: string
+                            example: /api/users/Noob/workouts/Light Excercise
+            '400':
+                description: Bad request
+            '404':
+                description: Not found
+            '405':
+                description: Method not allowed
+            '409':
+                description: Conflict, a test operation failed or the new name is taken
+            '412':
+                description: Precondition failed, the workout was changed after it was read
+            '415':
+                description: Unsupported media type
+            '422':
+                description: The patch can not be applied to the workout
+        """
+        if not (workout and user):
+            raise MethodNotAllowed
+        if not request.content_type == JSON_PATCH:
+            raise UnsupportedMediaType
+        operations = request.get_json(force=True, silent=True)
+        try:
+            validate(operations, WorkoutPlan.patch_json_schema())
+        except ValidationError as e:
+            raise BadRequest(description=str(e))
+
+        user_obj = User.query.filter_by(username=user).first()
+        if not user_obj:
+            raise NotFound
+        plan = WorkoutPlan.query.filter_by(user_id=user_obj.id, name=workout).first()
+        if not plan:
+            raise NotFound
+        check_if_match(plan)
+
+        #  The move list is loaded with one query and patched in memory
+        subplan = aliased(WorkoutPlan)
+        owner = aliased(User)
+        rows = (
+            db.session.query(
+                MoveListItem.id, MoveListItem.move_id, MoveListItem.subplan_id, MoveListItem.repetitions,
+                MoveListItem.version, func.coalesce(Move.name, subplan.name), owner.username
+            )
+            .outerjoin(Move, MoveListItem.move_id == Move.id)
+            .outerjoin(subplan, MoveListItem.subplan_id == subplan.id)
+            .join(owner, owner.id == func.coalesce(Move.user_id, subplan.user_id))
+            .filter(MoveListItem.plan_id == plan.id)
+            .order_by(MoveListItem.position, MoveListItem.id)
+        )
+        original = {}
+        doc = {"name": plan.name, "moves": []}
+        versions = {}
+        for id, move_id, subplan_id, repetitions, version, name, creator in rows:
+            if subplan_id is not None:
+                entry = {"subplan": "/api/users/" + creator + "/workouts/" + name + "/"}
+            else:
+                entry = {"move_name": name, "move_creator": creator}
+            entry.update({
+                "repetitions": repetitions,
+                "_id": id,
+                "_move_id": move_id,
+                "_subplan_id": subplan_id,
+            })
+            original[id] = (move_id, subplan_id, repetitions)
+            versions[id] = version
+            doc["moves"].append(entry)
+
+        for operation in operations:
+            _apply_operation(doc, operation)
+        for entry in doc["moves"]:
+            _check_entry(entry)
+
+        try:
+            #  Write the result: deleted rows, changed rows, one positional
+            #  rewrite of the remaining rows and finally the new rows
+            plan.name = doc["name"]
+            plan.touch()
+            kept = {entry["_id"] for entry in doc["moves"] if entry["_id"] is not None}
+            removed = [id for id in original if id not in kept]
+            if removed:
+                db.session.execute(
+                    delete(MoveListItem).where(MoveListItem.id.in_(removed))
+                    .execution_options(synchronize_session=False)
+                )
+            #  Every entry is looked up once, the lookups may query the database
+            resolved = [_resolve_entry(entry, plan) for entry in doc["moves"]]
+            #  The version is matched and bumped by the bulk update like in a unit of work flush
+            changed = [
+                {
+                    "id": entry["_id"],
+                    "move_id": move_id,
+                    "subplan_id": subplan_id,
+                    "repetitions": entry["repetitions"],
+                    "version": versions[entry["_id"]]
+                }
+                for entry, (move_id, subplan_id) in zip(doc["moves"], resolved)
+                if entry["_id"] is not None and original[entry["_id"]] != (move_id, subplan_id, entry["repetitions"])
+            ]
+            if changed:
+                db.session.execute(update(MoveListItem), changed)
+            plan.set_move_positions({
+                entry["_id"]: position for position, entry in enumerate(doc["moves"]) if entry["_id"] is not None
+            })
+            added = [
+                {
+                    "plan_id": plan.id,
+                    "position": position,
+                    "move_id": move_id,
+                    "subplan_id": subplan_id,
+                    "repetitions": entry["repetitions"]
+                }
+                for position, (entry, (move_id, subplan_id)) in enumerate(zip(doc["moves"], resolved))
+                if entry["_id"] is None
+            ]
+            if added:
+                db.session.execute(insert(MoveListItem), added)
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            raise Conflict(description="Workout already exists")
+        except (NotFound, Conflict):
+            db.session.rollback()
+            raise
+
+        return Response(status=200, headers={
+            "Location": plan.get_url()
+        })
+
     @swag_from("/workoutplanner/doc/workouts/get_item.yml")
     def get(self, workout: str, user: str=None) -> tuple[dict, int]:
         """
@@ -254,10 +452,16 @@ class WorkoutPlanItem(Resource):
         body.add_control("collection", url_for("api.workoutplancollection"), title="All workouts")
         body.add_control("up", query_result.get_collection_url(), title="Up")
         body.add_control_get_all_move_list_items(query_result)
+        body.add_control_get_stats(query_result)
+        body.add_control_get_identical(query_result)
+        body.add_control_diff(query_result)
         body.add_control_add_move_list_item(query_result)
         body.add_control_edit_workout_plan(query_result)
+        body.add_control_patch_workout_plan(query_result)
         body.add_control_delete_workout_plan(query_result)
-        return Response(json.dumps(body), 200, mimetype=MASON)
+        response = Response(json.dumps(body), 200, mimetype=MASON, headers={"Accept-Patch": JSON_PATCH})
+        response.set_etag(get_etag(query_result))
+        return response
 
     def delete(self, user: str, workout: str) -> Response:
         """
@@ -267,6 +471,7 @@ class WorkoutPlanItem(Resource):
         parameters:
         - $ref: '#/components/parameters/user'
         - $ref: '#/components/parameters/workout'
+        - $ref: '#/components/parameters/ifmatch'
         responses:
             '200':
                 description: Workout plan deleted successfully
@@ -274,6 +479,8 @@ class WorkoutPlanItem(Resource):
                 description: Not found
             '405':
                 description: Method not allowed
+            '412':
+                description: Precondition failed, the workout was changed after it was read
         """
         if workout:
             if user:
@@ -283,14 +490,292 @@ class WorkoutPlanItem(Resource):
                 raise MethodNotAllowed
             if not query_result:
                 raise NotFound
+            check_if_match(query_result)
 
-            db.session.delete(query_result)
+            query_result.delete()
+            record_delete(db.session, query_result)
             db.session.commit()
             return Response(status=200)
         else:
             raise MethodNotAllowed
 
 
+class WorkoutPlanIdentical(Resource):
+    """
+    Workouts with the same move list as a workout
+    Found from the index of the content hashes of the move lists
+
+    Covers the following URIs:
+    /api/users/{user}/workouts/{workout}/identical/, GET
+    """
+
+    def get(self, user: str, workout: str) -> Response:
+        """
+        Get the workouts identical to the workout
+        ---
+        description: "Other workouts, of any user, that have the same moves with the same repetitions in the same order"
+        parameters:
+        - $ref: '#/components/parameters/user'
+        - $ref: '#/components/parameters/workout'
+        - $ref: '#/components/parameters/offset'
+        - $ref: '#/components/parameters/limit'
+        responses:
+            '200':
+                description: Workouts returned successfully
+            '400':
+                description: Bad request
+            '404':
+                description: Not found
+        """
+        plan = (
+            WorkoutPlan.query.join(User, WorkoutPlan.user_id == User.id)
+            .filter(User.username == user, WorkoutPlan.name == workout)
+            .first()
+        )
+        if not plan:
+            raise NotFound
+        offset, limit = get_page_args()
+        #  One row more than the page tells whether there is a next page
+        page = plan.identical().offset(offset).limit(limit + 1).all()
+
+        body = MasonBuilder(items=[])
+        body.add_namespace("workoutplanner", LINK_RELATIONS_URL)
+        body.add_control("self", href=request.path)
+        body.add_control("up", href=plan.get_url(), title="Up")
+        body.add_control_pages(offset, limit, len(page) > limit)
+
+        for other in page[:limit]:
+            item = MasonBuilder(name=other.name, user=other.user.username)
+            item.add_control("self", other.get_url())
+            body["items"].append(item)
+
+        return Response(json.dumps(body), 200, mimetype=MASON)
+
+class WorkoutSearch(Resource):
+    """
+    Workouts containing a set of moves
+    Answered with one grouped query over the (move_id, plan_id) index
+    instead of scanning the move lists
+
+    Covers the following URIs:
+    /api/workouts/search/, GET
+    """
+
+    def get(self) -> Response:
+        """
+        Find the workouts containing the given moves
+        ---
+        description: "Workouts containing all (or with match=any, some) of the included moves and none of the excluded ones, the workouts containing most of the included moves first"
+        parameters:
+        - $ref: '#/components/parameters/include'
+        - $ref: '#/components/parameters/exclude'
+        - $ref: '#/components/parameters/match'
+        - $ref: '#/components/parameters/offset'
+        - $ref: '#/components/parameters/limit'
+        responses:
+            '200':
+                description: Workouts returned successfully
+            '400':
+                description: Bad request
+            '404':
+                description: A move was not found
+        """
+        for key in request.args:
+            if key not in WORKOUT_SEARCH_ARGS:
+                raise BadRequest(description=f"Unknown query parameter {key}")
+        match = request.args.get("match", "all")
+        if match not in ("all", "any"):
+            raise BadRequest(description="match must be all or any")
+        include = [get_move(href).id for href in request.args.getlist("include")]
+        if not include:
+            raise BadRequest(description="At least one move has to be included")
+        exclude = [get_move(href).id for href in request.args.getlist("exclude")]
+        offset, limit = get_page_args()
+
+        page, total = WorkoutPlan.search_by_moves(include, exclude, match_all=match == "all", offset=offset, limit=limit)
+        plans = {plan.id: plan for plan in WorkoutPlan.query.filter(WorkoutPlan.id.in_([plan_id for plan_id, _ in page]))}
+
+        body = MasonBuilder(items=[], total=total)
+        body.add_namespace("workoutplanner", LINK_RELATIONS_URL)
+        body.add_control("self", href=request.full_path)
+        body.add_control("up", href=url_for("api.workoutplancollection"), title="Up")
+        body.add_control_pages(offset, limit, offset + limit < total)
+
+        for plan_id, overlap in page:
+            plan = plans[plan_id]
+            item = MasonBuilder(name=plan.name, user=plan.user.username, overlap=overlap)
+            item.add_control("self", plan.get_url())
+            body["items"].append(item)
+
+        return Response(json.dumps(body), 200, mimetype=MASON)
+
+def _parse_pointer(pointer: str) -> list:
+    """
+    Splits a JSON Pointer into its reference tokens
+    """
+    if not pointer.startswith("/"):
+        raise UnprocessableEntity(description=f"{pointer} is not a valid JSON Pointer")
+    return [token.replace("~1", "/").replace("~0", "~") for token in pointer[1:].split("/")]
+
+def _move_index(doc: dict, token: str, adding: bool=False) -> int:
+    """
+    Converts a reference token to an index of the move list. When adding,
+    the index may point right after the last move, which is also what - means.
+    Indexes with leading zeros are not valid JSON Pointer array indexes.
+    """
+    size = len(doc["moves"])
+    if adding and token == "-":
+        return size
+    if not token.isdigit() or (token != "0" and token.startswith("0")) or int(token) > size or (int(token) == size and not adding):
+        raise UnprocessableEntity(description=f"No move at position {token}")
+    return int(token)
+
+def _new_move_entry(value) -> dict:
+    """
+    Validates a move list entry given in a patch
+    """
+    schema = MoveListItem.json_schema()
+    schema["properties"].pop("position")
+    try:
+        validate(value, schema)
+    except ValidationError as e:
+        raise UnprocessableEntity(description=str(e))
+    if "subplan" in value:
+        entry = {"subplan": value["subplan"]}
+    else:
+        entry = {"move_name": value["move_name"], "move_creator": value["move_creator"]}
+    entry.update({
+        "repetitions": value.get("repetitions"),
+        "_id": None,
+        "_move_id": None,
+        "_subplan_id": None,
+    })
+    return entry
+
+def _public(entry: dict) -> dict:
+    return {key: entry[key] for key in PATCHABLE_MOVE_FIELDS if key in entry}
+
+def _get_value(doc: dict, path: list):
+    if path == ["name"]:
+        return doc["name"]
+    if path == ["moves"]:
+        return [_public(entry) for entry in doc["moves"]]
+    if len(path) >= 2 and path[0] == "moves":
+        entry = doc["moves"][_move_index(doc, path[1])]
+        if len(path) == 2:
+            return _public(entry)
+        if len(path) == 3 and path[2] in entry and path[2] in PATCHABLE_MOVE_FIELDS:
+            return entry[path[2]]
+    raise UnprocessableEntity(description="/" + "/".join(path) + " does not exist")
+
+def _apply_operation(doc: dict, operation: dict) -> None:
+    """
+    Applies a single JSON Patch operation to the in-memory workout document.
+    Moves keep the id of their list item, added and copied moves get a new one.
+    """
+    op = operation["op"]
+    path = _parse_pointer(operation["path"])
+    if op in ("add", "replace", "test") and "value" not in operation:
+        raise BadRequest(description=f"The {op} operation requires a value")
+    if op in ("move", "copy") and "from" not in operation:
+        raise BadRequest(description=f"The {op} operation requires from")
+
+    if op == "test":
+        if _get_value(doc, path) != operation["value"]:
+            raise Conflict(description="Test of " + operation["path"] + " failed")
+        return
+
+    if op in ("move", "copy"):
+        source = _parse_pointer(operation["from"])
+        if len(source) != 2 or source[0] != "moves" or len(path) != 2 or path[0] != "moves":
+            raise UnprocessableEntity(description="Only moves of the move list can be moved or copied")
+        index = _move_index(doc, source[1])
+        if op == "move":
+            entry = doc["moves"].pop(index)
+        else:
+            entry = dict(doc["moves"][index], _id=None)
+        doc["moves"].insert(_move_index(doc, path[1], adding=True), entry)
+        return
+
+    if path == ["name"]:
+        if op == "remove" or not isinstance(operation["value"], str):
+            raise UnprocessableEntity(description="The name of a workout must be a string")
+        try:
+            validate(operation["value"], WorkoutPlan.json_schema()["properties"]["name"])
+        except ValidationError as e:
+            raise UnprocessableEntity(description=str(e))
+        doc["name"] = operation["value"]
+    elif len(path) == 2 and path[0] == "moves":
+        if op == "add":
+            doc["moves"].insert(_move_index(doc, path[1], adding=True), _new_move_entry(operation["value"]))
+        elif op == "remove":
+            doc["moves"].pop(_move_index(doc, path[1]))
+        else:
+            index = _move_index(doc, path[1])
+            entry = _new_move_entry(operation["value"])
+            entry["_id"] = doc["moves"][index]["_id"]
+            doc["moves"][index] = entry
+    elif len(path) == 3 and path[0] == "moves" and path[2] in PATCHABLE_MOVE_FIELDS:
+        entry = doc["moves"][_move_index(doc, path[1])]
+        value = None if op == "remove" else operation["value"]
+        if path[2] == "repetitions":
+            if value is not None and (not isinstance(value, int) or isinstance(value, bool) or value < 0):
+                raise UnprocessableEntity(description="repetitions must be a positive integer")
+        elif not isinstance(value, str):
+            raise UnprocessableEntity(description=path[2] + " must be a string")
+        elif path[2] == "subplan":
+            #  The entry becomes a workout
+            entry.pop("move_name", None)
+            entry.pop("move_creator", None)
+            entry["_move_id"] = entry["_subplan_id"] = None
+        else:
+            #  The entry becomes a move, or another move
+            if "subplan" in entry:
+                del entry["subplan"]
+                entry["move_name"] = entry["move_creator"] = None
+            entry["_move_id"] = entry["_subplan_id"] = None
+        entry[path[2]] = value
+    else:
+        raise UnprocessableEntity(description=operation["path"] + " can not be patched")
+
+def _check_entry(entry: dict) -> None:
+    """
+    Checks that a patched entry references a move or a workout, replacing a
+    single field of a workout entry with a move field leaves the other one empty
+    """
+    if "subplan" not in entry and (entry["move_name"] is None or entry["move_creator"] is None):
+        raise UnprocessableEntity(description="A move needs both move_name and move_creator")
+
+def _resolve_entry(entry: dict, plan: WorkoutPlan) -> tuple:
+    """
+    Finds the move or the workout referenced by a patched entry
+    : return: tuple of (move id, sub-plan id), one of them is None
+    """
+    if "subplan" not in entry:
+        return _resolve_move(entry), None
+    if entry["_subplan_id"] is None:
+        subplan = get_workout_plan(entry["subplan"])
+        if plan.creates_cycle(subplan.id):
+            raise Conflict(description=entry["subplan"] + " is or contains the workout " + plan.name)
+        entry["_subplan_id"] = subplan.id
+    return None, entry["_subplan_id"]
+
+def _resolve_move(entry: dict) -> int:
+    """
+    Finds the id of the move referenced by a patched entry
+    """
+    if entry["_move_id"] is None:
+        move = (
+            Move.query.join(User)
+            .filter(Move.name == entry["move_name"], User.username == entry["move_creator"])
+            .first()
+        )
+        if move is None:
+            raise NotFound(description=f"No such move as {entry['move_name']} by {entry['move_creator']} found")
+        entry["_move_id"] = move.id
+    return entry["_move_id"]
+
+
 class WorkoutPlanCollectionBuilder(MasonBuilder):
 
     def add_control_add_workout(self, user):
@@ -302,6 +787,25 @@ class WorkoutPlanCollectionBuilder(MasonBuilder):
             schema=WorkoutPlan.json_schema()
         )
 
+    def add_control_clone_workout(self, user):
+        '''POST a copy of a workout for the user'''
+        self.add_control_post(
+            ctrl_name="workoutplanner:clone-workout",
+            title="Copy a workout",
+            href=user.get_url() + "workouts/",
+            schema=WorkoutPlan.clone_json_schema()
+        )
+
+
+    def add_control_search_workouts(self):
+        '''GET the workouts containing a set of moves'''
+        self.add_control(
+            "workoutplanner:search-workouts",
+            href=url_for("api.workoutsearch") + "?include={move}",
+            title="Find workouts containing moves",
+            isHrefTemplate=True
+        )
+
 
 class WorkoutPlanBuilder(MasonBuilder):
 
@@ -314,6 +818,33 @@ class WorkoutPlanBuilder(MasonBuilder):
             title="Get all movelist items in the workout"
         )
 
+    def add_control_get_stats(self, obj):
+        '''GET the statistics of the workout'''
+        self.add_control(
+            ctrl_name="workoutplanner:stats",
+            href=obj.get_url() + "stats/",
+            method="GET",
+            title="Get the statistics of this workout"
+        )
+
+    def add_control_get_identical(self, obj):
+        '''GET the workouts with the same moves'''
+        self.add_control(
+            ctrl_name="workoutplanner:identical",
+            href=obj.get_url() + "identical/",
+            method="GET",
+            title="Get the workouts with the same moves as this one"
+        )
+
+    def add_control_diff(self, obj):
+        '''GET the differences to another workout'''
+        self.add_control(
+            "workoutplanner:diff",
+            href=url_for("api.workoutplandiff") + "?" + urlencode({"from": obj.get_url()}) + "&to={workout}",
+            title="Compare this workout to another",
+            isHrefTemplate=True
+        )
+
     def add_control_delete_workout_plan(self, obj):
         '''DELETE this workout'''
         self.add_control_delete(
@@ -331,6 +862,16 @@ class WorkoutPlanBuilder(MasonBuilder):
             schema=MoveListItem.json_schema()
         )
 
+    def add_control_patch_workout_plan(self, obj):
+        '''PATCH a workout and its move list'''
+        self.add_control(
+            ctrl_name="workoutplanner:patch",
+            href=obj.get_url(),
+            method="PATCH",
+            encoding="json-patch",
+            schema=WorkoutPlan.patch_json_schema()
+        )
+
     def add_control_edit_workout_plan(self, obj):
         '''PUT a workout'''
         self.add_control_put(
@@ -0,0 +1,272 @@
+"""
+Recording and replaying of API traffic for performance regression testing.
+
+When TRAFFIC_RECORD_PATH is set, every API request is appended to that file
+as a line of JSON in a gzip stream: arrival time, method, path, the URL rule
+it matched, the JSON body, status and duration. Headers are never recorded
+and the body fields named in TRAFFIC_REDACT_FIELDS are replaced.
+
+`flask replay-traffic` plays a recording back against a fresh app with an
+empty (or seeded) temporary database, through the test client or against a
+running server, at the original rate, faster or as fast as possible. It
+reports latency percentiles per endpoint and compares them to an earlier
+report.
+"""
+
+import atexit
+import gzip
+import json
+import math
+import os
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+import click
+from flask import g, request
+from flask.cli import with_appcontext
+
+REDACTED = "***"
+PERCENTILES = (50, 90, 99)
+
+
+class TrafficRecorder(object):
+    """
+    Appends request records to a gzip compressed JSON lines file
+    """
+
+    def __init__(self, path, redact_fields=()):
+        self.path = path
+        self.redact_fields = set(redact_fields)
+        self._lock = threading.Lock()
+        self._start = None
+        self._file = None
+
+    def record(self, entry):
+        with self._lock:
+            if self._file is None:
+                self._file = gzip.open(self.path, "at")
+                atexit.register(self.close)
+            if self._start is None:
+                self._start = entry["t"]
+            entry["t"] = round(entry["t"] - self._start, 6)
+            self._file.write(json.dumps(entry, separators=(",", ":")) + "\n")
+            #  A sync flush keeps everything written so far readable if the app dies
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def sanitize(self, body):
+        if isinstance(body, dict):
+            return {
+                key: REDACTED if key in self.redact_fields else self.sanitize(value)
+                for key, value in body.items()
+            }
+        if isinstance(body, list):
+            return [self.sanitize(value) for value in body]
+        return body
+
+
+def read_trace(path):
+    """
+    Returns the records of a recording in arrival order
+    """
+    records = []
+    with gzip.open(path, "rt") as source:
+        try:
+            for line in source:
+                if line.endswith("\n"):
+                    records.append(json.loads(line))
+        except EOFError:
+            #  The recording app is still running or did not exit cleanly
+            pass
+    return sorted(records, key=lambda record: record["t"])
+
+
+def init_app(app):
+    """
+    Records the API traffic of the app if TRAFFIC_RECORD_PATH is set.
+    TRAFFIC_REDACT_FIELDS lists body fields that are not recorded.
+    """
+    path = app.config.get("TRAFFIC_RECORD_PATH")
+    if not path:
+        return
+
+    recorder = TrafficRecorder(path, app.config["TRAFFIC_REDACT_FIELDS"])
+    app.extensions["traffic"] = recorder
+
+    @app.before_request
+    def start_timer():
+        g.traffic_start = time.perf_counter()
+        g.traffic_arrival = time.time()
+
+    @app.after_request
+    def record_request(response):
+        if "traffic_start" not in g or not request.path.startswith("/api/"):
+            return response
+        body = request.get_json(silent=True) if request.content_length else None
+        recorder.record({
+            "t": g.traffic_arrival,
+            "method": request.method,
+            "path": request.full_path if request.query_string else request.path,
+            "rule": request.url_rule.rule if request.url_rule else None,
+            "content_type": request.mimetype if body is not None else None,
+            "body": recorder.sanitize(body),
+            "status": response.status_code,
+            "duration": round(time.perf_counter() - g.traffic_start, 6),
+        })
+        return response
+
+
+def percentile(values, p):
+    """
+    Nearest rank percentile of a list of numbers
+    """
+    values = sorted(values)
+    return values[max(math.ceil(len(values) * p / 100) - 1, 0)]
+
+
+def summarize(results):
+    """
+    Latency distribution of replayed requests per endpoint and in total.
+    : param list results: (endpoint, latency in seconds, status matched the recording) tuples
+    """
+    groups = {"total": []}
+    mismatches = {"total": 0}
+    for endpoint, latency, matched in results:
+        for key in ("total", endpoint):
+            groups.setdefault(key, []).append(latency)
+            mismatches[key] = mismatches.get(key, 0) + (not matched)
+    report = {}
+    for key, latencies in groups.items():
+        report[key] = {"count": len(latencies), "status_mismatches": mismatches[key], "max": max(latencies)}
+        for p in PERCENTILES:
+            report[key][f"p{p}"] = percentile(latencies, p)
+    return report
+
+
+def compare(report, baseline):
+    """
+    Relative change of every percentile between two reports, e.g. 0.1 is 10% slower
+    """
+    changes = {}
+    for key, stats in report.items():
+        if key not in baseline:
+            continue
+        changes[key] = {
+            name: (stats[name] - baseline[key][name]) / baseline[key][name] if baseline[key][name] else 0.0
+            for name in [f"p{p}" for p in PERCENTILES] + ["max"]
+        }
+    return changes
+
+
+def replay(records, send, speed=1.0, workers=8):
+    """
+    Sends the recorded requests, keeping their original spacing divided by
+    speed. A speed of 0 sends them as fast as the workers can.
+    : param function send: sends (method, path, body, content type), returns the status
+    : return: list of (endpoint, latency, status matched) tuples
+    """
+    start = time.perf_counter()
+
+    def play(record):
+        if speed:
+            delay = record["t"] / speed - (time.perf_counter() - start)
+            if delay > 0:
+                time.sleep(delay)
+        sent = time.perf_counter()
+        status = send(record["method"], record["path"], record.get("body"), record.get("content_type"))
+        endpoint = f"{record['method']} {record.get('rule') or record['path']}"
+        return endpoint, time.perf_counter() - sent, status == record["status"]
+
+    #  Requests are scheduled in arrival order, so a worker only waits for requests that are due
+    with ThreadPoolExecutor(workers) as pool:
+        return list(pool.map(play, records))
+
+
+def app_sender(app):
+    def send(method, path, body, content_type):
+        data = json.dumps(body) if body is not None else None
+        return app.test_client().open(path, method=method, data=data, content_type=content_type).status_code
+    return send
+
+
+def server_sender(base_url):
+    def send(method, path, body, content_type):
+        data = json.dumps(body).encode() if body is not None else None
+        req = urllib.request.Request(base_url + path, data=data, method=method)
+        if content_type:
+            req.add_header("Content-Type", content_type)
+        try:
+            with urllib.request.urlopen(req) as resp:
+                resp.read()
+                return resp.status
+        except urllib.error.HTTPError as err:
+            return err.code
+    return send
+
+
+def print_report(report, changes=None):
+    header = f"{'endpoint':<60} {'count':>6} " + " ".join(f"{'p' + str(p):>9}" for p in PERCENTILES) + f" {'max':>9}"
+    click.echo(header)
+    for key, stats in sorted(report.items()):
+        line = f"{key:<60} {stats['count']:>6} " + " ".join(
+            f"{stats[f'p{p}'] * 1000:>7.2f}ms" for p in PERCENTILES
+        ) + f" {stats['max'] * 1000:>7.2f}ms"
+        if changes and key in changes:
+            line += "  p99 " + f"{changes[key]['p99']:+.0%}"
+        if stats["status_mismatches"]:
+            line += f"  ({stats['status_mismatches']} status mismatches)"
+        click.echo(line)
+
+
+@click.command("replay-traffic")
+@click.argument("trace", type=click.Path(exists=True, dir_okay=False))
+@click.option("--server", default=None, help="Base URL of a running server, the test client of a fresh app is used by default")
+@click.option("--speed", default=1.0, help="Replay rate relative to the recording, 0 replays as fast as possible")
+@click.option("--workers", default=8, help="Maximum amount of concurrent requests")
+@click.option("--seed", is_flag=True, help="Add the gen-testdata examples to the fresh database first")
+@click.option("--report", "report_path", type=click.Path(dir_okay=False), help="Write the latency report to this JSON file")
+@click.option("--baseline", type=click.Path(exists=True, dir_okay=False), help="Earlier report to compare with")
+@with_appcontext
+def replay_traffic_command(trace, server, speed, workers, seed, report_path, baseline):
+    records = read_trace(trace)
+    if server:
+        results = replay(records, server_sender(server.rstrip("/")), speed, workers)
+    else:
+        from workoutplanner import create_app, db
+        from workoutplanner.models import populate_db
+        db_fd, db_fname = tempfile.mkstemp(suffix=".db")
+        try:
+            app = create_app({
+                "SQLALCHEMY_DATABASE_URI": "sqlite:///" + db_fname,
+                "RATELIMIT_ENABLED": False,
+                "LOADSHED_ENABLED": False,
+                "TRAFFIC_RECORD_PATH": None,
+            })
+            with app.app_context():
+                db.create_all()
+                if seed:
+                    populate_db()
+                results = replay(records, app_sender(app), speed, workers)
+                db.session.remove()
+                db.engine.dispose()
+        finally:
+            os.close(db_fd)
+            os.unlink(db_fname)
+
+    report = summarize(results)
+    changes = None
+    if baseline:
+        with open(baseline) as source:
+            changes = compare(report, json.load(source))
+    print_report(report, changes)
+    if report_path:
+        with open(report_path, "w") as target:
+            json.dump(report, target, indent=2)
@@ -1,5 +1,182 @@
+import json
+import sys
+from urllib.parse import urlencode, urlparse, unquote
+from flask import current_app, request, Response
+from werkzeug.exceptions import BadRequest, NotFound, HTTPException, PreconditionFailed
+from werkzeug.http import generate_etag
 from workoutplanner import create_app, db
 from workoutplanner.models import User, WorkoutPlan, MoveListItem, Move
+from workoutplanner.links import MASON, ERROR_PROFILE
+
+
+def create_error_response(status_code, title, message=None):
+    """
+    Creates a Mason error response for the current request
+    : param int status_code: HTTP status code of the response
+    : param str title: short title for the error
+    : param str message: longer human-readable description
+    """
+
+    body = MasonBuilder(resource_url=request.path)
+    body.add_error(title, message)
+    body.add_control("profile", href=ERROR_PROFILE)
+    return Response(json.dumps(body), status_code, mimetype=MASON)
+
+
+def get_etag(obj):
+    """
+    Returns the entity tag of a versioned database object. The id is part of
+    the tag because position URIs of move list items can point to other rows
+    after the list changes. Responses extend it with a hash of the body, see
+    with_body_hash, and If-Match only compares this prefix.
+    """
+
+    return f"{obj.id}.{obj.version}"
+
+def with_body_hash(response):
+    """
+    Extends the version ETag of an item response with a hash of the body. Item
+    bodies contain data that does not bump the version, like the counters kept
+    by triggers and the URIs built from the owner's username, so GET requests
+    are revalidated against the whole tag while If-Match only needs the version.
+    """
+
+    etag, weak = response.get_etag()
+    response.set_etag(f"{etag}.{generate_etag(response.get_data())}", weak)
+
+def check_if_match(obj):
+    """
+    Compares the If-Match header of the request to the current version of the
+    object. Requests without the header are let through, the conditional
+    UPDATE at flush still protects them from concurrent writes.
+    : raise PreconditionFailed: if the client's copy of the object is stale
+    """
+
+    if not request.if_match or request.if_match.star_tag:
+        return
+    etag = get_etag(obj)
+    if not any(tag == etag or tag.startswith(etag + ".") for tag in request.if_match.as_set()):
+        raise PreconditionFailed(description="The resource was changed after it was read")
+
+def get_page_args():
+    """
+    Reads the pagination parameters offset and limit from the query string.
+    The limit defaults to the PAGE_SIZE config value and is capped to MAX_PAGE_SIZE.
+    : return: tuple of (offset, limit)
+    """
+
+    try:
+        offset = int(request.args.get("offset", 0))
+        limit = int(request.args.get("limit", current_app.config["PAGE_SIZE"]))
+    except ValueError:
+        raise BadRequest(description="offset and limit must be integers")
+    if offset < 0 or limit < 1:
+        raise BadRequest(description="offset must be positive and limit larger than zero")
+    return offset, min(limit, current_app.config["MAX_PAGE_SIZE"])
+
+def resolve_href(href):
+    """
+    Finds the resource an href of the API points to.
+    : param str href: an absolute or a relative URI
+    : return: tuple of (endpoint, view arguments)
+    : raise NotFound: if the href does not match a route of the API
+    """
+
+    path = unquote(urlparse(href).path)
+    try:
+        return current_app.url_map.bind("localhost").match(path, method="GET")
+    except HTTPException:
+        raise NotFound(description=f"{href} is not a resource of the API")
+
+def get_workout_plan(href):
+    """
+    Finds the workout plan an href points to
+    : param str href: URI of a workout plan
+    : return: WorkoutPlan
+    : raise NotFound: if the href is not a workout plan or the plan does not exist
+    """
+
+    endpoint, values = resolve_href(href)
+    if endpoint != "api.workoutplanitem":
+        raise NotFound(description=f"{href} is not a workout plan")
+    query = WorkoutPlan.query.filter_by(name=values["workout"])
+    if "user" in values:
+        query = query.join(User).filter(User.username == values["user"])
+    plan = query.first()
+    if plan is None:
+        raise NotFound(description=f"No such workout as {href} found")
+    return plan
+
+def get_move(href):
+    """
+    Finds the move an href points to
+    : param str href: URI of a move of a user
+    : return: Move
+    : raise NotFound: if the href is not a move or the move does not exist
+    """
+
+    endpoint, values = resolve_href(href)
+    if endpoint != "api.moveitem" or "user" not in values:
+        raise NotFound(description=f"{href} is not a move")
+    move = Move.query.join(User).filter(User.username == values["user"], Move.name == values["move"]).first()
+    if move is None:
+        raise NotFound(description=f"No such move as {href} found")
+    return move
+
+def prefix_filter(column):
+    """
+    Returns a filter matching the rows where the column starts with the given value.
+    The filter is a range comparison instead of LIKE so that SQLite can use the
+    index of the column. The comparison is case sensitive.
+    """
+
+    def apply_filter(query, prefix):
+        if not prefix:
+            return query
+        #  The last character is incremented, the largest code point has no next
+        #  character so it is dropped and the one before it is incremented instead
+        stem = prefix.rstrip(chr(sys.maxunicode))
+        if not stem:
+            return query.filter(column >= prefix)
+        upper = stem[:-1] + chr(ord(stem[-1]) + 1)
+        return query.filter(column >= prefix, column < upper)
+    return apply_filter
+
+def get_collection_page(query, sort_fields, filters, default_sort, id_column):
+    """
+    Applies the filter, sort and pagination query parameters of the current
+    request to a collection query. Only the parameters in the allow-lists are
+    accepted, others result in 400. The sort parameter is a key of sort_fields,
+    prefixed with a minus for descending order. The id column is always used
+    as the last sort key so the pages are stable.
+    : param query: the query of the whole collection
+    : param dict sort_fields: allowed sort keys mapped to columns
+    : param dict filters: allowed filter parameters mapped to functions taking the query and the value
+    : param str default_sort: sort key used when the sort parameter is missing
+    : param id_column: primary key column of the collection
+    : return: tuple of (items, offset, limit, has_next)
+    """
+
+    for key in request.args:
+        if key not in filters and key not in ("sort", "offset", "limit"):
+            raise BadRequest(description=f"Unknown query parameter {key}")
+
+    for key, apply_filter in filters.items():
+        if key in request.args:
+            query = apply_filter(query, request.args[key])
+
+    sort = request.args.get("sort", default_sort)
+    column = sort_fields.get(sort.lstrip("-"))
+    if column is None:
+        raise BadRequest(description=f"Cannot sort by {sort}, allowed are {', '.join(sort_fields)}")
+    if sort.startswith("-"):
+        query = query.order_by(column.desc(), id_column.desc())
+    else:
+        query = query.order_by(column, id_column)
+
+    offset, limit = get_page_args()
+    items = query.offset(offset).limit(limit + 1).all()
+    return items[:limit], offset, limit, len(items) > limit
 
 
 #MASONBUILDER
@@ -109,6 +286,24 @@ class MasonBuilder(dict):
             schema=schema
         )
         
+    def add_control_pages(self, offset, limit, has_next):
+        """
+        Adds the prev and next controls of a paginated collection. The hrefs
+        keep all the other query parameters of the current request.
+        : param int offset: offset of the current page
+        : param int limit: size of the current page
+        : param bool has_next: whether there are items after the current page
+        """
+
+        args = request.args.to_dict(flat=False)
+        args["limit"] = limit
+        if offset > 0:
+            args["offset"] = max(offset - limit, 0)
+            self.add_control("prev", request.path + "?" + urlencode(args, doseq=True), title="Previous page")
+        if has_next:
+            args["offset"] = offset + limit
+            self.add_control("next", request.path + "?" + urlencode(args, doseq=True), title="Next page")
+
     def add_control_delete(self, ctrl_name, title, href):
         """
         Utility method for adding PUT type controls. The control is
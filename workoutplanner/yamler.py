@@ -1,43 +1,105 @@
-import requests
 import yaml
 import os.path
 import json
+import tempfile
+import click
+from concurrent.futures import ThreadPoolExecutor
+from flask.cli import with_appcontext
 
-SERVER_ADDR = "http://localhost:5000/api"
-DOC_ROOT = "./doc/"
-DOC_TEMPLATE = {
-    "responses": {
-        "200": {
-            "content": {
-                "application/vnd.mason+json": {
-                    "example": {}
+DOC_ROOT = os.path.join(os.path.dirname(__file__), "doc")
+
+#  Documented example responses: API path and the file under DOC_ROOT
+DOC_FILES = [
+    ("/api/users/", "users/get_collection.yml"),
+    ("/api/users/Noob/", "users/get_item.yml"),
+    ("/api/users/Noob/moves/", "moves/get_collection.yml"),
+    ("/api/users/Noob/moves/Plank/", "moves/get_item.yml"),
+    ("/api/users/Noob/workouts/", "workouts/get_collection.yml"),
+    ("/api/users/Noob/workouts/Max Suffering/", "workouts/get_item.yml"),
+    ("/api/users/Noob/workouts/Max Suffering/moves/", "movelistitems/get_collection.yml"),
+    ("/api/users/Noob/workouts/Max Suffering/moves/0/", "movelistitems/get_item.yml"),
+]
+
+
+def make_doc(example):
+    """
+    Returns the OpenAPI response document with the given example body
+    """
+    return {
+        "responses": {
+            "200": {
+                "content": {
+                    "application/vnd.mason+json": {
+                        "example": example
+                    }
                 }
             }
         }
     }
-}
-
 
 
-def make_file(url, filepath):
-    resp_json = requests.get(SERVER_ADDR + url).json()
-    DOC_TEMPLATE["responses"]["200"]["content"]["application/vnd.mason+json"]["example"] = resp_json
-    path = os.path.join(DOC_ROOT, filepath)
+def make_file(client, url, filepath, doc_root=DOC_ROOT):
+    """
+    Renders the example of one endpoint with the test client and writes it
+    if it differs from the file on disk.
+    : return: True if the file was written
+    """
+    resp = client.get(url)
+    if resp.status_code != 200:
+        raise click.ClickException(f"GET {url} returned {resp.status_code}")
+    content = yaml.dump(make_doc(json.loads(resp.data)), default_flow_style=False)
+    path = os.path.join(doc_root, filepath)
+    try:
+        with open(path) as source:
+            if source.read() == content:
+                return False
+    except FileNotFoundError:
+        pass
     os.makedirs(os.path.dirname(path), exist_ok=True)
     with open(path, "w") as target:
-        target.write(yaml.dump(DOC_TEMPLATE, default_flow_style=False))
+        target.write(content)
+    return True
+
+
+def generate_docs(doc_root=DOC_ROOT):
+    """
+    Generates the documented examples from an app with a temporary database
+    holding the example data. No server is needed.
+    : return: list of the files that were rewritten
+    """
+    from workoutplanner import create_app, db
+    from workoutplanner.models import populate_db
+
+    db_fd, db_fname = tempfile.mkstemp(suffix=".db")
+    try:
+        app = create_app({
+            "SQLALCHEMY_DATABASE_URI": "sqlite:///" + db_fname,
+            "TESTING": True,
+            "RATELIMIT_ENABLED": False,
+            "LOADSHED_ENABLED": False,
+        })
+        with app.app_context():
+            db.create_all()
+            populate_db()
+            client = app.test_client()
+            with ThreadPoolExecutor() as pool:
+                written = pool.map(lambda doc: make_file(client, doc[0], doc[1], doc_root), DOC_FILES)
+                changed = [path for (_, path), was_written in zip(DOC_FILES, list(written)) if was_written]
+            db.session.remove()
+            db.engine.dispose()
+    finally:
+        os.close(db_fd)
+        os.unlink(db_fname)
+    return changed
 
 
+@click.command("gen-docs")
+@with_appcontext
+def generate_docs_command():
+    for path in generate_docs():
+        click.echo(f"Updated {path}")
 
-def main():
-    make_file("/users/", "users/get_collection.yml")
-    make_file("/users/Noob/", "users/get_item.yml")
-    make_file("/users/Noob/moves/", "moves/get_collection.yml")
-    make_file("/users/Noob/moves/Plank/", "moves/get_item.yml")
-    make_file("/users/Noob/workouts/", "workouts/get_collection.yml")
-    make_file("/users/Noob/workouts/Max Suffering/", "workouts/get_item.yml")
-    make_file("/users/Noob/workouts/Max Suffering/moves/", "movelistitems/get_collection.yml")
-    make_file("/users/Noob/workouts/Max Suffering/moves/0", "movelistitems/get_item.yml")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    for path in generate_docs():
+        print(f"Updated {path}")
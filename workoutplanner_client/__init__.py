@@ -0,0 +1,18 @@
+"""
+Asyncio client library for the workout planner API
+
+    import asyncio
+    from workoutplanner_client import AsyncClient
+
+    async def seed():
+        async with AsyncClient("http://localhost:5000", concurrency=32) as api:
+            user = await api.create_user("seeder")
+            await asyncio.gather(*(api.create_workout(user.username, f"plan{i}") for i in range(10000)))
+
+    asyncio.run(seed())
+
+Needs aiohttp, install with `pip install workoutplanner[sdk]`.
+"""
+
+from workoutplanner_client.client import AsyncClient, ApiError
+from workoutplanner_client.models import User, Move, Workout, MoveListItem
@@ -0,0 +1,288 @@
+"""
+Asynchronous hypermedia client. Resources are found by following the Mason
+@controls of the API entry point and the Location headers of created
+resources, the only URL the client knows is the entry point.
+"""
+
+import asyncio
+import random
+from collections import OrderedDict
+from typing import Optional
+from urllib.parse import urljoin
+
+import aiohttp
+
+from workoutplanner_client.models import User, Move, Workout, MoveListItem
+
+MASON = "application/vnd.mason+json"
+ENTRY_POINT = "/api/"
+RETRY_STATUSES = (429, 503)
+IDEMPOTENT_METHODS = ("GET", "HEAD", "PUT", "DELETE", "OPTIONS")
+
+
+class ApiError(Exception):
+    """
+    An error response of the API, carries the message of its @error document
+    """
+
+    def __init__(self, status: int, title: str, message: Optional[str]=None):
+        super().__init__(f"{status} {title}" + (f": {message}" if message else ""))
+        self.status = status
+        self.title = title
+        self.message = message
+
+
+class AsyncClient(object):
+    """
+    Client for the workout planner API. One instance shares a pool of
+    keep-alive connections between all its requests, at most *concurrency*
+    requests are sent at the same time and the rest wait for their turn.
+
+    Responses with 429 or 503 are retried up to *retries* times. The wait is
+    the Retry-After of the response if it has one, otherwise an exponential
+    backoff starting from *backoff* seconds, both with some jitter so that
+    waiting requests do not all come back at once. Connection errors are
+    retried only for idempotent methods.
+    """
+
+    def __init__(self, base_url: str="http://localhost:5000", concurrency: int=16,
+                 retries: int=5, backoff: float=0.5, timeout: float=30, control_cache_size: int=1024):
+        self.base_url = base_url
+        self.concurrency = concurrency
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self._session = None
+        self._semaphore = None
+        #  Controls of the documents fetched so far, so following the same
+        #  control many times costs a single GET
+        self._controls = OrderedDict()
+        self._pending = {}
+        self._control_cache_size = control_cache_size
+        #  Lookups of user items by username, shared like the control lookups
+        self._user_hrefs = {}
+
+    async def __aenter__(self) -> "AsyncClient":
+        await self.open()
+        return self
+
+    async def __aexit__(self, *args) -> None:
+        await self.close()
+
+    async def open(self) -> None:
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        self._session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.concurrency),
+            timeout=aiohttp.ClientTimeout(total=self.timeout),
+            headers={"Accept": MASON},
+        )
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def request(self, method: str, href: str, json: Optional[dict]=None,
+                      params: Optional[dict]=None, headers: Optional[dict]=None) -> tuple[int, dict, Optional[dict]]:
+        """
+        Send a request, retrying throttled and overloaded responses.
+        Returns the status, headers and JSON body of the response, raises
+        ApiError if the response is an error.
+        """
+        url = urljoin(self.base_url, href)
+        for attempt in range(self.retries + 1):
+            try:
+                async with self._semaphore:
+                    async with self._session.request(method, url, json=json, params=params, headers=headers) as resp:
+                        status = resp.status
+                        resp_headers = dict(resp.headers)
+                        try:
+                            body = await resp.json(content_type=None)
+                        except ValueError:
+                            body = None
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                if method not in IDEMPOTENT_METHODS or attempt == self.retries:
+                    raise
+                await asyncio.sleep(self._delay(attempt, None))
+                continue
+
+            if status in RETRY_STATUSES and attempt < self.retries:
+                await asyncio.sleep(self._delay(attempt, resp_headers.get("Retry-After")))
+                continue
+            if status >= 400:
+                body = body if isinstance(body, dict) else {}
+                error = body.get("@error", {})
+                messages = error.get("@messages") or [body.get("message")]
+                raise ApiError(status, error.get("@message", "Error"), messages[0])
+            return status, resp_headers, body
+
+    def _delay(self, attempt: int, retry_after: Optional[str]) -> float:
+        try:
+            delay = float(retry_after)
+        except (TypeError, ValueError):
+            delay = self.backoff * 2 ** attempt
+        return delay * random.uniform(1, 1.5)
+
+    async def get(self, href: str, params: Optional[dict]=None) -> dict:
+        """
+        GET a document
+        """
+        _, _, body = await self.request("GET", href, params=params)
+        self._remember_controls(href, body)
+        return body
+
+    async def follow(self, href: str, rel: str, json: Optional[dict]=None) -> Optional[str]:
+        """
+        Follow the control *rel* of the document at *href* with its method.
+        GETs return the href of the control, writes the Location of the
+        response if it has one, otherwise the href of the control.
+        """
+        control = await self.control(href, rel)
+        method = control.get("method", "GET")
+        if method == "GET":
+            return control["href"]
+        _, headers, _ = await self.request(method, control["href"], json=json)
+        if method == "DELETE":
+            self._controls.pop(control["href"], None)
+        return headers.get("Location", control["href"])
+
+    async def control(self, href: str, rel: str) -> dict:
+        """
+        The control *rel* of the document at *href*
+        """
+        controls = self._controls.get(href)
+        if controls is None:
+            #  Concurrent lookups of the same document share one GET
+            if href not in self._pending:
+                self._pending[href] = asyncio.ensure_future(self.get(href))
+            try:
+                body = await asyncio.shield(self._pending[href])
+            finally:
+                self._pending.pop(href, None)
+            controls = body.get("@controls", {})
+        else:
+            self._controls.move_to_end(href)
+        try:
+            return controls[rel]
+        except KeyError:
+            raise ApiError(404, "Not found", f"{href} has no control {rel}")
+
+    async def items(self, href: str, params: Optional[dict]=None) -> list[dict]:
+        """
+        All items of a collection, following its next links
+        """
+        items = []
+        while href:
+            body = await self.get(href, params)
+            items.extend(body.get("items", []))
+            href = body.get("@controls", {}).get("next", {}).get("href")
+            params = None
+        return items
+
+    def _remember_controls(self, href: str, body: Optional[dict]) -> None:
+        if not isinstance(body, dict) or "@controls" not in body:
+            return
+        self._controls[href] = body["@controls"]
+        self._controls.move_to_end(href)
+        if len(self._controls) > self._control_cache_size:
+            self._controls.popitem(last=False)
+
+    async def _user_href(self, username: str) -> str:
+        if username not in self._user_hrefs:
+            self._user_hrefs[username] = asyncio.ensure_future(self._find_user(username))
+        try:
+            return await asyncio.shield(self._user_hrefs[username])
+        except Exception:
+            self._user_hrefs.pop(username, None)
+            raise
+
+    async def _find_user(self, username: str) -> str:
+        #  The self control of the user in the users collection filtered by the username
+        users = await self.follow(ENTRY_POINT, "workoutplanner:users-all")
+        for item in await self.items(users, {"name_prefix": username}):
+            if item["username"] == username:
+                return item["@controls"]["self"]["href"]
+        raise ApiError(404, "Not found", f"No such user as {username} found")
+
+    #  Users
+
+    async def create_user(self, username: str) -> User:
+        users = await self.follow(ENTRY_POINT, "workoutplanner:users-all")
+        href = await self.follow(users, "workoutplanner:add-user", {"username": username})
+        self._user_hrefs.pop(username, None)
+        return User(username, href)
+
+    async def get_user(self, username: str) -> User:
+        return User.from_body(await self.get(await self._user_href(username)))
+
+    async def delete_user(self, username: str) -> None:
+        await self.follow(await self._user_href(username), "workoutplanner:delete")
+        self._user_hrefs.pop(username, None)
+
+    #  Moves
+
+    async def create_move(self, username: str, name: str, description: str="") -> Move:
+        href = await self.follow(await self._user_href(username), "workoutplanner:add-move",
+                                 {"name": name, "description": description})
+        return Move(name, description, username, href)
+
+    async def get_move(self, href: str) -> Move:
+        return Move.from_body(await self.get(href))
+
+    async def list_moves(self, username: str) -> list[Move]:
+        href = await self.follow(await self._user_href(username), "workoutplanner:moves-by")
+        return [Move(item["name"], None, username, item["@controls"]["self"]["href"]) for item in await self.items(href)]
+
+    #  Workouts
+
+    async def create_workout(self, username: str, name: str) -> Workout:
+        href = await self.follow(await self._user_href(username), "workoutplanner:add-workout", {"name": name})
+        return Workout(name, username, href)
+
+    async def get_workout(self, href: str) -> Workout:
+        return Workout.from_body(await self.get(href))
+
+    async def list_workouts(self, username: str) -> list[Workout]:
+        href = await self.follow(await self._user_href(username), "workoutplanner:workouts-by")
+        return [Workout(item["name"], username, item["@controls"]["self"]["href"]) for item in await self.items(href)]
+
+    async def delete_workout(self, href: str) -> None:
+        await self.follow(href, "workoutplanner:delete")
+
+    #  Move list items
+
+    async def add_move(self, workout: Workout, move: Move, repetitions: Optional[int]=None,
+                       position: Optional[int]=None) -> str:
+        """
+        Add a move to the move list of a workout, returns the href of the new move list item
+        """
+        doc = {"move_name": move.name, "move_creator": move.creator}
+        if repetitions is not None:
+            doc["repetitions"] = repetitions
+        if position is not None:
+            doc["position"] = position
+        return await self.follow(workout.href, "workoutplanner:add-movelistitem", doc)
+
+    async def add_workout(self, workout: Workout, subplan: Workout, repetitions: Optional[int]=None,
+                          position: Optional[int]=None) -> str:
+        """
+        Add another workout to the move list of a workout, returns the href of the new move list item
+        """
+        doc = {"subplan": subplan.href}
+        if repetitions is not None:
+            doc["repetitions"] = repetitions
+        if position is not None:
+            doc["position"] = position
+        return await self.follow(workout.href, "workoutplanner:add-movelistitem", doc)
+
+    async def list_move_list(self, workout: Workout) -> list[MoveListItem]:
+        href = await self.follow(workout.href, "workoutplanner:movelistitems-by")
+        return [
+            MoveListItem.from_body(item) for item in await self.items(href)
+        ]
+
+    async def get_move_list_item(self, href: str) -> MoveListItem:
+        return MoveListItem.from_body(await self.get(href))
+
+    async def delete_move_list_item(self, href: str) -> None:
+        await self.follow(href, "workoutplanner:delete")
@@ -0,0 +1,57 @@
+"""
+Typed representations of the API resources
+"""
+
+from dataclasses import dataclass
+from typing import Optional
+
+
+@dataclass
+class User(object):
+    username: str
+    href: str
+
+    @classmethod
+    def from_body(cls, body: dict) -> "User":
+        return cls(body["username"], body["@controls"]["self"]["href"])
+
+
+@dataclass
+class Move(object):
+    name: str
+    description: Optional[str]
+    creator: str
+    href: str
+
+    @classmethod
+    def from_body(cls, body: dict) -> "Move":
+        return cls(body["name"], body.get("description"), body["user"], body["@controls"]["self"]["href"])
+
+
+@dataclass
+class Workout(object):
+    name: str
+    creator: str
+    href: str
+
+    @classmethod
+    def from_body(cls, body: dict) -> "Workout":
+        return cls(body["name"], body["user"], body["@controls"]["self"]["href"])
+
+
+@dataclass
+class MoveListItem(object):
+    """
+    An entry of a move list, either a move or another workout done as a part of
+    the workout. The name of the other one is None.
+    """
+    position: int
+    move_name: Optional[str]
+    repetitions: Optional[int]
+    href: str
+    workout: Optional[str] = None
+
+    @classmethod
+    def from_body(cls, body: dict) -> "MoveListItem":
+        return cls(body["position"], body.get("move"), body.get("repetitions"), body["@controls"]["self"]["href"],
+                   body.get("workout"))